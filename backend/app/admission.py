@@ -0,0 +1,245 @@
+import asyncio
+import heapq
+import itertools
+import os
+import resource
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import logging
+
+from metrics import admission_total
+
+logger = logging.getLogger(__name__)
+
+# Detection pipelines running at once in this process
+ADMISSION_MAX_PIPELINES = int(os.getenv("ADMISSION_MAX_PIPELINES", "8"))
+# Analysed frames per second across all pipelines (what the CPU/GPU sustains)
+ADMISSION_FPS_BUDGET = float(os.getenv("ADMISSION_FPS_BUDGET", "40"))
+# Resident memory above which no new pipeline starts; 0 disables the check
+ADMISSION_MEMORY_MB = float(os.getenv("ADMISSION_MEMORY_MB", "0"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# A new session needs at least this rate (or its profile's, if lower) to be admitted
+ADMISSION_MIN_FPS = float(os.getenv("ADMISSION_MIN_FPS", "2"))
+# Rate the lowest-priority pipelines are shed to under pressure: an occasional snapshot
+SNAPSHOT_FPS = 0.2
+RETRY_AFTER_SECONDS = 15
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident memory of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class CapacityError(Exception):
+    """No room for a new detection session; `retry_after` is a hint in seconds"""
+
+    def __init__(self, reason: str, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One admitted pipeline: the rate its profile asks for and the rate it is granted"""
+
+    def __init__(self, camera_id: str, priority: int, demand_fps: float, seq: int):
+        self.camera_id = camera_id
+        self.priority = priority
+        self.demand_fps = demand_fps
+        self.granted_fps = demand_fps
+        self.seq = seq
+        self.admitted_at: Optional[float] = None
+
+    @property
+    def mode(self) -> str:
+        if self.granted_fps >= self.demand_fps - 1e-6:
+            return "full"
+        if self.granted_fps <= SNAPSHOT_FPS + 1e-6:
+            return "snapshot"
+        return "degraded"
+
+    @property
+    def frame_interval(self) -> float:
+        """Minimum seconds between analysed frames at the granted rate"""
+        return 1.0 / self.granted_fps if self.granted_fps > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "camera_id": self.camera_id,
+            "priority": self.priority,
+            "demand_fps": self.demand_fps,
+            "granted_fps": round(self.granted_fps, 3),
+            "mode": self.mode,
+            "admitted_at": self.admitted_at,
+        }
+
+
+class AdmissionController:
+    """Capacity model for local detection sessions.
+
+    A session is admitted while there is a free pipeline slot, memory is under
+    the ceiling, and the fps budget can give it at least ADMISSION_MIN_FPS once
+    lower-priority pipelines are shed. Otherwise it waits in a priority queue
+    (bounded in size and time) or is rejected with a retry hint. The budget is
+    shared by priority: every pipeline keeps SNAPSHOT_FPS, then higher
+    priorities get their full rate before lower ones get anything more, and
+    pipelines of one priority split what is left evenly. So the lowest-priority
+    cameras are the first to drop to a lower rate and then to snapshots.
+    """
+
+    def __init__(self, max_pipelines: int = ADMISSION_MAX_PIPELINES, fps_budget: float = ADMISSION_FPS_BUDGET,
+                 memory_mb: float = ADMISSION_MEMORY_MB, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, min_fps: float = ADMISSION_MIN_FPS):
+        self.max_pipelines = max_pipelines
+        self.fps_budget = fps_budget
+        self.memory_mb = memory_mb
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.min_fps = min_fps
+        self.tickets: List[Ticket] = []
+        self._queue: List = []  # heap of (-priority, seq, ticket, future)
+        self._seq = itertools.count()
+        self.counts = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    def _allocate(self, tickets: List[Ticket]) -> Dict[Ticket, float]:
+        granted = {ticket: min(SNAPSHOT_FPS, ticket.demand_fps) for ticket in tickets}
+        remaining = self.fps_budget - sum(granted.values())
+        for priority in sorted({ticket.priority for ticket in tickets}, reverse=True):
+            # Within one priority the rest is split evenly, capped at what each asks for
+            tier = sorted((t for t in tickets if t.priority == priority), key=lambda t: t.demand_fps - granted[t])
+            for index, ticket in enumerate(tier):
+                share = max(remaining, 0.0) / (len(tier) - index)
+                extra = min(share, ticket.demand_fps - granted[ticket])
+                granted[ticket] += extra
+                remaining -= extra
+        return granted
+
+    def _refusal(self, ticket: Ticket) -> Optional[str]:
+        """Why `ticket` can't start now, or None if it can"""
+        if len(self.tickets) >= self.max_pipelines:
+            return "pipelines"
+        if self.memory_mb and rss_bytes() > self.memory_mb * 1024 * 1024:
+            return "memory"
+        granted = self._allocate(self.tickets + [ticket])[ticket]
+        if granted < min(self.min_fps, ticket.demand_fps) - 1e-6:
+            return "inference_budget"
+        return None
+
+    def _start(self, ticket: Ticket):
+        ticket.admitted_at = time.time()
+        self.tickets.append(ticket)
+        self.counts["admitted"] += 1
+        admission_total.labels("admitted").inc()
+        self._rebalance()
+
+    def _rebalance(self):
+        for ticket, fps in self._allocate(self.tickets).items():
+            if abs(fps - ticket.granted_fps) > 1e-6:
+                previous = ticket.mode
+                ticket.granted_fps = fps
+                if ticket.mode != previous:
+                    logger.info(f"Pipeline {ticket.camera_id}: {previous} -> {ticket.mode} ({fps:.2f} fps)")
+
+    async def admit(self, camera_id: str, priority: int = 0, demand_fps: float = 10.0,
+                    on_queued: Optional[Callable[[int], Awaitable[Any]]] = None) -> Ticket:
+        """Ticket for a new pipeline, waiting in the queue if needed; raises CapacityError"""
+        ticket = Ticket(camera_id, priority, demand_fps, next(self._seq))
+        # Nobody overtakes a queued session of the same or higher priority
+        queued_ahead = any(-entry[0] >= priority for entry in self._queue)
+        reason = "queue" if queued_ahead else self._refusal(ticket)
+        if reason is None:
+            self._start(ticket)
+            return ticket
+
+        if len(self._queue) >= self.queue_size:
+            self.counts["rejected"] += 1
+            admission_total.labels("rejected").inc()
+            raise CapacityError(reason)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (-priority, ticket.seq, ticket, future)
+        heapq.heappush(self._queue, entry)
+        self.counts["queued"] += 1
+        admission_total.labels("queued").inc()
+        try:
+            if on_queued is not None:
+                await on_queued(sorted(self._queue).index(entry) + 1)
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+            return ticket
+        except asyncio.TimeoutError:
+            if future.done():
+                return ticket
+            self.counts["timed_out"] += 1
+            admission_total.labels("timed_out").inc()
+            raise CapacityError(reason)
+        except BaseException:
+            # The caller went away (disconnect); a ticket granted meanwhile goes straight back
+            if future.done():
+                self.release(ticket)
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+
+    def release(self, ticket: Ticket):
+        """Give the pipeline's capacity back and admit queued sessions that now fit"""
+        if ticket in self.tickets:
+            self.tickets.remove(ticket)
+        self._rebalance()
+        self._drain()
+
+    def _drain(self):
+        while self._queue:
+            _, _, ticket, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self._refusal(ticket) is not None:
+                break
+            heapq.heappop(self._queue)
+            self._start(ticket)
+            future.set_result(ticket)
+
+    def update_demand(self, ticket: Ticket, demand_fps: float):
+        """The pipeline's profile changed its target fps"""
+        if demand_fps != ticket.demand_fps:
+            ticket.demand_fps = demand_fps
+            self._rebalance()
+            self._drain()
+
+    def get_stats(self) -> Dict[str, Any]:
+        allocated = sum(ticket.granted_fps for ticket in self.tickets)
+        return {
+            "limits": {
+                "max_pipelines": self.max_pipelines,
+                "fps_budget": self.fps_budget,
+                "memory_mb": self.memory_mb or None,
+                "queue_size": self.queue_size,
+                "queue_timeout": self.queue_timeout,
+                "min_fps": self.min_fps,
+            },
+            "usage": {
+                "pipelines": len(self.tickets),
+                "fps_allocated": round(allocated, 3),
+                "fps_demanded": round(sum(ticket.demand_fps for ticket in self.tickets), 3),
+                "memory_mb": round(rss_bytes() / (1024 * 1024), 1),
+                "queued": len(self._queue),
+                "degraded": sum(ticket.mode != "full" for ticket in self.tickets),
+            },
+            "pipelines": [ticket.to_dict() for ticket in sorted(self.tickets, key=lambda t: (-t.priority, t.seq))],
+            "queue": [{"camera_id": ticket.camera_id, "priority": ticket.priority, "position": index + 1}
+                      for index, (_, _, ticket, _) in enumerate(sorted(self._queue))],
+            "counts": dict(self.counts),
+        }
+
+
+admission = AdmissionController()
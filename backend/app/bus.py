@@ -0,0 +1,348 @@
+import asyncio
+import importlib.util
+import os
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+# memory:// (one process), unix:///path/to.sock or tcp://host:port (BusBroker), redis://host:port/0
+BUS_URL = os.getenv("BUS_URL", "memory://")
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+
+# Messages queued per subscription; a slow subscriber loses the oldest ones
+SUBSCRIPTION_QUEUE_SIZE = 256
+# Bytes buffered per broker client before messages to it are dropped
+BROKER_WRITE_LIMIT = 4 * 1024 * 1024
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """Exact topics, or a trailing `*` for a prefix (`detections.*`)"""
+    if pattern.endswith("*"):
+        return topic.startswith(pattern[:-1])
+    return pattern == topic
+
+
+class Subscription:
+    """Messages for a set of topics; iterate it to receive (topic, data) pairs"""
+
+    def __init__(self, bus: "MessageBus", topics: Tuple[str, ...], maxsize: int = SUBSCRIPTION_QUEUE_SIZE):
+        self.bus = bus
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def deliver(self, topic: str, data: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((topic, data))
+
+    async def get(self) -> Tuple[str, str]:
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Tuple[str, str]:
+        if self.closed:
+            raise StopAsyncIteration
+        return await self.queue.get()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.bus._unsubscribe(self)
+
+
+class MessageBus:
+    """Topic-based publish/subscribe carrying already-serialized JSON text.
+
+    Subscribers in this process are matched locally; subclasses forward
+    subscriptions and publishes to a shared transport so other processes see them.
+    """
+
+    def __init__(self):
+        self._subscriptions: List[Subscription] = []
+        self._patterns: Dict[str, int] = {}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def publish(self, topic: str, data: str):
+        self._deliver(topic, data)
+
+    def subscribe(self, *topics: str, maxsize: int = SUBSCRIPTION_QUEUE_SIZE) -> Subscription:
+        subscription = Subscription(self, topics, maxsize)
+        self._subscriptions.append(subscription)
+        for pattern in topics:
+            self._patterns[pattern] = self._patterns.get(pattern, 0) + 1
+            if self._patterns[pattern] == 1:
+                self._remote_subscribe(pattern)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+        for pattern in subscription.topics:
+            self._patterns[pattern] -= 1
+            if not self._patterns[pattern]:
+                del self._patterns[pattern]
+                self._remote_unsubscribe(pattern)
+
+    def _deliver(self, topic: str, data: str):
+        for subscription in self._subscriptions:
+            if any(topic_matches(pattern, topic) for pattern in subscription.topics):
+                subscription.deliver(topic, data)
+
+    def _remote_subscribe(self, pattern: str):
+        pass
+
+    def _remote_unsubscribe(self, pattern: str):
+        pass
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "type": type(self).__name__,
+            "subscriptions": len(self._subscriptions),
+            "dropped": sum(s.dropped for s in self._subscriptions),
+        }
+
+
+class InProcessBus(MessageBus):
+    """Everything in one process (the default single-instance setup)"""
+
+
+def _socket_address(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return "unix", parsed.path
+    return "tcp", (parsed.hostname or "127.0.0.1", parsed.port or 7700)
+
+
+class LocalSocketBus(MessageBus):
+    """Client of a BusBroker over a unix or TCP socket, reconnecting if the broker restarts.
+
+    Wire format is one line per message: `S <pattern>`, `U <pattern>` and
+    `P <topic> <data>`; JSON text never contains a raw newline, so data goes as-is.
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self.kind, self.address = _socket_address(url)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self.reconnects = 0
+        self.dropped_sends = 0
+
+    async def _connect(self):
+        if self.kind == "unix":
+            return await asyncio.open_unix_connection(self.address, limit=2 ** 24)
+        return await asyncio.open_connection(*self.address, limit=2 ** 24)
+
+    async def start(self):
+        self._reader_task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), 5)
+        except asyncio.TimeoutError:
+            logger.warning(f"Message bus {self.url} not reachable yet, retrying in background")
+
+    async def _run(self):
+        delay = 0.2
+        while True:
+            try:
+                reader, writer = await self._connect()
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+                continue
+            delay = 0.2
+            self._writer = writer
+            for pattern in self._patterns:
+                writer.write(f"S {pattern}\n".encode())
+            self._connected.set()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    if line.startswith(b"P "):
+                        topic, _, data = line[2:-1].decode().partition(" ")
+                        self._deliver(topic, data)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                logger.warning(f"Message bus connection lost: {e}")
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+            self.reconnects += 1
+
+    def _send(self, line: str):
+        if self._writer is None:
+            return
+        # Broker not keeping up: drop rather than buffer without bound
+        if self._writer.transport.get_write_buffer_size() > BROKER_WRITE_LIMIT:
+            self.dropped_sends += 1
+            return
+        self._writer.write(line.encode())
+
+    async def publish(self, topic: str, data: str):
+        # The broker echoes to our own matching subscriptions too
+        self._send(f"P {topic} {data}\n")
+
+    def _remote_subscribe(self, pattern: str):
+        self._send(f"S {pattern}\n")
+
+    def _remote_unsubscribe(self, pattern: str):
+        self._send(f"U {pattern}\n")
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    def describe(self) -> Dict[str, object]:
+        info = super().describe()
+        info.update({"url": self.url, "connected": self._connected.is_set(),
+                     "reconnects": self.reconnects, "dropped_sends": self.dropped_sends})
+        return info
+
+
+class BusBroker:
+    """Fans published lines out to subscribed clients; run by the cluster coordinator"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.kind, self.address = _socket_address(url)
+        self.clients: Dict[asyncio.StreamWriter, Set[str]] = {}
+        self.published = 0
+        self.dropped = 0
+        self._server = None
+
+    async def start(self):
+        if self.kind == "unix":
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self._server = await asyncio.start_unix_server(self._client, self.address, limit=2 ** 24)
+        else:
+            self._server = await asyncio.start_server(self._client, *self.address, limit=2 ** 24)
+        logger.info(f"Message bus broker listening on {self.url}")
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        patterns: Set[str] = set()
+        self.clients[writer] = patterns
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                op, rest = line[:1], line[2:]
+                if op == b"P":
+                    self._fan_out(rest[:rest.index(b" ")].decode(), line)
+                elif op == b"S":
+                    patterns.add(rest.decode().strip())
+                elif op == b"U":
+                    patterns.discard(rest.decode().strip())
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self.clients[writer]
+            writer.close()
+
+    def _fan_out(self, topic: str, line: bytes):
+        self.published += 1
+        for writer, patterns in self.clients.items():
+            if not any(topic_matches(pattern, topic) for pattern in patterns):
+                continue
+            if writer.transport.get_write_buffer_size() > BROKER_WRITE_LIMIT:
+                self.dropped += 1
+                continue
+            writer.write(line)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in list(self.clients):
+            writer.close()
+        if self.kind == "unix" and os.path.exists(self.address):
+            os.remove(self.address)
+
+
+def _text(value) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisBus(MessageBus):
+    """Redis (or compatible) pub/sub; requires the optional `redis` package.
+
+    Redis sends a message once per matching subscription (a `message` for the exact
+    channel plus a `pmessage` per pattern), so each copy is only delivered to the
+    local subscriptions whose first matching topic is the one it arrived for.
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        import redis.asyncio as redis
+
+        self.url = url
+        self._client = redis.from_url(url)
+        self._pubsub = self._client.pubsub()
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._reader_task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            if not self._patterns:
+                await asyncio.sleep(0.1)
+                continue
+            message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None:
+                continue
+            topic = _text(message["channel"])
+            # `pattern` is set for pmessage; a plain message came through the exact channel
+            self._deliver_via(_text(message.get("pattern")) or topic, topic, _text(message["data"]))
+
+    def _deliver_via(self, pattern: str, topic: str, data: str):
+        for subscription in self._subscriptions:
+            first = next((p for p in subscription.topics if topic_matches(p, topic)), None)
+            if first == pattern:
+                subscription.deliver(topic, data)
+
+    async def publish(self, topic: str, data: str):
+        await self._client.publish(topic, data)
+
+    def _remote_subscribe(self, pattern: str):
+        asyncio.ensure_future(self._pubsub.psubscribe(pattern) if pattern.endswith("*")
+                              else self._pubsub.subscribe(pattern))
+
+    def _remote_unsubscribe(self, pattern: str):
+        asyncio.ensure_future(self._pubsub.punsubscribe(pattern) if pattern.endswith("*")
+                              else self._pubsub.unsubscribe(pattern))
+
+    async def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        await self._pubsub.close()
+        await self._client.close()
+
+
+def create_bus(url: str = BUS_URL) -> MessageBus:
+    scheme = urlparse(url).scheme
+    if scheme in ("unix", "tcp"):
+        return LocalSocketBus(url)
+    if scheme in ("redis", "rediss"):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("BUS_URL is a redis:// URL but the redis package is not installed")
+        return RedisBus(url)
+    return InProcessBus()
@@ -0,0 +1,356 @@
+import asyncio
+import concurrent.futures
+import fcntl
+import functools
+import json
+import os
+import shutil
+import subprocess
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+import cv2
+import numpy as np
+
+from hls import HLSFetcher, Playlist, hls_fetcher
+
+logger = logging.getLogger(__name__)
+
+# opencv (cv2.VideoCapture), ffmpeg (FFmpegCapture) or hls (HLSPipeCapture); cameras can override with `capture`
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "opencv")
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+# Decoder threads per camera; one keeps many cameras from oversubscribing the CPU
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", "1"))
+# Frames in the ring; a frame stays valid until ring_size - 1 further reads
+CAPTURE_RING_SIZE = 3
+PROBE_TIMEOUT = 15.0
+# Network reads give up after this long, so a hung stream ends the read instead of blocking it
+RW_TIMEOUT_SECONDS = 10
+
+_F_SETPIPE_SZ = 1031  # Linux fcntl; lets one read return a whole (small) frame
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BIN) is not None
+
+
+def probe_size(url: str, timeout: float = PROBE_TIMEOUT, data: Optional[bytes] = None) -> Optional[Tuple[int, int]]:
+    """(width, height) of the first video stream, or None if ffprobe can't tell.
+
+    With `data`, probes those bytes (e.g. one downloaded segment) fed on stdin
+    instead of opening `url`.
+    """
+    command = [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "stream=width,height", "-of", "json", "pipe:0" if data is not None else url]
+    try:
+        output = subprocess.run(command, input=data, capture_output=True, timeout=timeout, check=True).stdout
+        stream = json.loads(output)["streams"][0]
+        return int(stream["width"]), int(stream["height"])
+    except (OSError, subprocess.SubprocessError, ValueError, KeyError, IndexError) as e:
+        logger.warning(f"ffprobe could not read {url}: {e}")
+        return None
+
+
+def _even(value: float) -> int:
+    return max(int(round(value / 2.0)) * 2, 2)
+
+
+class FFmpegCapture:
+    """cv2.VideoCapture-compatible reader that decodes with an ffmpeg subprocess.
+
+    ffmpeg drops frames to `fps` and scales to `width` x `height` before the
+    frames leave it, so Python only sees the reduced stream. Raw BGR frames are
+    read with readinto() straight into a preallocated ring of NumPy arrays: no
+    allocation or copy per frame. A returned frame is overwritten after
+    `ring_size - 1` more reads, so consumers that keep frames must copy them.
+
+    With only `width` (or `height`) the other side follows the source aspect
+    ratio. `source_shape` is the camera's native frame shape, so detections can
+    be reported in native pixels.
+    """
+
+    _stdin = subprocess.DEVNULL
+
+    def __init__(self, url: str, width: Optional[int] = None, height: Optional[int] = None,
+                 fps: Optional[float] = None, ring_size: int = CAPTURE_RING_SIZE,
+                 threads: int = FFMPEG_THREADS):
+        self.url = url
+        self.fps = fps
+        self.source_shape: Optional[Tuple[int, int, int]] = None
+        self.frames = 0
+        self._process: Optional[subprocess.Popen] = None
+        self._next = 0
+
+        source = self._probe()
+        if source is not None:
+            self.source_shape = (source[1], source[0], 3)
+        size = self._output_size(source, width, height)
+        if size is None:
+            logger.error(f"Cannot size ffmpeg output for {url}: probe failed and no width/height given")
+            return
+        self.width, self.height = size
+        self.frame_bytes = self.width * self.height * 3
+        self._ring = np.empty((max(ring_size, 2), self.height, self.width, 3), dtype=np.uint8)
+        self._views = [memoryview(slot).cast("B") for slot in self._ring]
+        self._start(threads)
+
+    def _probe(self) -> Optional[Tuple[int, int]]:
+        return probe_size(self.url)
+
+    @staticmethod
+    def _output_size(source: Optional[Tuple[int, int]], width: Optional[int],
+                     height: Optional[int]) -> Optional[Tuple[int, int]]:
+        if width and height:
+            return int(width), int(height)
+        if source is None:
+            return None
+        source_w, source_h = source
+        if width:
+            return _even(width), _even(width * source_h / source_w)
+        if height:
+            return _even(height * source_w / source_h), _even(height)
+        return source_w, source_h
+
+    def _input_args(self):
+        if "://" in self.url:
+            return ["-nostdin", "-rw_timeout", str(RW_TIMEOUT_SECONDS * 1_000_000), "-i", self.url]
+        return ["-nostdin", "-i", self.url]
+
+    def _command(self, threads: int):
+        command = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-threads", str(threads)]
+        command += self._input_args() + ["-an", "-sn", "-dn"]
+        filters = []
+        if self.fps:
+            filters.append(f"fps={self.fps}")
+        if self.source_shape is None or (self.width, self.height) != (self.source_shape[1], self.source_shape[0]):
+            filters.append(f"scale={self.width}:{self.height}")
+        if filters:
+            command += ["-vf", ",".join(filters)]
+        return command + ["-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+
+    def _start(self, threads: int):
+        try:
+            # Unbuffered: readinto() goes from the pipe straight into the ring
+            self._process = subprocess.Popen(self._command(threads), stdin=self._stdin,
+                                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        except OSError as e:
+            logger.error(f"Failed to start {FFMPEG_BIN}: {e}")
+            self._process = None
+            return
+        try:
+            fcntl.fcntl(self._process.stdout.fileno(), _F_SETPIPE_SZ, min(self.frame_bytes, 1 << 20))
+        except OSError:
+            pass  # capped by /proc/sys/fs/pipe-max-size; reads just take more syscalls
+
+    def isOpened(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _read_into(self, view: memoryview) -> bool:
+        stdout = self._process.stdout
+        filled = 0
+        while filled < self.frame_bytes:
+            count = stdout.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def read(self):
+        """(True, frame) with frame a view into the ring, or (False, None) at end of stream"""
+        if self._process is None:
+            return False, None
+        index = self._next
+        try:
+            if not self._read_into(self._views[index]):
+                return False, None
+        except (OSError, ValueError):
+            return False, None
+        self._next = (index + 1) % len(self._ring)
+        self.frames += 1
+        return True, self._ring[index]
+
+    def grab(self) -> bool:
+        return self.read()[0]
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0)
+        return 0.0
+
+    def release(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        process.kill()
+        process.stdout.close()
+        process.wait()
+
+
+def _write_all(pipe, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[pipe.write(view):]
+
+
+class HLSPipeCapture(FFmpegCapture):
+    """FFmpegCapture fed from the shared HLS fetch layer instead of its own HTTP session.
+
+    Follows the camera's media playlist through `fetcher` (by default the cache
+    the /proxy endpoint serves viewers from) and writes each new MPEG-TS segment
+    to ffmpeg's stdin, so a segment is downloaded from the origin once per
+    backend however many viewers and analysers watch the camera. Live playlists
+    start at the newest segment. Encrypted and fMP4 playlists are not supported.
+
+    StreamReconnectManager builds captures on the stream's reader thread; the
+    playlist polling runs as a task on `loop`, the event loop that owns the
+    fetcher, and segments are written to stdin from a thread of this capture's
+    own, so a write waiting on ffmpeg never holds a thread the reads need. When
+    the playlist ends or stalls, ffmpeg's stdin is closed and reads return
+    False, so the stream manager reconnects as for any other dropped stream.
+    """
+
+    _stdin = subprocess.PIPE
+
+    def __init__(self, url: str, loop: asyncio.AbstractEventLoop, fetcher: Optional[HLSFetcher] = None,
+                 **options):
+        self.loop = loop
+        self.fetcher = fetcher or hls_fetcher
+        self.segments = 0
+        self._first: Optional[Tuple[str, int, bytes]] = None  # (media playlist url, sequence, data)
+        self._feeder: Optional[concurrent.futures.Future] = None
+        self._writer: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        super().__init__(url, **options)
+        if self._process is not None:
+            self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="hls-feed")
+            self._feeder = asyncio.run_coroutine_threadsafe(self._feed(self._process.stdin), loop)
+
+    async def _first_segment(self) -> Tuple[str, int, bytes]:
+        playlist = await self.fetcher.media_playlist(self.url)
+        if playlist.encrypted or playlist.fragmented:
+            raise ValueError("encrypted and fMP4 playlists are not supported")
+        if not playlist.segments:
+            raise ValueError("playlist has no segments")
+        sequence, segment_url = playlist.segments[0 if playlist.ended else -1]
+        fetched = await self.fetcher.fetch(segment_url)
+        if fetched.status != 200:
+            raise OSError(f"HTTP {fetched.status} for {segment_url}")
+        return playlist.url, sequence, fetched.content
+
+    def _probe(self) -> Optional[Tuple[int, int]]:
+        try:
+            self._first = asyncio.run_coroutine_threadsafe(self._first_segment(), self.loop).result(PROBE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Cannot follow HLS playlist {self.url}: {e}")
+            return None
+        return probe_size(self.url, data=self._first[2])
+
+    def _input_args(self):
+        return ["-f", "mpegts", "-i", "pipe:0"]
+
+    def _start(self, threads: int):
+        if self._first is not None:
+            super()._start(threads)
+
+    async def _write(self, stdin, data: bytes) -> bool:
+        try:
+            # Blocks until ffmpeg has decoded (and we have read) enough; never on a shared pool
+            await self.loop.run_in_executor(self._writer, _write_all, stdin, data)
+        except (OSError, ValueError, RuntimeError):  # RuntimeError: released meanwhile
+            return False
+        self.segments += 1
+        return True
+
+    async def _feed(self, stdin):
+        media_url, sequence, data = self._first
+        self._first = None
+        stalled_since = time.monotonic()
+        try:
+            if not await self._write(stdin, data):
+                return
+            while True:
+                delay = 1.0
+                try:
+                    fetched = await self.fetcher.fetch(media_url)
+                    if fetched.status != 200:
+                        raise OSError(f"HTTP {fetched.status}")
+                    playlist = Playlist(fetched.content.decode("utf-8", "replace"), media_url)
+                    delay = max(playlist.target_duration / 2, 0.5)
+                    if playlist.segments and playlist.segments[-1][0] < sequence:
+                        # The origin restarted its media sequence
+                        sequence = playlist.segments[0][0] - 1
+                    for segment_sequence, segment_url in playlist.segments:
+                        if segment_sequence <= sequence:
+                            continue
+                        segment = await self.fetcher.fetch(segment_url)
+                        sequence = segment_sequence
+                        if segment.status != 200:
+                            logger.warning(f"Skipping HLS segment {segment_url}: HTTP {segment.status}")
+                            continue
+                        if not await self._write(stdin, segment.content):
+                            return
+                        stalled_since = time.monotonic()
+                    if playlist.ended and (not playlist.segments or sequence >= playlist.segments[-1][0]):
+                        return
+                    timeout = max(RW_TIMEOUT_SECONDS, 3 * playlist.target_duration)
+                except Exception as e:
+                    logger.warning(f"HLS playlist {media_url} failed: {e}")
+                    timeout = RW_TIMEOUT_SECONDS
+                if time.monotonic() - stalled_since > timeout:
+                    logger.warning(f"No new HLS segments from {media_url} for {timeout:.0f}s")
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            # EOF lets ffmpeg flush its last frames and exit; reads then report the end of stream
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def release(self):
+        feeder, self._feeder = self._feeder, None
+        if feeder is not None:
+            feeder.cancel()
+        process = self._process
+        super().release()
+        if process is not None:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+        if self._writer is not None:
+            # A write still in flight fails with EPIPE now that ffmpeg is gone
+            self._writer.shutdown(wait=False)
+
+
+def capture_options(camera: Dict[str, Any]) -> Dict[str, Any]:
+    """The camera's `capture` setting: "ffmpeg", "hls", or {"backend": "ffmpeg", "width": 960, "fps": 10}"""
+    options = camera.get("capture") or {}
+    if isinstance(options, str):
+        options = {"backend": options}
+    return dict(options)
+
+
+def create_capture_factory(camera: Dict[str, Any]) -> Callable[[str], Any]:
+    """Capture factory for StreamReconnectManager, per the camera's `capture` setting.
+
+    The hls backend needs the running event loop, so call this from the pipeline's task.
+    """
+    options = capture_options(camera)
+    backend = options.pop("backend", CAPTURE_BACKEND)
+    if backend in ("ffmpeg", "hls"):
+        if ffmpeg_available():
+            allowed = {key: options[key] for key in ("width", "height", "fps", "ring_size", "threads")
+                       if key in options}
+            if backend == "hls":
+                return functools.partial(HLSPipeCapture, loop=asyncio.get_running_loop(), **allowed)
+            return functools.partial(FFmpegCapture, **allowed)
+        logger.warning(f"{FFMPEG_BIN} not found, camera {camera.get('id')} falls back to OpenCV capture")
+    elif backend != "opencv":
+        logger.warning(f"Unknown capture backend {backend!r}, using OpenCV")
+    return cv2.VideoCapture
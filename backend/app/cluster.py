@@ -0,0 +1,341 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import socket
+import time
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+
+from bus import MessageBus
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = float(os.getenv("CLUSTER_HEARTBEAT_INTERVAL", "2"))
+# A worker missing heartbeats this long is considered gone and its cameras move
+WORKER_TIMEOUT = float(os.getenv("CLUSTER_WORKER_TIMEOUT", "6"))
+# Assignments are re-sent this often so workers that missed one catch up
+ASSIGNMENT_INTERVAL = 5.0
+RING_REPLICAS = 128
+# Pipelines one worker runs at most; cameras past it are handed back to the coordinator
+CLUSTER_WORKER_MAX_CAMERAS = int(os.getenv("CLUSTER_WORKER_MAX_CAMERAS", os.getenv("ADMISSION_MAX_PIPELINES", "8")))
+# How long a stopping pipeline gets to close its capture before it is cancelled
+STOP_TIMEOUT = 2.0
+
+HEARTBEAT_TOPIC = "cluster.heartbeat"
+LEAVE_TOPIC = "cluster.leave"
+ASSIGNMENTS_TOPIC = "cluster.assignments"
+
+
+def detections_topic(camera_id: str) -> str:
+    return f"detections.{camera_id}"
+
+
+def assign_topic(worker_id: str) -> str:
+    return f"cluster.assign.{worker_id}"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of camera ids onto workers.
+
+    Each worker owns RING_REPLICAS points on the ring, so when one joins or leaves
+    only about 1/N of the cameras change owner.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = RING_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    def nodes_for(self, key: str) -> List[str]:
+        """All nodes in ring order from the key's owner, the fallbacks when it is full"""
+        if not self._points:
+            return []
+        start = bisect.bisect(self._points, _hash(key))
+        nodes: List[str] = []
+        for offset in range(len(self._points)):
+            node = self._owners[self._points[(start + offset) % len(self._points)]]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == len(self.nodes):
+                    break
+        return nodes
+
+
+def load_cameras(cctv_file: str, categories: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Cameras with a stream link, optionally only some categories"""
+    with open(cctv_file) as f:
+        devices = json.load(f).get("devices", [])
+    return {device["id"]: device for device in devices
+            if device.get("id") and device.get("link")
+            and (not categories or device.get("category") in categories)}
+
+
+class Coordinator:
+    """Tracks live workers from their heartbeats and assigns cameras by consistent hashing.
+
+    Assignments go to `cluster.assign.<worker>` (with each camera's config, so workers
+    don't need cctv.json) and a summary to `cluster.assignments`. cctv.json is
+    re-read when it changes. A worker whose heartbeat reports a `capacity` gets no
+    more cameras than that; the rest go to the next worker on the ring with room,
+    or stay unassigned until one has.
+    """
+
+    def __init__(self, bus: MessageBus, cctv_file: str, categories: Optional[List[str]] = None):
+        self.bus = bus
+        self.cctv_file = cctv_file
+        self.categories = categories
+        self.ring = HashRing()
+        self.workers: Dict[str, Dict[str, Any]] = {}
+        self.cameras: Dict[str, Dict[str, Any]] = {}
+        self.assignments: Dict[str, List[str]] = {}
+        self.unassigned: List[str] = []
+        self.version = 0
+        self.rebalances = 0
+        self._cctv_mtime = None
+
+    def _reload_cameras(self) -> bool:
+        try:
+            mtime = os.stat(self.cctv_file).st_mtime
+        except OSError:
+            return False
+        if mtime == self._cctv_mtime:
+            return False
+        self._cctv_mtime = mtime
+        try:
+            self.cameras = load_cameras(self.cctv_file, self.categories)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to read cameras from {self.cctv_file}: {e}")
+            return False
+        return True
+
+    def _expire_workers(self) -> bool:
+        now = time.time()
+        expired = [worker for worker, info in self.workers.items() if now - info["seen"] > WORKER_TIMEOUT]
+        for worker in expired:
+            logger.warning(f"Worker {worker} timed out")
+            self._remove_worker(worker)
+        return bool(expired)
+
+    def _remove_worker(self, worker: str):
+        self.workers.pop(worker, None)
+        self.ring.remove(worker)
+
+    def _capacity(self, worker: str) -> Optional[int]:
+        capacity = self.workers.get(worker, {}).get("capacity")
+        return None if capacity is None else int(capacity)
+
+    def compute_assignments(self) -> Dict[str, List[str]]:
+        assignments: Dict[str, List[str]] = {worker: [] for worker in self.ring.nodes}
+        unassigned = []
+        for camera_id in self.cameras:
+            for worker in self.ring.nodes_for(camera_id):
+                capacity = self._capacity(worker)
+                if capacity is None or len(assignments[worker]) < capacity:
+                    assignments[worker].append(camera_id)
+                    break
+            else:
+                unassigned.append(camera_id)
+        if unassigned and self.ring.nodes:
+            logger.warning(f"No worker has room for {len(unassigned)} cameras: {', '.join(unassigned)}")
+        self.unassigned = unassigned
+        return assignments
+
+    async def _publish_assignments(self, changed: bool):
+        if changed:
+            assignments = self.compute_assignments()
+            moved = sum(1 for worker, cameras in assignments.items()
+                        for camera_id in cameras if camera_id not in self.assignments.get(worker, ()))
+            self.assignments = assignments
+            self.version += 1
+            self.rebalances += 1
+            logger.info(f"Assignment v{self.version}: {len(self.cameras)} cameras on "
+                        f"{len(assignments)} workers, {moved} moved")
+        for worker, cameras in self.assignments.items():
+            await self.bus.publish(assign_topic(worker), json.dumps({
+                "version": self.version,
+                "cameras": {camera_id: self.cameras[camera_id] for camera_id in cameras},
+            }))
+        await self.bus.publish(ASSIGNMENTS_TOPIC, json.dumps(self.describe()))
+
+    async def run(self):
+        subscription = self.bus.subscribe(HEARTBEAT_TOPIC, LEAVE_TOPIC)
+        self._reload_cameras()
+        next_publish = 0.0
+        try:
+            while True:
+                changed = False
+                try:
+                    topic, data = await asyncio.wait_for(subscription.get(), HEARTBEAT_INTERVAL)
+                    message = json.loads(data)
+                    worker = message["worker"]
+                    if topic == LEAVE_TOPIC:
+                        logger.info(f"Worker {worker} left")
+                        self._remove_worker(worker)
+                        changed = True
+                    else:
+                        if worker not in self.workers:
+                            logger.info(f"Worker {worker} joined")
+                            self.ring.add(worker)
+                            changed = True
+                        elif any(message.get(key) != self.workers[worker].get(key) for key in ("capacity", "overflow")):
+                            changed = True
+                        self.workers[worker] = dict(message, seen=time.time())
+                except asyncio.TimeoutError:
+                    pass
+                changed = self._expire_workers() or changed
+                changed = self._reload_cameras() or changed
+                now = time.monotonic()
+                if changed or now >= next_publish:
+                    next_publish = now + ASSIGNMENT_INTERVAL
+                    await self._publish_assignments(changed)
+        finally:
+            subscription.close()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "cameras": len(self.cameras),
+            "rebalances": self.rebalances,
+            "unassigned": self.unassigned,
+            "workers": {worker: {
+                "cameras": self.assignments.get(worker, []),
+                "running": info.get("running"),
+                "capacity": info.get("capacity"),
+                "overflow": info.get("overflow"),
+                "host": info.get("host"),
+                "last_heartbeat": info.get("seen"),
+            } for worker, info in self.workers.items()},
+        }
+
+
+class BusSink:
+    """Stands in for the viewer WebSocket in process_stream, publishing to the camera's topic"""
+
+    def __init__(self, bus: MessageBus, camera_id: str):
+        self.bus = bus
+        self.topic = detections_topic(camera_id)
+
+    async def send_text(self, text: str):
+        await self.bus.publish(self.topic, text)
+
+
+class DetectionWorker:
+    """Runs the pipelines the coordinator assigns to it and publishes their results on the bus.
+
+    At most `max_cameras` pipelines run; its heartbeat advertises that capacity and
+    lists assigned cameras it had no room for, so the coordinator moves them.
+    """
+
+    def __init__(self, bus: MessageBus, detector, worker_id: Optional[str] = None,
+                 max_cameras: int = CLUSTER_WORKER_MAX_CAMERAS):
+        self.bus = bus
+        self.detector = detector
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.max_cameras = max_cameras
+        self.pipelines: Dict[str, asyncio.Task] = {}
+        self.configs: Dict[str, Dict[str, Any]] = {}
+        self.overflow: List[str] = []
+        self.version = -1
+
+    async def run(self):
+        subscription = self.bus.subscribe(assign_topic(self.worker_id))
+        heartbeat = asyncio.create_task(self._heartbeat())
+        logger.info(f"Worker {self.worker_id} started")
+        try:
+            async for _, data in subscription:
+                message = json.loads(data)
+                if message["version"] < self.version:
+                    continue
+                self.version = message["version"]
+                await self.apply(message["cameras"])
+        finally:
+            heartbeat.cancel()
+            subscription.close()
+            await self.apply({})
+            await self.bus.publish(LEAVE_TOPIC, json.dumps({"worker": self.worker_id}))
+
+    async def _heartbeat(self):
+        while True:
+            await self._send_heartbeat()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def _send_heartbeat(self):
+        await self.bus.publish(HEARTBEAT_TOPIC, json.dumps({
+            "worker": self.worker_id,
+            "host": socket.gethostname(),
+            "running": sorted(self.pipelines),
+            "capacity": self.max_cameras,
+            "overflow": self.overflow,
+            "timestamp": time.time(),
+        }))
+
+    async def apply(self, cameras: Dict[str, Dict[str, Any]]):
+        """Stop pipelines no longer assigned (or whose config changed) and start new ones"""
+        for camera_id in list(self.pipelines):
+            if cameras.get(camera_id) != self.configs.get(camera_id) or self.pipelines[camera_id].done():
+                await self._stop(camera_id)
+        overflow = []
+        for camera_id, camera in cameras.items():
+            if camera_id in self.pipelines:
+                continue
+            if len(self.pipelines) >= self.max_cameras:
+                overflow.append(camera_id)
+                continue
+            self.configs[camera_id] = camera
+            self.pipelines[camera_id] = asyncio.create_task(self.detector.process_stream(
+                camera["link"], BusSink(self.bus, camera_id), cctv_id=camera_id, camera=camera))
+        if cameras:
+            logger.info(f"Worker {self.worker_id} runs {len(self.pipelines)} cameras")
+        if overflow != self.overflow:
+            self.overflow = overflow
+            if overflow:
+                logger.warning(f"Worker {self.worker_id} is full ({self.max_cameras} cameras), "
+                               f"handing back {', '.join(overflow)}")
+            # Tell the coordinator now instead of at the next heartbeat
+            await self._send_heartbeat()
+
+    async def _stop(self, camera_id: str):
+        """Stop a pipeline and wait until its capture is closed"""
+        task = self.pipelines.pop(camera_id)
+        self.configs.pop(camera_id, None)
+        self.detector.stop_camera(camera_id)
+        # The stream stops at its next frame; only a pipeline stuck elsewhere is cancelled
+        await asyncio.wait({task}, timeout=STOP_TIMEOUT)
+        if not task.done():
+            logger.warning(f"Pipeline for {camera_id} did not stop in {STOP_TIMEOUT}s, cancelling")
+            task.cancel()
+        # Either way its finally blocks (capture release) have run once this returns
+        result, = await asyncio.gather(task, return_exceptions=True)
+        if isinstance(result, Exception):
+            logger.error(f"Pipeline for {camera_id} failed: {result}")
@@ -0,0 +1,90 @@
+from typing import Dict, List, Tuple
+
+from roi import CameraGeometry
+
+Point = Tuple[float, float]
+
+
+def _side(a: Point, b: Point, p: Point) -> float:
+    return (b[0] - a[0]) * (p[1] - a[1]) - (b[1] - a[1]) * (p[0] - a[0])
+
+
+def segments_cross(p1: Point, p2: Point, a: Point, b: Point) -> bool:
+    """Whether the movement p1 -> p2 crosses the line segment a-b.
+
+    A point exactly on the line counts as being on its positive side, so a step
+    that ends on the line and the next one that leaves it count once.
+    """
+    if (_side(a, b, p1) >= 0) == (_side(a, b, p2) >= 0):
+        return False
+    return _side(p1, p2, a) * _side(p1, p2, b) <= 0
+
+
+class _Track:
+    __slots__ = ("label", "point", "missed", "counted")
+
+    def __init__(self, label: str, point: Point):
+        self.label = label
+        self.point = point
+        self.missed = 0
+        self.counted = set()
+
+
+class LineCrossingCounter:
+    """Counts objects crossing the camera's lines between consecutive analysed frames.
+
+    Objects are followed by their box's bottom centre, matched greedily to the
+    nearest point of the same label from the previous frame. That's only reliable
+    at a steady, fairly high analysis rate, which offline analysis provides. Each
+    object counts at most once per line.
+    """
+
+    def __init__(self, camera: Dict, max_distance: float = 80.0, max_missed: int = 5):
+        self.camera = camera
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.geometry = None
+        self.tracks: List[_Track] = []
+
+    def update(self, detections: List, frame_shape: Tuple[int, ...]) -> List[Tuple[str, str]]:
+        """Feed one analysed frame; returns (line_name, label) for every new crossing"""
+        if self.geometry is None or self.geometry.frame_shape != tuple(frame_shape[:2]):
+            self.geometry = CameraGeometry(self.camera, frame_shape)
+            self.tracks = []
+        if not self.geometry.lines:
+            return []
+
+        points = [(d.label, (d.bbox[0] + d.bbox[2] / 2.0, d.bbox[1] + d.bbox[3])) for d in detections]
+        candidates = []
+        for t_index, track in enumerate(self.tracks):
+            for d_index, (label, point) in enumerate(points):
+                if label != track.label:
+                    continue
+                distance = ((point[0] - track.point[0]) ** 2 + (point[1] - track.point[1]) ** 2) ** 0.5
+                if distance <= self.max_distance:
+                    candidates.append((distance, t_index, d_index))
+        candidates.sort()
+
+        crossings = []
+        matched_tracks, matched_points = set(), set()
+        for _, t_index, d_index in candidates:
+            if t_index in matched_tracks or d_index in matched_points:
+                continue
+            matched_tracks.add(t_index)
+            matched_points.add(d_index)
+            track = self.tracks[t_index]
+            point = points[d_index][1]
+            for name, (start, end) in self.geometry.lines.items():
+                if name not in track.counted and segments_cross(track.point, point, start, end):
+                    track.counted.add(name)
+                    crossings.append((name, track.label))
+            track.point = point
+            track.missed = 0
+
+        for t_index, track in enumerate(self.tracks):
+            if t_index not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+        self.tracks.extend(_Track(label, point) for d_index, (label, point) in enumerate(points)
+                           if d_index not in matched_points)
+        return crossings
@@ -1,6 +1,9 @@
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import AnalyticsDataModel
-from .schemas import AnalyticsDataCreate 
+from database import AnalyticsDataModel, CameraZoneModel
+from schemas import AnalyticsDataCreate, CameraZoneCreate
 
 def create_analytics_data(db: Session, data: AnalyticsDataCreate):
     db_data = AnalyticsDataModel(
@@ -15,4 +18,52 @@ def create_analytics_data(db: Session, data: AnalyticsDataCreate):
 
 def get_analytics_data(db: Session, skip: int = 0, limit: int = 100):
     # Urutkan berdasarkan timestamp terbaru
-    return db.query(AnalyticsDataModel).offset(skip).limit(limit).all()
\ No newline at end of file
+    return db.query(AnalyticsDataModel).offset(skip).limit(limit).all()
+
+# Versi async untuk endpoint di event loop (WebSocket deteksi dan proxy HLS jalan di loop yang sama)
+async def create_analytics_data_async(db: AsyncSession, data: AnalyticsDataCreate) -> AnalyticsDataModel:
+    db_data = AnalyticsDataModel(
+        object_type=data.object_type,
+        count=data.count,
+        area_name=data.area_name
+    )
+    db.add(db_data)
+    await db.commit()
+    await db.refresh(db_data)
+    return db_data
+
+async def create_analytics_data_bulk_async(db: AsyncSession, rows: List[AnalyticsDataCreate]) -> int:
+    # Satu executemany untuk banyak baris (mis. hitungan per menit dari beberapa kamera)
+    db.add_all([AnalyticsDataModel(object_type=row.object_type, count=row.count, area_name=row.area_name)
+                for row in rows])
+    await db.commit()
+    return len(rows)
+
+async def get_analytics_data_async(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[AnalyticsDataModel]:
+    result = await db.execute(select(AnalyticsDataModel).offset(skip).limit(limit))
+    return list(result.scalars().all())
+
+async def get_camera_zone_async(db: AsyncSession, camera_id: str) -> Optional[CameraZoneModel]:
+    result = await db.execute(select(CameraZoneModel).where(CameraZoneModel.camera_id == camera_id))
+    return result.scalar_one_or_none()
+
+async def get_camera_zones_async(db: AsyncSession, active_only: bool = True) -> List[CameraZoneModel]:
+    query = select(CameraZoneModel)
+    if active_only:
+        query = query.where(CameraZoneModel.is_active.is_(True))
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+async def upsert_camera_zone_async(db: AsyncSession, zone: CameraZoneCreate) -> CameraZoneModel:
+    # camera_id unik: zona yang sudah ada diganti titiknya dan diaktifkan lagi
+    db_zone = await get_camera_zone_async(db, zone.camera_id)
+    points = [point.model_dump() for point in zone.points]
+    if db_zone is None:
+        db_zone = CameraZoneModel(camera_id=zone.camera_id, points=points, is_active=True)
+        db.add(db_zone)
+    else:
+        db_zone.points = points
+        db_zone.is_active = True
+    await db.commit()
+    await db.refresh(db_zone)
+    return db_zone
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+from bus import MessageBus
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_TICK = float(os.getenv("DASHBOARD_TICK", "1.0"))
+# Cameras without a summary for this long are reported as stale
+STALE_AFTER = 10.0
+
+SUMMARY_TOPIC = "summary.*"
+# Summaries from every camera arrive at up to target_fps each
+SUMMARY_QUEUE_SIZE = 8192
+
+
+def summary_topic(camera_id: str) -> str:
+    return f"summary.{camera_id}"
+
+
+class _Group:
+    """Running totals of one category or line_category, updated per camera change"""
+    __slots__ = ("counters", "total", "cameras", "live")
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.total = 0
+        self.cameras = 0
+        self.live = 0
+
+    def add(self, counters: Dict[str, int], total: int, live: bool, sign: int):
+        for label, count in counters.items():
+            value = self.counters.get(label, 0) + sign * count
+            if value:
+                self.counters[label] = value
+            else:
+                self.counters.pop(label, None)
+        self.total += sign * total
+        self.live += sign * int(live)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"counters": dict(self.counters), "total": self.total,
+                "cameras": self.cameras, "live": self.live}
+
+
+class _Camera:
+    __slots__ = ("counters", "total", "state", "updated", "groups")
+
+    def __init__(self, groups: Tuple[Tuple[str, str], ...]):
+        self.counters: Dict[str, int] = {}
+        self.total = 0
+        self.state = "unknown"
+        self.updated = 0.0
+        self.groups = groups
+
+    @property
+    def live(self) -> bool:
+        return self.state == "live"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"counters": self.counters, "total": self.total, "state": self.state, "updated": self.updated}
+
+
+class Dashboard:
+    """One dashboard connection: what it watches and whether it needs a full snapshot"""
+
+    def __init__(self, websocket, cameras: Iterable[str] = (), categories: Iterable[str] = ()):
+        self.websocket = websocket
+        self.sending: Optional[asyncio.Task] = None
+        self.skipped = 0
+        self.subscribe(cameras, categories)
+
+    def subscribe(self, cameras: Iterable[str] = (), categories: Iterable[str] = ()):
+        self.cameras = frozenset(cameras)
+        self.categories = frozenset(categories)
+        self.needs_snapshot = True
+
+    @property
+    def key(self) -> Tuple[frozenset, frozenset]:
+        return self.cameras, self.categories
+
+
+class DashboardHub:
+    """City-wide overview from the pipelines' per-frame summaries.
+
+    One bus subscription per API instance feeds per-camera state and per
+    category / line_category totals, adjusted incrementally as cameras change.
+    Once per tick every dashboard gets the cameras and groups that changed
+    within its subscription; dashboards with the same subscription share one
+    serialized message, and a dashboard still busy with the previous message
+    skips the tick and gets a snapshot next time.
+    """
+
+    def __init__(self, bus: MessageBus, cctv_file: str, tick: float = DASHBOARD_TICK):
+        self.bus = bus
+        self.cctv_file = cctv_file
+        self.tick = tick
+        self.cameras: Dict[str, _Camera] = {}
+        self.groups: Dict[Tuple[str, str], _Group] = {}
+        self.dashboards: List[Dashboard] = []
+        self.ticks = 0
+        self.summaries = 0
+        self._meta: Dict[str, Tuple[Tuple[str, str], ...]] = {}
+        self._meta_mtime = None
+        self._dirty_cameras: Set[str] = set()
+        self._dirty_groups: Set[Tuple[str, str]] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def _load_meta(self):
+        """Which category and line_category each camera rolls up into, from cctv.json"""
+        try:
+            mtime = os.stat(self.cctv_file).st_mtime
+            if mtime == self._meta_mtime:
+                return
+            with open(self.cctv_file) as f:
+                devices = json.load(f).get("devices", [])
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Dashboard could not read {self.cctv_file}: {e}")
+            return
+        self._meta_mtime = mtime
+        self._meta = {}
+        for device in devices:
+            groups = []
+            if device.get("category"):
+                groups.append(("category", device["category"]))
+            if device.get("line_category"):
+                groups.append(("line_category", device["line_category"]))
+            self._meta[device.get("id")] = tuple(groups)
+
+        # Re-home cameras whose groups changed
+        for camera_id, camera in self.cameras.items():
+            groups = self._meta.get(camera_id, ())
+            if groups != camera.groups:
+                self._move(camera, -1)
+                camera.groups = groups
+                self._move(camera, 1)
+                self._dirty_cameras.add(camera_id)
+
+    def _move(self, camera: _Camera, sign: int):
+        for key in camera.groups:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = _Group()
+            group.add(camera.counters, camera.total, camera.live, sign)
+            group.cameras += sign
+            self._dirty_groups.add(key)
+
+    def apply(self, camera_id: str, summary: Dict[str, Any]):
+        """Fold one pipeline summary into the camera and its groups"""
+        self.summaries += 1
+        camera = self.cameras.get(camera_id)
+        if camera is None:
+            camera = self.cameras[camera_id] = _Camera(self._meta.get(camera_id, ()))
+            self._move(camera, 1)
+
+        counters = summary.get("counters")
+        state = summary.get("state") or camera.state
+        was_live = camera.live
+        for key in camera.groups:
+            group = self.groups[key]
+            if counters is not None:
+                group.add(camera.counters, camera.total, False, -1)
+                group.add(counters, summary.get("total", 0), False, 1)
+            group.live += int(state == "live") - int(was_live)
+            self._dirty_groups.add(key)
+        if counters is not None:
+            camera.counters = counters
+            camera.total = summary.get("total", 0)
+        camera.state = state
+        camera.updated = summary.get("timestamp") or time.time()
+        self._dirty_cameras.add(camera_id)
+
+    def start(self):
+        if not self._tasks:
+            self._load_meta()
+            self._tasks = [asyncio.create_task(self._consume()), asyncio.create_task(self._ticker())]
+
+    async def _consume(self):
+        subscription = self.bus.subscribe(SUMMARY_TOPIC, maxsize=SUMMARY_QUEUE_SIZE)
+        try:
+            async for topic, data in subscription:
+                try:
+                    self.apply(topic[len("summary."):], json.loads(data))
+                except (ValueError, TypeError, KeyError) as e:
+                    logger.error(f"Bad summary on {topic}: {e}")
+        finally:
+            subscription.close()
+
+    async def _ticker(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self._load_meta()
+                self._mark_stale()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Dashboard tick failed: {e}")
+
+    def _mark_stale(self):
+        cutoff = time.time() - STALE_AFTER
+        for camera_id, camera in self.cameras.items():
+            if camera.updated < cutoff and camera.state not in ("stale", "stopped"):
+                self.apply(camera_id, {"state": "stale", "timestamp": camera.updated})
+
+    def _wants(self, dashboard: Dashboard, camera_id: str) -> bool:
+        if not dashboard.cameras and not dashboard.categories:
+            return True
+        if camera_id in dashboard.cameras:
+            return True
+        camera = self.cameras.get(camera_id)
+        return camera is not None and any(value in dashboard.categories for _, value in camera.groups)
+
+    def _wants_group(self, dashboard: Dashboard, key: Tuple[str, str]) -> bool:
+        """Same rule as _wants: a subscribed category, or a group of a subscribed camera"""
+        if not dashboard.cameras and not dashboard.categories:
+            return True
+        if key[1] in dashboard.categories:
+            return True
+        return any(key in self._meta.get(camera_id, ()) for camera_id in dashboard.cameras)
+
+    def _groups_for(self, dashboard: Dashboard, keys: Iterable[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {"category": {}, "line_category": {}}
+        for kind, value in keys:
+            if self._wants_group(dashboard, (kind, value)):
+                out[kind][value] = self.groups[(kind, value)].to_dict()
+        return out
+
+    def _message(self, dashboard: Dashboard, snapshot: bool) -> Optional[str]:
+        camera_ids = self.cameras if snapshot else self._dirty_cameras
+        group_keys = self.groups if snapshot else self._dirty_groups
+        cameras = {camera_id: self.cameras[camera_id].to_dict()
+                   for camera_id in camera_ids if self._wants(dashboard, camera_id)}
+        groups = self._groups_for(dashboard, group_keys)
+        if not snapshot and not cameras and not groups["category"] and not groups["line_category"]:
+            return None
+        return json.dumps({
+            "type": "dashboard_snapshot" if snapshot else "dashboard_update",
+            "tick": self.ticks,
+            "timestamp": time.time(),
+            "cameras": cameras,
+            "categories": groups["category"],
+            "line_categories": groups["line_category"],
+        })
+
+    def flush(self):
+        """Send this tick's changes to every dashboard"""
+        self.ticks += 1
+        messages: Dict[Tuple[Any, bool], Optional[str]] = {}
+        for dashboard in list(self.dashboards):
+            if dashboard.sending is not None and not dashboard.sending.done():
+                dashboard.skipped += 1
+                dashboard.needs_snapshot = True
+                continue
+            snapshot = dashboard.needs_snapshot
+            key = (dashboard.key, snapshot)
+            if key not in messages:
+                messages[key] = self._message(dashboard, snapshot)
+            message = messages[key]
+            if message is None:
+                continue
+            dashboard.needs_snapshot = False
+            dashboard.sending = asyncio.create_task(self._send(dashboard, message))
+        self._dirty_cameras.clear()
+        self._dirty_groups.clear()
+
+    async def _send(self, dashboard: Dashboard, message: str):
+        try:
+            await dashboard.websocket.send_text(message)
+        except Exception:
+            self.remove(dashboard)
+
+    def add(self, dashboard: Dashboard):
+        self.dashboards.append(dashboard)
+        self.start()
+
+    def remove(self, dashboard: Dashboard):
+        if dashboard in self.dashboards:
+            self.dashboards.remove(dashboard)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "dashboards": len(self.dashboards),
+            "cameras": len(self.cameras),
+            "groups": len(self.groups),
+            "ticks": self.ticks,
+            "summaries": self.summaries,
+            "skipped_sends": sum(d.skipped for d in self.dashboards),
+        }
+
@@ -1,21 +1,97 @@
 import os
+from typing import AsyncIterator, Optional
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Column, Integer, String, DateTime, text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, func
 from sqlalchemy.dialects.postgresql import JSONB # Impor JSONB
 from datetime import datetime
 
 # Ambil variabel lingkungan dari Docker Compose
+# Postgres/Supabase (postgresql://...) atau stand-in lokal (sqlite:///./analytics.db)
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Connections kept open per engine, and extra ones allowed under bursts
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Reopen connections older than this; poolers and NAT drop idle ones
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Compiled SQL (SQLAlchemy) and prepared statements (asyncpg) kept per connection;
+# 0 disables prepared statements, needed behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+# Async drivers for the sync URL schemes DATABASE_URL is written with
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is not set for backend service.")
-    
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+_engine: Optional[Engine] = None
+_session_factory: Optional[sessionmaker] = None
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
+
+def _database_url(url: Optional[str] = None) -> URL:
+    url = url or DATABASE_URL
+    if not url:
+        raise ValueError("DATABASE_URL environment variable is not set for backend service.")
+    return make_url(url)
+
+
+def async_url(url: Optional[str] = None) -> URL:
+    """DATABASE_URL with its async driver (asyncpg, aiosqlite) unless it already names one"""
+    url = _database_url(url)
+    if "+" in url.drivername:
+        return url
+    return url.set(drivername=_ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+def _engine_options(url: URL) -> dict:
+    options = {"pool_pre_ping": True, "query_cache_size": DB_STATEMENT_CACHE_SIZE}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options  # single shared in-memory connection, no pool to size
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                   pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE)
+    if url.drivername == "postgresql+asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+                                   "statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def get_engine() -> Engine:
+    """Blocking engine, created on first use so the app starts without a database"""
+    global _engine, _session_factory
+    if _engine is None:
+        url = _database_url()
+        _engine = create_engine(url, **_engine_options(url))
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+    return _engine
+
+
+def SessionLocal():
+    """New blocking session (scripts and threads, not the event loop)"""
+    get_engine()
+    return _session_factory()
+
+
+def get_async_engine() -> AsyncEngine:
+    """Pooled async engine, created on first use; raises ValueError without DATABASE_URL"""
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        url = async_url()
+        _async_engine = create_async_engine(url, **_engine_options(url))
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    get_async_engine()
+    return _async_session_factory()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -23,11 +99,33 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency for endpoints that must not block the event loop"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def create_tables():
+    """Create the tables in a local stand-in database (Supabase already has them)"""
+    async with get_async_engine().begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def dispose_engines():
+    global _engine, _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
 class AnalyticsDataModel(Base):
     __tablename__ = "analytics_data" # HARUS SAMA dengan nama tabel di Supabase
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=text('now()')) # Gunakan text('now()') untuk Supabase
+    timestamp = Column(DateTime, default=func.now()) # now() di Postgres/Supabase, CURRENT_TIMESTAMP di SQLite
     object_type = Column(String)
     count = Column(Integer)
     area_name = Column(String)
@@ -47,13 +145,13 @@ class CameraZoneModel(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     camera_id = Column(String, index=True, unique=True)
-    points = Column(JSONB)
+    points = Column(JSON().with_variant(JSONB(), "postgresql")) # JSONB di Postgres, JSON di stand-in SQLite
     is_active = Column(Boolean, default=True)
-    
+
     def to_dict(self):
         return {
             "id": self.id,
             "camera_id": self.camera_id,
             "points": self.points,
             "is_active": self.is_active
-        }
\ No newline at end of file
+        }
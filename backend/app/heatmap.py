@@ -0,0 +1,180 @@
+import asyncio
+import io
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEATMAP_DIR = os.getenv("HEATMAP_DIR", os.path.join(BASE_DIR, "heatmaps"))
+HEATMAP_GRID = tuple(int(v) for v in os.getenv("HEATMAP_GRID", "64x36").split("x"))
+# Classes with their own layer (first come, first served); others only go into the total
+HEATMAP_MAX_CLASSES = int(os.getenv("HEATMAP_MAX_CLASSES", "8"))
+# Seconds for a detection's weight to halve; 0 keeps counts forever
+HEATMAP_HALF_LIFE = float(os.getenv("HEATMAP_HALF_LIFE", "0"))
+HEATMAP_SNAPSHOT_INTERVAL = float(os.getenv("HEATMAP_SNAPSHOT_INTERVAL", "300"))
+# Snapshots kept per camera (a day at the default interval)
+HEATMAP_KEEP = int(os.getenv("HEATMAP_KEEP", "288"))
+
+# Rescale the stored grid once pending decay weights grow this large
+_RENORMALIZE_AT = 1e12
+
+
+class Heatmap:
+    """Occupancy of one camera view on a fixed low-resolution grid.
+
+    Layer 0 counts every detection, layers 1.. one class each. Memory is fixed at
+    construction. Decay is applied lazily: new points are added with weight
+    2^(t / half_life) and reads scale by 2^(-t / half_life), so an update touches
+    only the cells of that frame's boxes.
+    """
+
+    def __init__(self, grid: Tuple[int, int] = HEATMAP_GRID, max_classes: int = HEATMAP_MAX_CLASSES,
+                 half_life: float = HEATMAP_HALF_LIFE):
+        self.width, self.height = grid
+        self.max_classes = max_classes
+        self.half_life = half_life
+        self.grid = np.zeros((1 + max_classes, self.height, self.width), dtype=np.float64)
+        self._flat = self.grid.reshape(-1)
+        self.layers: Dict[str, int] = {}
+        self.detections = 0
+        self.frames = 0
+        self.started = time.time()
+        self._origin = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return self.grid.nbytes
+
+    def _weight(self, now: float) -> float:
+        if self.half_life <= 0:
+            return 1.0
+        return 2.0 ** ((now - self._origin) / self.half_life)
+
+    def _layer(self, label: str) -> int:
+        layer = self.layers.get(label)
+        if layer is None and len(self.layers) < self.max_classes:
+            layer = self.layers[label] = len(self.layers) + 1
+        return layer or 0
+
+    def add(self, detections: List, frame_shape: Tuple[int, ...]):
+        """Bin one frame's box centres into the total and per-class layers"""
+        self.frames += 1
+        if not detections:
+            return
+        frame_h, frame_w = frame_shape[:2]
+        boxes = np.array([d.bbox for d in detections], dtype=np.float32)
+        xs = np.clip(((boxes[:, 0] + boxes[:, 2] * 0.5) * (self.width / frame_w)).astype(np.intp), 0, self.width - 1)
+        ys = np.clip(((boxes[:, 1] + boxes[:, 3] * 0.5) * (self.height / frame_h)).astype(np.intp), 0, self.height - 1)
+        cells = ys * self.width + xs
+        layers = np.array([self._layer(d.label) for d in detections], dtype=np.intp)
+
+        plane = self.width * self.height
+        per_class = layers > 0
+        index = np.concatenate((cells, layers[per_class] * plane + cells[per_class]))
+
+        now = time.monotonic()
+        weight = self._weight(now)
+        if weight > _RENORMALIZE_AT:
+            self.grid /= weight
+            self._origin = now
+            weight = 1.0
+        np.add.at(self._flat, index, weight)
+        self.detections += len(detections)
+
+    def snapshot(self, label: Optional[str] = None) -> np.ndarray:
+        """Current (decayed) values of the total or one class layer, as float32"""
+        layer = 0 if label is None else self.layers.get(label)
+        if layer is None:
+            return np.zeros((self.height, self.width), dtype=np.float32)
+        return (self.grid[layer] / self._weight(time.monotonic())).astype(np.float32)
+
+    def render_png(self, label: Optional[str] = None, scale: int = 10) -> bytes:
+        values = self.snapshot(label)
+        peak = float(values.max())
+        normalized = (values / peak * 255.0 if peak > 0 else values).astype(np.uint8)
+        scale = min(max(int(scale), 1), 40)
+        image = cv2.resize(cv2.applyColorMap(normalized, cv2.COLORMAP_JET),
+                           (self.width * scale, self.height * scale), interpolation=cv2.INTER_LINEAR)
+        ok, encoded = cv2.imencode(".png", image)
+        return encoded.tobytes() if ok else b""
+
+    def to_npy(self, label: Optional[str] = None) -> bytes:
+        buffer = io.BytesIO()
+        np.save(buffer, self.snapshot(label))
+        return buffer.getvalue()
+
+    def save(self, path: str):
+        """All layers plus their labels as .npz"""
+        weight = self._weight(time.monotonic())
+        labels = ["all"] + sorted(self.layers, key=self.layers.get)
+        np.savez_compressed(path, layers=(self.grid[:len(labels)] / weight).astype(np.float32),
+                            labels=np.array(labels), started=self.started, saved=time.time(),
+                            half_life=self.half_life)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Heatmap":
+        """A saved snapshot, e.g. one written by a cluster worker"""
+        with np.load(path) as data:
+            layers, labels = data["layers"], [str(label) for label in data["labels"]]
+            heatmap = cls((layers.shape[2], layers.shape[1]), max(len(labels) - 1, 0), 0.0)
+            heatmap.grid[:] = layers
+            heatmap.layers = {label: index for index, label in enumerate(labels) if index}
+            heatmap.started = float(data["started"])
+        return heatmap
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "grid": [self.width, self.height],
+            "labels": sorted(self.layers, key=self.layers.get),
+            "half_life": self.half_life,
+            "frames": self.frames,
+            "detections": self.detections,
+            "bytes": self.nbytes,
+            "started": self.started,
+        }
+
+
+def _camera_dir(directory: str, camera_id: str) -> str:
+    return os.path.join(directory, camera_id.replace(os.sep, "_"))
+
+
+def load_latest(camera_id: str, directory: str = HEATMAP_DIR) -> Optional[Heatmap]:
+    camera_dir = _camera_dir(directory, camera_id)
+    if not os.path.isdir(camera_dir):
+        return None
+    snapshots = sorted(name for name in os.listdir(camera_dir) if name.endswith(".npz"))
+    return Heatmap.from_file(os.path.join(camera_dir, snapshots[-1])) if snapshots else None
+
+
+def snapshot_heatmaps(heatmaps: Dict[str, Heatmap], directory: str = HEATMAP_DIR) -> List[str]:
+    """Write every camera's heatmap to <directory>/<camera>/<timestamp>.npz (run off the event loop)"""
+    paths = []
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    for camera_id, heatmap in list(heatmaps.items()):
+        camera_dir = _camera_dir(directory, camera_id)
+        os.makedirs(camera_dir, exist_ok=True)
+        path = os.path.join(camera_dir, f"{stamp}.npz")
+        try:
+            heatmap.save(path)
+            paths.append(path)
+            snapshots = sorted(name for name in os.listdir(camera_dir) if name.endswith(".npz"))
+            for name in snapshots[:max(len(snapshots) - HEATMAP_KEEP, 0)]:
+                os.remove(os.path.join(camera_dir, name))
+        except OSError as e:
+            logger.error(f"Failed to snapshot heatmap for {camera_id}: {e}")
+    return paths
+
+
+async def snapshot_loop(heatmaps: Dict[str, Heatmap], interval: float = HEATMAP_SNAPSHOT_INTERVAL):
+    """Periodically write heatmaps to disk from a worker thread; runs until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        if heatmaps:
+            await loop.run_in_executor(None, snapshot_heatmaps, heatmaps)
@@ -0,0 +1,138 @@
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Rows kept per camera; memory per camera is capacity * HISTORY_DTYPE.itemsize (38 bytes)
+DETECTION_HISTORY_CAPACITY = int(os.getenv("DETECTION_HISTORY_CAPACITY", "50000"))
+
+HISTORY_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('frame', 'u4'),
+    ('class_id', 'i2'),
+    ('confidence', 'f4'),
+    ('bbox', 'f4', (4,)),  # x, y, w, h in frame pixels
+    ('track_id', 'i4'),  # -1 until detections are tracked
+])
+
+
+class DetectionHistory:
+    """Fixed-capacity per-camera detection log in a preallocated NumPy structured array.
+
+    New rows overwrite the oldest ones circularly, so memory never grows past
+    `nbytes`. Queries are vectorized over the filled part of the buffer; row
+    order doesn't matter to them, only timestamps do.
+    """
+
+    def __init__(self, capacity: int = DETECTION_HISTORY_CAPACITY):
+        self.capacity = capacity
+        self._rows = np.zeros(capacity, dtype=HISTORY_DTYPE)
+        self._next = 0
+        self._size = 0
+        self._frame = 0
+        self.total = 0
+        self.labels: Dict[int, str] = {}
+
+    @property
+    def nbytes(self) -> int:
+        return self._rows.nbytes
+
+    def __len__(self):
+        return self._size
+
+    def append(self, detections: List, timestamp: Optional[float] = None):
+        """Store one analysed frame's detections"""
+        self._frame += 1
+        count = len(detections)
+        if not count:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+
+        batch = np.empty(count, dtype=HISTORY_DTYPE)
+        batch['timestamp'] = timestamp
+        batch['frame'] = self._frame
+        batch['class_id'] = [d.class_id for d in detections]
+        batch['confidence'] = [d.confidence for d in detections]
+        batch['bbox'] = [d.bbox for d in detections]
+        batch['track_id'] = [getattr(d, 'track_id', -1) for d in detections]
+        for d in detections:
+            self.labels[d.class_id] = d.label
+
+        if count > self.capacity:
+            batch = batch[-self.capacity:]
+            count = self.capacity
+        end = self._next + count
+        if end <= self.capacity:
+            self._rows[self._next:end] = batch
+        else:
+            first = self.capacity - self._next
+            self._rows[self._next:] = batch[:first]
+            self._rows[:count - first] = batch[first:]
+        self._next = end % self.capacity
+        self._size = min(self._size + count, self.capacity)
+        self.total += count
+
+    def _window(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        rows = self._rows[:self._size]
+        mask = np.ones(self._size, dtype=bool)
+        if start is not None:
+            mask &= rows['timestamp'] >= start
+        if end is not None:
+            mask &= rows['timestamp'] <= end
+        return rows[mask]
+
+    def _label(self, class_id: int) -> str:
+        return self.labels.get(int(class_id), str(class_id))
+
+    def counts_by_class(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, int]:
+        """Detections per class in the window (object-frames, not unique objects)"""
+        rows = self._window(start, end)
+        if not len(rows):
+            return {}
+        class_ids, counts = np.unique(rows['class_id'], return_counts=True)
+        return {self._label(c): int(n) for c, n in zip(class_ids, counts)}
+
+    def max_occupancy(self, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, Any]:
+        """Most objects seen in a single frame in the window, overall and per class"""
+        rows = self._window(start, end)
+        if not len(rows):
+            return {'total': 0, 'at': None, 'by_class': {}}
+
+        frames, per_frame = np.unique(rows['frame'], return_counts=True)
+        busiest = int(per_frame.argmax())
+        busiest_at = rows['timestamp'][rows['frame'] == frames[busiest]][0]
+
+        # Count (frame, class) pairs once, then take the max per class
+        pairs, pair_counts = np.unique(
+            rows['frame'].astype(np.int64) << 16 | (rows['class_id'].astype(np.int64) & 0xFFFF),
+            return_counts=True,
+        )
+        pair_classes = (pairs & 0xFFFF).astype(np.int16)
+        by_class = {}
+        for class_id in np.unique(pair_classes):
+            by_class[self._label(class_id)] = int(pair_counts[pair_classes == class_id].max())
+        return {'total': int(per_frame[busiest]), 'at': float(busiest_at), 'by_class': by_class}
+
+    def between(self, start: float, end: float, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Detections between two timestamps, oldest first"""
+        rows = self._window(start, end)
+        rows = rows[np.argsort(rows['timestamp'], kind='stable')][-limit:]
+        return [{
+            'timestamp': float(row['timestamp']),
+            'label': self._label(row['class_id']),
+            'class_id': int(row['class_id']),
+            'confidence': round(float(row['confidence']) * 100, 2),
+            'bbox': [round(float(v), 1) for v in row['bbox']],
+            'track_id': int(row['track_id']),
+        } for row in rows]
+
+    def describe(self) -> Dict[str, Any]:
+        oldest = float(self._rows['timestamp'][:self._size].min()) if self._size else None
+        return {
+            'capacity': self.capacity,
+            'rows': self._size,
+            'bytes': self.nbytes,
+            'total_appended': self.total,
+            'oldest': oldest,
+        }
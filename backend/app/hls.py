@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+import logging
+
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Upstream responses kept in memory, shared by /proxy viewers and HLS analysers
+HLS_CACHE_MB = float(os.getenv("HLS_CACHE_MB", "64"))
+# Live playlists change every segment; within this many seconds all readers share one fetch
+HLS_PLAYLIST_TTL = float(os.getenv("HLS_PLAYLIST_TTL", "1.0"))
+# Segments never change; keep them about as long as a live window
+SEGMENT_TTL = 120.0
+FETCH_TIMEOUT = 20.0
+# Many ATCS origins reject unknown clients
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/124.0 Safari/537.36")
+
+
+def is_playlist(url: str) -> bool:
+    return urlparse(url).path.endswith(".m3u8")
+
+
+class Fetched:
+    __slots__ = ("status", "content", "content_type", "fetched_at")
+
+    def __init__(self, status: int, content: bytes, content_type: str, fetched_at: float):
+        self.status = status
+        self.content = content
+        self.content_type = content_type
+        self.fetched_at = fetched_at
+
+
+class Playlist:
+    """The parts of an HLS playlist the analyser needs"""
+
+    def __init__(self, text: str, url: str):
+        self.url = url
+        self.variants: List[Tuple[int, str]] = []  # (bandwidth, url) of a master playlist
+        self.segments: List[Tuple[int, str]] = []  # (media sequence, url)
+        self.target_duration = 2.0
+        self.ended = False
+        self.encrypted = False
+        self.fragmented = False  # fMP4 segments (#EXT-X-MAP) need an init segment
+
+        sequence = 0
+        bandwidth = None
+        expect_segment = False
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                sequence = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-TARGETDURATION:"):
+                self.target_duration = float(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-STREAM-INF:"):
+                bandwidth = 0
+                for attribute in line.split(":", 1)[1].split(","):
+                    if attribute.startswith("BANDWIDTH="):
+                        bandwidth = int(attribute.split("=", 1)[1])
+            elif line.startswith("#EXTINF"):
+                expect_segment = True
+            elif line.startswith("#EXT-X-KEY") and "METHOD=NONE" not in line:
+                self.encrypted = True
+            elif line.startswith("#EXT-X-MAP"):
+                self.fragmented = True
+            elif line == "#EXT-X-ENDLIST":
+                self.ended = True
+            elif not line.startswith("#"):
+                if bandwidth is not None:
+                    self.variants.append((bandwidth, urljoin(url, line)))
+                    bandwidth = None
+                elif expect_segment:
+                    self.segments.append((sequence, urljoin(url, line)))
+                    sequence += 1
+                    expect_segment = False
+
+
+class HLSFetcher:
+    """Upstream HLS fetches shared by the /proxy endpoint and HLS analysers.
+
+    Concurrent requests for one URL share a single upstream request, and 200
+    responses are cached (playlists for HLS_PLAYLIST_TTL, segments longer) in
+    an LRU bounded by HLS_CACHE_MB. So however many viewers and analysers a
+    camera has, each playlist refresh and each segment leaves this backend once.
+    """
+
+    def __init__(self, cache_mb: float = HLS_CACHE_MB, playlist_ttl: float = HLS_PLAYLIST_TTL):
+        self.cache_bytes = int(cache_mb * 1024 * 1024)
+        self.playlist_ttl = playlist_ttl
+        self._cache: "OrderedDict[str, Fetched]" = OrderedDict()
+        self._cached_bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.upstream = 0
+        self.hits = 0
+        self.shared = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # Be tolerant to upstream TLS/cert issues and redirects often present in CCTV origins
+            self._client = httpx.AsyncClient(verify=False, follow_redirects=True, timeout=FETCH_TIMEOUT,
+                                             headers={"User-Agent": USER_AGENT})
+        return self._client
+
+    async def fetch(self, url: str) -> Fetched:
+        ttl = self.playlist_ttl if is_playlist(url) else SEGMENT_TTL
+        entry = self._cache.get(url)
+        if entry is not None and time.monotonic() - entry.fetched_at < ttl:
+            self._cache.move_to_end(url)
+            self.hits += 1
+            metrics.proxy_cache_total.labels("hit").inc()
+            return entry
+
+        task = self._inflight.get(url)
+        if task is not None:
+            self.shared += 1
+            metrics.proxy_cache_total.labels("hit").inc()
+        else:
+            metrics.proxy_cache_total.labels("miss").inc()
+            # Its own task: a reader that goes away doesn't cancel the fetch for the others
+            task = self._inflight[url] = asyncio.ensure_future(self._fetch_upstream(url))
+        return await asyncio.shield(task)
+
+    async def _fetch_upstream(self, url: str) -> Fetched:
+        kind = "playlist" if is_playlist(url) else "segment"
+        try:
+            started = time.perf_counter()
+            response = await self._get_client().get(url)
+            metrics.proxy_upstream_seconds.labels(kind).observe(time.perf_counter() - started)
+            self.upstream += 1
+            entry = Fetched(response.status_code, response.content,
+                            response.headers.get("content-type", "application/octet-stream"), time.monotonic())
+            if response.status_code == 200:
+                self._store(url, entry)
+            return entry
+        finally:
+            self._inflight.pop(url, None)
+
+    def _store(self, url: str, entry: Fetched):
+        previous = self._cache.pop(url, None)
+        if previous is not None:
+            self._cached_bytes -= len(previous.content)
+        if len(entry.content) > self.cache_bytes:
+            return
+        self._cache[url] = entry
+        self._cached_bytes += len(entry.content)
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted.content)
+
+    async def media_playlist(self, url: str) -> Playlist:
+        """The playlist at `url`, following a master playlist to its highest-bandwidth variant"""
+        for _ in range(3):
+            fetched = await self.fetch(url)
+            if fetched.status != 200:
+                raise OSError(f"HTTP {fetched.status} for {url}")
+            playlist = Playlist(fetched.content.decode("utf-8", "replace"), url)
+            if not playlist.variants:
+                return playlist
+            url = max(playlist.variants)[1]
+        raise OSError(f"Too many nested playlists at {url}")
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "cached": len(self._cache),
+            "cached_bytes": self._cached_bytes,
+            "inflight": len(self._inflight),
+            "upstream_fetches": self.upstream,
+            "cache_hits": self.hits,
+            "shared_fetches": self.shared,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+hls_fetcher = HLSFetcher()
@@ -0,0 +1,187 @@
+import glob
+import importlib.util
+import os
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Backend selection, e.g. INFERENCE_BACKEND=openvino INFERENCE_PRECISION=int8
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32")
+MODEL_CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+)
+
+PRECISIONS = ("fp32", "int8")
+
+
+class InferenceConfigError(ValueError):
+    """INFERENCE_BACKEND or INFERENCE_PRECISION names something that doesn't exist"""
+
+
+def artifact_path(weights: str, backend: str, precision: str = "fp32",
+                  cache_dir: str = MODEL_CACHE_DIR) -> str:
+    """Location of the exported artefact for weights/backend/precision in the model cache"""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    if backend == "onnx":
+        return os.path.join(cache_dir, f"{stem}_{precision}.onnx")
+    if backend == "openvino":
+        # OpenVINO exports are directories holding the .xml/.bin pair
+        return os.path.join(cache_dir, f"{stem}_{precision}_openvino_model")
+    raise ValueError(f"Backend {backend} has no exported artefact")
+
+
+class InferenceBackend:
+    """Runs a YOLO detector; called like the Ultralytics model and returns its Results list"""
+    name = "base"
+    requires: Optional[str] = None
+
+    def __init__(self, weights: str, precision: str = "fp32"):
+        self.weights = weights
+        self.precision = precision
+        self.model = None
+        # Square input a fixed-shape artefact was exported at; None takes any imgsz
+        self.input_size: Optional[int] = None
+        self._resized = set()
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return cls.requires is None or importlib.util.find_spec(cls.requires) is not None
+
+    @property
+    def source(self) -> str:
+        return self.weights
+
+    def load(self):
+        from ultralytics import YOLO
+
+        # task must be given for exported models, Ultralytics can't infer it from ONNX/OpenVINO files
+        self.model = YOLO(self.source, task="detect")
+        logger.info(f"Inference backend {self.name} ({self.precision}) loaded: {self.source}")
+        return self
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, frame, **kwargs):
+        return self.model(frame, **kwargs)
+
+    def fit_imgsz(self, imgsz: int) -> int:
+        """Input size to run a profile's `imgsz` at; a fixed-shape artefact only takes its own"""
+        if self.input_size is None or imgsz == self.input_size:
+            return imgsz
+        if imgsz not in self._resized:
+            self._resized.add(imgsz)
+            logger.warning(f"{self.source} has a fixed {self.input_size}px input, profiles with imgsz={imgsz} "
+                           f"run at {self.input_size}px (export with --dynamic for per-profile sizes)")
+        return self.input_size
+
+    def describe(self):
+        return {"backend": self.name, "precision": self.precision, "source": self.source,
+                "input_size": self.input_size}
+
+
+class TorchBackend(InferenceBackend):
+    """PyTorch weights through Ultralytics, the original code path"""
+    name = "torch"
+    requires = "torch"
+
+    def __init__(self, weights: str, precision: str = "fp32"):
+        if precision != "fp32":
+            logger.warning("Torch backend only runs fp32 on CPU, ignoring precision")
+        super().__init__(weights, "fp32")
+
+
+class ExportedBackend(InferenceBackend):
+    """Backend that runs an artefact produced by export_model.py"""
+
+    def __init__(self, weights: str, precision: str = "fp32", cache_dir: str = MODEL_CACHE_DIR):
+        super().__init__(weights, precision)
+        self.cache_dir = cache_dir
+
+    @property
+    def source(self) -> str:
+        return artifact_path(self.weights, self.name, self.precision, self.cache_dir)
+
+    def load(self):
+        if not os.path.exists(self.source):
+            raise FileNotFoundError(
+                f"{self.source} not found, run: python export_model.py --weights {self.weights} "
+                f"--formats {self.name} --precision {self.precision}"
+            )
+        super().load()
+        self.input_size = self._static_input_size()
+        return self
+
+    def _static_input_size(self) -> Optional[int]:
+        """Input side of the artefact, or None if it was exported with dynamic shapes"""
+        return None
+
+
+class OnnxRuntimeBackend(ExportedBackend):
+    name = "onnx"
+    requires = "onnxruntime"
+
+    def _static_input_size(self) -> Optional[int]:
+        import onnxruntime as ort
+
+        session = ort.InferenceSession(self.source, providers=["CPUExecutionProvider"])
+        height, width = session.get_inputs()[0].shape[2:4]
+        # Dynamic axes are named (strings) instead of sized
+        if isinstance(height, int) and isinstance(width, int):
+            return max(height, width)
+        return None
+
+
+class OpenVINOBackend(ExportedBackend):
+    name = "openvino"
+    requires = "openvino"
+
+    def _static_input_size(self) -> Optional[int]:
+        import openvino as ov
+
+        xml = glob.glob(os.path.join(self.source, "*.xml"))
+        if not xml:
+            return None
+        shape = ov.Core().read_model(xml[0]).inputs[0].get_partial_shape()
+        if shape.is_dynamic:
+            return None
+        return max(shape[2].get_length(), shape[3].get_length())
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+    OpenVINOBackend.name: OpenVINOBackend,
+}
+
+
+def create_backend(weights: str, backend: Optional[str] = None,
+                   precision: Optional[str] = None) -> InferenceBackend:
+    """Load the configured backend, falling back to PyTorch when it can't be used.
+
+    A backend or precision name that doesn't exist is a configuration error and
+    raises InferenceConfigError instead of falling back.
+    """
+    backend = (backend or INFERENCE_BACKEND).lower()
+    precision = (precision or INFERENCE_PRECISION).lower()
+
+    backend_cls = BACKENDS.get(backend)
+    if backend_cls is None:
+        raise InferenceConfigError(f"Unknown inference backend: {backend} (choose from {', '.join(BACKENDS)})")
+    if precision not in PRECISIONS:
+        raise InferenceConfigError(f"Unknown precision: {precision} (choose from {', '.join(PRECISIONS)})")
+
+    if backend_cls is not TorchBackend:
+        if not backend_cls.is_available():
+            logger.warning(f"{backend_cls.requires} not installed, using torch backend")
+        else:
+            try:
+                return backend_cls(weights, precision).load()
+            except Exception as e:
+                logger.warning(f"Failed to load {backend} backend: {e}. Using torch backend")
+
+    return TorchBackend(weights).load()
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_POLL_SECONDS = 60.0
+
+
+class _Entry:
+    __slots__ = ("seq", "message", "updated", "_body")
+
+    def __init__(self, seq: int, message: str, updated: float):
+        self.seq = seq
+        self.message = message
+        self.updated = updated
+        self._body: Optional[bytes] = None
+
+    def body(self, camera_id: str) -> bytes:
+        # Built on first read, so updates nobody reads cost nothing extra
+        if self._body is None:
+            self._body = (f'{{"cctv_id": {json.dumps(camera_id)}, "seq": {self.seq}, "updated": {self.updated}, '
+                          f'"result": {self.message}}}').encode()
+        return self._body
+
+
+class LatestResults:
+    """Latest serialized detection result per camera, with a per-camera sequence number.
+
+    Readers cost a dict lookup. Long-pollers of a camera all wait on one Event
+    that the next update sets, so waking them doesn't scale with their number
+    on the pipeline side.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, _Entry] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        # ETags stay unique across restarts, when sequence numbers start again at 1
+        self.epoch = format(int(time.time()), "x")
+        self.updates = 0
+
+    def update(self, camera_id: str, message: str):
+        entry = self.entries.get(camera_id)
+        self.entries[camera_id] = _Entry(entry.seq + 1 if entry else 1, message, time.time())
+        self.updates += 1
+        event = self._events.pop(camera_id, None)
+        if event is not None:
+            event.set()
+
+    def get(self, camera_id: str) -> Optional[_Entry]:
+        return self.entries.get(camera_id)
+
+    def etag(self, entry: _Entry) -> str:
+        return f'"{self.epoch}-{entry.seq}"'
+
+    async def wait_newer(self, camera_id: str, since: int, timeout: float) -> Optional[_Entry]:
+        """Entry newer than `since`, waiting up to `timeout` seconds for one"""
+        deadline = time.monotonic() + min(max(timeout, 0.0), MAX_POLL_SECONDS)
+        while True:
+            entry = self.entries.get(camera_id)
+            # A `since` ahead of us comes from before a restart: answer right away
+            if entry is not None and entry.seq != since:
+                return entry
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            event = self._events.get(camera_id)
+            if event is None:
+                event = self._events[camera_id] = asyncio.Event()
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"cameras": len(self.entries), "updates": self.updates,
+                "cameras_polled": len(self._events)}
+
+
+latest_results = LatestResults()
@@ -0,0 +1,180 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from metrics import log_records_dropped_total
+
+# json (one object per line) or text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-module levels, e.g. "object_detection=DEBUG,bus=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Records waiting for the writer thread; beyond this they are dropped, never blocking the caller
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Seconds between two records from one rate-limited log site (per key)
+LOG_RATE_INTERVAL = float(os.getenv("LOG_RATE_INTERVAL", "10"))
+# Per-frame debug records: one in this many frames
+LOG_FRAME_SAMPLE = int(os.getenv("LOG_FRAME_SAMPLE", "100"))
+
+camera_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("camera_id", default=None)
+session_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_DroppingQueueHandler"] = None
+
+
+_plain = logging.Formatter()
+
+
+class _ContextFilter(logging.Filter):
+    """Stamp records with the camera and session of the task that logged them"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "camera_id", None) is None:
+            record.camera_id = camera_id_var.get()
+        if getattr(record, "session_id", None) is None:
+            record.session_id = session_id_var.get()
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; a full queue drops them instead of blocking"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now (they may change later); keep the traceback apart for the formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _plain.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            log_records_dropped_total.inc()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "camera_id", None):
+            entry["camera_id"] = record.camera_id
+        if getattr(record, "session_id", None):
+            entry["session_id"] = record.session_id
+        if record.exc_text or record.exc_info:
+            entry["exc"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s%(context)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = [value for value in (getattr(record, "camera_id", None), getattr(record, "session_id", None))
+                   if value]
+        record.context = f" [{' '.join(context)}]" if context else ""
+        return super().format(record)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, levels: str = LOG_LEVELS):
+    """Route all logging through a queue to one writer thread; safe to call more than once"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = _DroppingQueueHandler(log_queue)
+    _handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level.upper())
+    for item in filter(None, (part.strip() for part in levels.split(","))):
+        name, _, value = item.partition("=")
+        logging.getLogger(name.strip()).setLevel(value.strip().upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def set_level(name: Optional[str], level: str):
+    """Change a logger's level at runtime (root when `name` is empty); raises ValueError"""
+    value = logging.getLevelName(level.upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level {level}")
+    logging.getLogger(name or None).setLevel(value)
+
+
+def get_levels() -> Dict[str, Any]:
+    """Root level, loggers with their own level, and records dropped by the queue"""
+    loggers = {name: logging.getLevelName(logger.level)
+               for name, logger in sorted(logging.root.manager.loggerDict.items())
+               if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET}
+    return {
+        "root": logging.getLevelName(logging.getLogger().level),
+        "loggers": loggers,
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+    }
+
+
+class LogLimiter:
+    """Gate for a log site on a per-frame path.
+
+    Lets a record through at most once per `interval` seconds per key (usually
+    the camera id) and, with `sample` > 1, only every Nth call. Calls held back
+    are counted and reported on the next record that gets through. Disabled
+    levels return before any formatting.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = LOG_RATE_INTERVAL, sample: int = 1):
+        self.logger = logger
+        self.interval = interval
+        self.sample = max(int(sample), 1)
+        self._sites: Dict[Any, list] = {}  # key -> [last emitted (monotonic), calls, suppressed]
+
+    def log(self, level: int, key: Any, msg: str, *args, **kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        site = self._sites.get(key)
+        if site is None:
+            site = self._sites[key] = [float("-inf"), 0, 0]
+        site[1] += 1
+        now = time.monotonic()
+        if site[1] % self.sample or now - site[0] < self.interval:
+            site[2] += 1
+            return
+        if site[2]:
+            msg = f"{msg} (%d similar suppressed)"
+            args = args + (site[2],)
+        site[0], site[2] = now, 0
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def forget(self, key: Any):
+        self._sites.pop(key, None)
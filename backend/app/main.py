@@ -1,7 +1,6 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, Response
-import httpx
+from fastapi.responses import FileResponse, Response
 import json
 import os
 import logging
@@ -9,16 +8,20 @@ from urllib.parse import urljoin, quote, urlparse
 import asyncio
 import time
 import sys
-
-# Setup logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+import uuid
 
 # Add current directory to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
+# Setup logging: records go through a queue to a writer thread, never blocking the event loop
+from log_config import LogLimiter, camera_id_var, configure_logging, get_levels, session_id_var, set_level
+configure_logging()
+logger = logging.getLogger(__name__)
+# Per-message log sites in the WebSocket handlers
+message_log = LogLimiter(logger)
+
 # Try to import object detection module
 try:
     from object_detection import detector
@@ -29,17 +32,83 @@ except ImportError as e:
     DETECTOR_AVAILABLE = False
     # Create a mock detector
     class MockDetector:
+        is_ready = True
+        model_state = 'ready'
+        def load_model(self):
+            pass
         def stop(self):
             pass
         def get_statistics(self):
             return {"error": "Object detection not available"}
-        def process_stream(self, url, websocket):
+        def process_stream(self, url, websocket, cctv_id=None, camera=None):
             return asyncio.sleep(1)
     
     detector = MockDetector()
 
+import metrics
+from admission import CapacityError, admission
+from bus import create_bus
+from cluster import ASSIGNMENTS_TOPIC, detections_topic
+from dashboard import Dashboard, DashboardHub
+from heatmap import load_latest, snapshot_loop
+from hls import hls_fetcher
+from latest import latest_results
+from profiles import profile_registry
+from profiling import ProfilerBusy, profiler
+from recording import clip_path, get_clip, list_clips
+from schemas import InferenceProfileAssignment, InferenceProfileConfig
+
 app = FastAPI(title="Smart CCTV Analytics", version="1.0.0")
 
+# Load the detection model in the background so /health answers immediately.
+# Set DETECTOR_PRELOAD=0 to load it on the first detection session instead.
+DETECTOR_PRELOAD = os.getenv("DETECTOR_PRELOAD", "1") != "0"
+# local: each viewer WebSocket runs its pipeline in this process.
+# cluster: pipelines run on run_cluster.py workers; viewers get their results from BUS_URL.
+DETECTION_MODE = os.getenv("DETECTION_MODE", "local")
+bus = create_bus()
+cluster_state = {}
+if DETECTOR_AVAILABLE:
+    detector.bus = bus
+
+
+async def watch_cluster():
+    subscription = bus.subscribe(ASSIGNMENTS_TOPIC)
+    try:
+        async for _, data in subscription:
+            cluster_state.update(json.loads(data))
+    finally:
+        subscription.close()
+
+
+async def feed_latest_results():
+    """Cluster mode: cache the workers' detection results as they pass through the bus"""
+    subscription = bus.subscribe("detections.*", maxsize=8192)
+    prefix = len("detections.")
+    try:
+        async for topic, data in subscription:
+            # Skip stream_status and error messages without parsing them
+            if data.startswith('{"type": "detection_results"'):
+                latest_results.update(topic[prefix:], data)
+    finally:
+        subscription.close()
+
+
+@app.on_event("startup")
+async def preload_detector():
+    app.state.loop_lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag())
+    await bus.start()
+    if DETECTION_MODE == "cluster":
+        app.state.cluster_watcher = asyncio.create_task(watch_cluster())
+        app.state.latest_feed = asyncio.create_task(feed_latest_results())
+        logger.info("Cluster mode: detection runs on workers, results come from the message bus")
+    elif DETECTOR_AVAILABLE:
+        app.state.heatmap_snapshots = asyncio.create_task(snapshot_loop(detector.heatmaps))
+    if DETECTION_MODE != "cluster" and DETECTOR_AVAILABLE and DETECTOR_PRELOAD:
+        loop = asyncio.get_running_loop()
+        app.state.model_loader = loop.run_in_executor(None, detector.load_model)
+        logger.info("Detection model loading in background")
+
 # Add a simple test route first
 @app.get("/test-simple")
 def test_simple():
@@ -64,7 +133,7 @@ app.add_middleware(
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CCTV_FILE = os.path.join(BASE_DIR, "cctv.json")
+CCTV_FILE = os.getenv("CCTV_FILE", os.path.join(BASE_DIR, "cctv.json"))
 
 # Log startup information
 logger.info(f"FastAPI app starting...")
@@ -102,16 +171,32 @@ def get_cctv_detail(cctv_id: str):
 # Health check endpoint
 @app.get("/health")
 def health_check():
-    """Health check endpoint"""
+    """Liveness plus readiness: the process is up even while the model is still loading"""
     return {
         "status": "healthy",
         "timestamp": time.time(),
         "backend": "running",
         "websocket_support": True,
-        "detector_available": DETECTOR_AVAILABLE
+        "detector_available": DETECTOR_AVAILABLE,
+        "ready": detector.is_ready,
+        "model_state": detector.model_state
     }
 
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of the pipeline, proxy and event-loop metrics"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/health/ready")
+def readiness_check():
+    """Readiness probe: 503 until the detection model is loaded and warmed up"""
+    if not detector.is_ready:
+        raise HTTPException(status_code=503, detail=f"Model {detector.model_state}")
+    return {"ready": True, "timestamp": time.time()}
+
+
 # Debug endpoint untuk test WebSocket
 @app.get("/debug/websocket")
 def debug_websocket():
@@ -179,12 +264,18 @@ async def websocket_test(websocket: WebSocket):
 # WebSocket endpoint untuk object detection
 @app.websocket("/ws/detection/{cctv_id}")
 async def websocket_detection(websocket: WebSocket, cctv_id: str):
-    logger.info(f"=== WebSocket connection attempt for CCTV: {cctv_id} ===")
+    # Every record of this session (and of its pipeline task) carries the camera and session id
+    camera_id_var.set(cctv_id)
+    session_id_var.set(uuid.uuid4().hex[:12])
+    logger.info("Detection WebSocket connecting")
+    subscribed = False
     
     try:
         # Accept connection
         await websocket.accept()
-        logger.info(f"WebSocket accepted for CCTV: {cctv_id}")
+        metrics.active_subscribers.inc()
+        subscribed = True
+        logger.debug("WebSocket accepted")
         
         # Test connection dengan ping
         try:
@@ -193,10 +284,7 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
                 "message": "Connection established",
                 "timestamp": time.time()
             })
-            logger.info(f"Sending ping message: {ping_message}")
-            
             await websocket.send_text(ping_message)
-            logger.info(f"Ping sent successfully to CCTV: {cctv_id}")
             
         except Exception as ping_error:
             logger.error(f"Failed to send ping to CCTV {cctv_id}: {ping_error}")
@@ -204,8 +292,6 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
         
         # Ambil data CCTV
         try:
-            logger.info(f"Reading CCTV file: {CCTV_FILE}")
-            
             if not os.path.exists(CCTV_FILE):
                 logger.error(f"CCTV file not found: {CCTV_FILE}")
                 await websocket.send_text(json.dumps({
@@ -218,7 +304,6 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
                 data = json.load(f)
             
             devices = data.get("devices", [])
-            logger.info(f"Found {len(devices)} devices in CCTV file")
             
             cctv = None
             for c in devices:
@@ -234,33 +319,60 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
                 }))
                 return
             
-            logger.info(f"Found CCTV: {cctv.get('name', cctv_id)}")
-            logger.info(f"Stream URL: {cctv.get('link')}")
+            logger.debug("Found CCTV %s, stream %s", cctv.get('name', cctv_id), cctv.get('link'))
             
             # Kirim info CCTV
             cctv_info = json.dumps({
                 "type": "cctv_info",
                 "data": cctv
             })
-            logger.info(f"Sending CCTV info: {cctv_info}")
-            
             await websocket.send_text(cctv_info)
-            logger.info(f"CCTV info sent for: {cctv_id}")
             
             # Mulai object detection dalam background task
-            logger.info(f"Creating detection task for CCTV: {cctv_id}")
-            
-            if DETECTOR_AVAILABLE:
+            if DETECTION_MODE == "cluster":
+                await forward_from_bus(websocket, cctv_id)
+            elif DETECTOR_AVAILABLE:
+                # Admission control: mulai sekarang, antre sesuai prioritas, atau tolak
+                async def report_queued(position):
+                    await websocket.send_text(json.dumps({
+                        "type": "capacity",
+                        "state": "queued",
+                        "position": position,
+                        "timestamp": time.time()
+                    }))
+
+                try:
+                    ticket = await admission.admit(cctv_id, int(cctv.get("priority") or 0),
+                                                   profile_registry.resolve(cctv).target_fps,
+                                                   on_queued=report_queued)
+                except CapacityError as capacity_error:
+                    logger.warning(f"Detection session for {cctv_id} rejected: {capacity_error.reason}")
+                    await websocket.send_text(json.dumps({
+                        "type": "capacity",
+                        "state": "rejected",
+                        "reason": capacity_error.reason,
+                        "retry_after": capacity_error.retry_after,
+                        "message": "Detection capacity reached, try again later",
+                        "timestamp": time.time()
+                    }))
+                    await websocket.close(code=1013)  # Try Again Later
+                    return
+
                 detection_task = asyncio.create_task(
-                    detector.process_stream(cctv["link"], websocket)
+                    detector.process_stream(cctv["link"], websocket, cctv_id=cctv_id, camera=cctv, ticket=ticket)
                 )
-                logger.info(f"Detection task created for CCTV: {cctv_id}")
+                # Viewer tidak mengirim apa-apa; receive() hanya untuk tahu kapan ia disconnect
+                watcher = asyncio.create_task(wait_for_disconnect(websocket))
+                logger.info("Detection task started")
                 
                 # Tunggu task selesai atau WebSocket disconnect
                 try:
-                    logger.info(f"Waiting for detection task to complete...")
-                    await detection_task
-                    logger.info(f"Detection task completed for CCTV: {cctv_id}")
+                    await asyncio.wait({detection_task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                    if detection_task.done():
+                        await detection_task
+                        logger.info(f"Detection task completed for CCTV: {cctv_id}")
+                    else:
+                        logger.info(f"Viewer of CCTV {cctv_id} disconnected, stopping its pipeline")
                 except asyncio.CancelledError:
                     logger.info(f"Detection task cancelled for CCTV: {cctv_id}")
                 except Exception as e:
@@ -272,6 +384,15 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
                         }))
                     except Exception as send_error:
                         logger.error(f"Failed to send error message: {send_error}")
+                finally:
+                    watcher.cancel()
+                    try:
+                        # Hanya pipeline sesi ini; viewer lain (juga untuk kamera yang sama) tetap jalan
+                        if not detection_task.done():
+                            detection_task.cancel()
+                            await asyncio.gather(detection_task, return_exceptions=True)
+                    finally:
+                        admission.release(ticket)
             else:
                 logger.info(f"Using mock detector for CCTV: {cctv_id}")
                 # Send mock detections with keep-alive
@@ -308,7 +429,7 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
                             "total_objects": 1
                         }
                         await websocket.send_text(json.dumps(mock_data))
-                        logger.info(f"Mock detection sent for CCTV: {cctv_id}")
+                        message_log.log(logging.DEBUG, cctv_id, "Mock detection sent")
                         
                     except Exception as e:
                         logger.error(f"Failed to send mock detection: {e}")
@@ -333,11 +454,9 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
                 "message": f"Error reading CCTV data: {str(cctv_error)}"
             }))
         
+    # Pipeline dan tiket admission sesi ini sudah dilepas di atas; pipeline kamera lain tidak disentuh
     except WebSocketDisconnect as disconnect_error:
-        logger.info(f"WebSocket disconnected for CCTV: {cctv_id}")
-        logger.info(f"Disconnect code: {disconnect_error.code}")
-        logger.info(f"Disconnect reason: {disconnect_error.reason}")
-        detector.stop()
+        logger.info("WebSocket disconnected (code %s, reason %r)", disconnect_error.code, disconnect_error.reason)
     except Exception as e:
         logger.error(f"WebSocket error for CCTV {cctv_id}: {e}")
         try:
@@ -347,9 +466,108 @@ async def websocket_detection(websocket: WebSocket, cctv_id: str):
             }))
         except:
             pass  # WebSocket mungkin sudah closed
-        detector.stop()
+    finally:
+        if subscribed:
+            metrics.active_subscribers.dec()
     
-    logger.info(f"=== WebSocket handler completed for CCTV: {cctv_id} ===")
+    logger.debug("WebSocket handler completed")
+
+
+async def wait_for_disconnect(websocket: WebSocket):
+    """Return once the viewer goes away; anything it sends is ignored"""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+    except (WebSocketDisconnect, RuntimeError):
+        return
+
+
+async def forward_from_bus(websocket: WebSocket, cctv_id: str):
+    """Relay the camera's worker output to this viewer until either side goes away"""
+    subscription = bus.subscribe(detections_topic(cctv_id))
+
+    async def forward():
+        async for _, data in subscription:
+            await websocket.send_text(data)
+
+    async def receive():
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(receive())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not task.cancelled() and isinstance(task.exception(), Exception) \
+                    and not isinstance(task.exception(), WebSocketDisconnect):
+                logger.error(f"Relay for CCTV {cctv_id} failed: {task.exception()}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
+
+
+# Dashboard kota: satu WebSocket untuk banyak kamera, hanya counter agregat per tick
+dashboard_hub = DashboardHub(bus, CCTV_FILE)
+
+
+def _split(value: str):
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+@app.websocket("/ws/dashboard")
+async def websocket_dashboard(websocket: WebSocket, cameras: str = "", categories: str = ""):
+    """Aggregated counters and status for a set of cameras and/or categories (all when empty).
+
+    Send {"cameras": [...], "categories": [...]} at any time to change the subscription.
+    """
+    await websocket.accept()
+    dashboard = Dashboard(websocket, _split(cameras), _split(categories))
+    dashboard_hub.add(dashboard)
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            dashboard.subscribe(message.get("cameras") or [], message.get("categories") or [])
+    except WebSocketDisconnect:
+        pass
+    except (ValueError, AttributeError) as e:
+        logger.error(f"Invalid dashboard subscription: {e}")
+    finally:
+        dashboard_hub.remove(dashboard)
+
+
+@app.get("/dashboard/stats")
+def get_dashboard_stats():
+    return dashboard_hub.get_stats()
+
+
+# Kapasitas deteksi: batas pipeline, budget fps inference, memori, antrean
+@app.get("/capacity")
+def get_capacity():
+    return admission.get_stats()
+
+
+# Level log per modul saat runtime, mis. POST /admin/log-level?logger=object_detection&level=DEBUG
+@app.get("/admin/log-level")
+def get_log_levels():
+    return get_levels()
+
+
+@app.post("/admin/log-level")
+def update_log_level(level: str, logger_name: str = Query(None, alias="logger")):
+    try:
+        set_level(logger_name, level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_levels()
+
+
+# Status cluster (assignment kamera per worker, dari coordinator)
+@app.get("/cluster")
+def get_cluster_status():
+    return {"mode": DETECTION_MODE, "bus": bus.describe(), "coordinator": cluster_state or None}
 
 
 # Endpoint untuk mendapatkan statistik detection
@@ -358,6 +576,140 @@ def get_detection_stats():
     return detector.get_statistics()
 
 
+# Endpoint untuk riwayat deteksi per kamera (ring buffer berukuran tetap)
+@app.get("/detection/{cctv_id}/history")
+def get_detection_history(cctv_id: str, minutes: float = 5):
+    """Counts per class and max occupancy over the last N minutes"""
+    history = detector.detection_history.get(cctv_id) if DETECTOR_AVAILABLE else None
+    if history is None:
+        raise HTTPException(status_code=404, detail="No detection history for this CCTV")
+    since = time.time() - minutes * 60
+    return {
+        "cctv_id": cctv_id,
+        "minutes": minutes,
+        "counts": history.counts_by_class(since),
+        "max_occupancy": history.max_occupancy(since),
+        "buffer": history.describe()
+    }
+
+
+@app.get("/detection/{cctv_id}/history/detections")
+def get_detection_history_range(cctv_id: str, start: float, end: float = None, limit: int = 1000):
+    """Raw detections between two unix timestamps (newest `limit` rows)"""
+    history = detector.detection_history.get(cctv_id) if DETECTOR_AVAILABLE else None
+    if history is None:
+        raise HTTPException(status_code=404, detail="No detection history for this CCTV")
+    end = end if end is not None else time.time()
+    return {"cctv_id": cctv_id, "start": start, "end": end,
+            "detections": history.between(start, end, min(max(limit, 1), 10000))}
+
+
+# Endpoint untuk klip event (pre/post-event, ditulis di thread terpisah)
+@app.get("/clips")
+def get_clips(cctv_id: str = None, limit: int = 100):
+    return list_clips(cctv_id, min(max(limit, 1), 1000))
+
+
+@app.get("/clips/{clip_id}")
+def get_clip_detail(clip_id: str):
+    clip = get_clip(clip_id)
+    if clip is None:
+        raise HTTPException(status_code=404, detail="Clip not found")
+    return clip
+
+
+@app.get("/clips/{clip_id}/video")
+def get_clip_video(clip_id: str):
+    path = clip_path(clip_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Clip not found")
+    return FileResponse(path, filename=os.path.basename(path), media_type="video/mp4")
+
+
+@app.post("/clips/{cctv_id}/trigger")
+def trigger_clip(cctv_id: str):
+    """Record a clip around now for a camera with a running pipeline and event rules"""
+    recorder = detector.recorders.get(cctv_id) if DETECTOR_AVAILABLE else None
+    if recorder is None:
+        raise HTTPException(status_code=404, detail="No recording pipeline for this CCTV")
+    recorder.trigger("manual")
+    return {"cctv_id": cctv_id, "message": "Clip recording triggered"}
+
+
+# Heatmap okupansi per kamera (grid resolusi rendah, per class)
+@app.get("/detection/{cctv_id}/heatmap")
+def get_detection_heatmap(cctv_id: str, format: str = "png", label: str = None, scale: int = 10):
+    """Heatmap as a PNG, a raw float32 .npy array or JSON; the last disk snapshot if not in memory"""
+    heatmap = detector.heatmaps.get(cctv_id) if DETECTOR_AVAILABLE else None
+    if heatmap is None:
+        heatmap = load_latest(cctv_id)
+    if heatmap is None:
+        raise HTTPException(status_code=404, detail="No heatmap for this CCTV")
+    if label is not None and label not in heatmap.layers:
+        raise HTTPException(status_code=404, detail="No heatmap layer for this label")
+    if format == "png":
+        return Response(heatmap.render_png(label, scale), media_type="image/png")
+    if format == "npy":
+        return Response(heatmap.to_npy(label), media_type="application/octet-stream")
+    if format == "json":
+        return dict(heatmap.describe(), values=heatmap.snapshot(label).round(3).tolist())
+    raise HTTPException(status_code=400, detail="format must be png, npy or json")
+
+
+# Hasil deteksi terakhir per kamera (dari cache, tanpa inference tambahan)
+@app.get("/detection/{cctv_id}/latest")
+async def get_latest_detection(cctv_id: str, request: Request, since: int = None, timeout: float = 25):
+    """Latest result with its sequence number and ETag.
+
+    With `since`, long-poll: wait up to `timeout` seconds for a result newer than that
+    sequence number; 304 if none arrived.
+    """
+    if since is None:
+        entry = latest_results.get(cctv_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="No detection result for this CCTV yet")
+    else:
+        entry = await latest_results.wait_newer(cctv_id, since, timeout)
+        if entry is None:
+            return Response(status_code=304)
+
+    etag = latest_results.etag(entry)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Detection-Seq": str(entry.seq)}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body(cctv_id), media_type="application/json", headers=headers)
+
+
+# Endpoint untuk profil inference (disimpan di cctv.json, berlaku tanpa restart)
+@app.get("/detection/profiles")
+def get_inference_profiles():
+    return profile_registry.list_profiles()
+
+
+@app.put("/detection/profiles/{name}")
+def put_inference_profile(name: str, config: InferenceProfileConfig):
+    profile = profile_registry.save_profile(name, config.model_dump())
+    return profile.to_dict()
+
+
+@app.put("/detection/profiles/category/{category}")
+def assign_category_profile(category: str, assignment: InferenceProfileAssignment):
+    try:
+        profile_registry.assign(None, assignment.profile or "default", category=category)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {"category": category, "profile": assignment.profile or "default"}
+
+
+@app.put("/cctv/{cctv_id}/profile")
+def assign_cctv_profile(cctv_id: str, assignment: InferenceProfileAssignment):
+    try:
+        profile_registry.assign(cctv_id, assignment.profile)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="CCTV or profile not found")
+    return {"cctv_id": cctv_id, "profile": assignment.profile}
+
+
 # Endpoint untuk menghentikan detection
 @app.post("/detection/stop")
 def stop_detection():
@@ -365,85 +717,122 @@ def stop_detection():
     return {"message": "Detection stopped"}
 
 
+# Endpoint admin untuk profiling on-demand (tanpa overhead saat tidak aktif)
+@app.post("/admin/profile")
+async def start_profile(seconds: float = 10, mode: str = "sampling", cctv_id: str = None,
+                        interval: float = 0.005, top: int = 30):
+    """Profile the process (sampling or deterministic) or one camera's pipeline (deterministic) for N seconds"""
+    if cctv_id is not None and mode != "deterministic":
+        raise HTTPException(status_code=400, detail="Per-camera profiling requires mode=deterministic")
+    try:
+        return await profiler.run(seconds, mode, cctv_id, interval, top)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/admin/profile/{artefact_id}/artefact")
+def get_profile_artefact(artefact_id: str):
+    """Download a pstats dump or collapsed-stack file (flamegraph.pl / speedscope input)"""
+    path = profiler.artefact_path(artefact_id)
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=os.path.basename(path), media_type="application/octet-stream")
+
+
+@app.post("/admin/trace/{cctv_id}")
+async def trace_camera(cctv_id: str, seconds: float = 5, max_frames: int = 1000):
+    """Per-frame stage timings for one camera as Chrome trace events (open in Perfetto)"""
+    if not DETECTOR_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Object detection not available")
+    return await profiler.trace(detector.frame_observers, cctv_id, seconds, max_frames)
+
+
+# Cache fetch HLS bersama (proxy + analyser): hit, fetch upstream, byte tersimpan
+@app.get("/proxy/stats")
+def get_proxy_stats():
+    return hls_fetcher.get_stats()
+
+
 # 🔥 Proxy untuk streaming HLS (.m3u8 + .ts segments)
 @app.get("/proxy")
 async def proxy_stream(url: str):
-    # Be tolerant to upstream TLS/cert issues and redirects often present in CCTV origins
-    async with httpx.AsyncClient(verify=False, follow_redirects=True, timeout=None, headers={
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
-    }) as client:
-        try:
-            r = await client.get(url)
-            if r.status_code != 200:
-                raise HTTPException(status_code=r.status_code, detail="Failed to fetch stream")
+    # Upstream fetch shared with viewers and HLS analysers of the same camera (see hls.py)
+    try:
+        kind = "playlist" if url.endswith(".m3u8") else "segment"
+        r = await hls_fetcher.fetch(url)
+        metrics.proxy_requests_total.labels(kind, r.status).inc()
+        if r.status != 200:
+            raise HTTPException(status_code=r.status, detail="Failed to fetch stream")
 
-            content_type = r.headers.get("content-type", "application/octet-stream")
+        content_type = r.content_type
 
-            # Kalau file playlist (.m3u8) → rewrite semua URI agar lewat proxy
-            if url.endswith(".m3u8"):
-                try:
-                    text = r.text
-                    # Gunakan URL upstream yang diminta klien agar resolve relatif benar
-                    base_url = str(url)
-
-                    def rewrite_line(line: str) -> str:
-                        line_stripped = line.strip()
-                        if not line_stripped or line_stripped.startswith('#'):
-                            # Rewrites for lines with URI attributes in tags (#EXT-X-KEY, #EXT-X-MAP)
-                            if line_stripped.startswith('#EXT-X-KEY') or line_stripped.startswith('#EXT-X-MAP'):
-                                # Find URI="..."
-                                prefix = 'URI="'
-                                if 'URI="' in line_stripped:
-                                    start = line_stripped.index(prefix) + len(prefix)
-                                    end = line_stripped.find('"', start)
-                                    if end != -1:
-                                        uri_value = line_stripped[start:end]
-                                        # Koreksi jika origin keliru menjadi localhost:3001/api/
-                                        parsed = urlparse(uri_value)
-                                        candidate = uri_value
-                                        if parsed.scheme in ("http", "https"):
-                                            if parsed.netloc in ("localhost:3001", "127.0.0.1:3001") and parsed.path.startswith("/api/"):
-                                                candidate = parsed.path.replace("/api/", "", 1)
-                                        elif uri_value.startswith("/api/"):
-                                            candidate = uri_value.replace("/api/", "", 1)
-
-                                        absolute = urljoin(base_url, candidate)
-                                        proxied = '/api/proxy?url=' + quote(absolute, safe='')
-                                        return line_stripped[:start] + proxied + line_stripped[end:]
-                            return line
-
-                        # For URI lines (variants or segments)
-                        candidate = line_stripped
-                        parsed = urlparse(candidate)
-                        if parsed.scheme in ("http", "https"):
-                            if parsed.netloc in ("localhost:3001", "127.0.0.1:3001") and parsed.path.startswith("/api/"):
-                                candidate = parsed.path.replace("/api/", "", 1)
-                        elif candidate.startswith("/api/"):
-                            candidate = candidate.replace("/api/", "", 1)
-
-                        absolute = urljoin(base_url, candidate)
-                        proxied = '/api/proxy?url=' + quote(absolute, safe='')
-                        return proxied + ('\n' if line.endswith('\n') else '')
-
-                    # Apply rewrite per line
-                    rewritten_lines = []
-                    for ln in text.splitlines(keepends=True):
-                        rewritten_lines.append(rewrite_line(ln))
-                    rewritten = ''.join(rewritten_lines)
-
-                    return Response(
-                        content=rewritten,
-                        media_type="application/vnd.apple.mpegurl",
-                        headers={
-                            "Cache-Control": "no-cache, no-store, must-revalidate"
-                        }
-                    )
-                except Exception as rewrite_error:
-                    # Fallback: return original if rewrite fails
-                    return Response(content=r.content, media_type="application/vnd.apple.mpegurl")
+        # Kalau file playlist (.m3u8) → rewrite semua URI agar lewat proxy
+        if url.endswith(".m3u8"):
+            try:
+                text = r.content.decode("utf-8", "replace")
+                # Gunakan URL upstream yang diminta klien agar resolve relatif benar
+                base_url = str(url)
+
+                def rewrite_line(line: str) -> str:
+                    line_stripped = line.strip()
+                    if not line_stripped or line_stripped.startswith('#'):
+                        # Rewrites for lines with URI attributes in tags (#EXT-X-KEY, #EXT-X-MAP)
+                        if line_stripped.startswith('#EXT-X-KEY') or line_stripped.startswith('#EXT-X-MAP'):
+                            # Find URI="..."
+                            prefix = 'URI="'
+                            if 'URI="' in line_stripped:
+                                start = line_stripped.index(prefix) + len(prefix)
+                                end = line_stripped.find('"', start)
+                                if end != -1:
+                                    uri_value = line_stripped[start:end]
+                                    # Koreksi jika origin keliru menjadi localhost:3001/api/
+                                    parsed = urlparse(uri_value)
+                                    candidate = uri_value
+                                    if parsed.scheme in ("http", "https"):
+                                        if parsed.netloc in ("localhost:3001", "127.0.0.1:3001") and parsed.path.startswith("/api/"):
+                                            candidate = parsed.path.replace("/api/", "", 1)
+                                    elif uri_value.startswith("/api/"):
+                                        candidate = uri_value.replace("/api/", "", 1)
+
+                                    absolute = urljoin(base_url, candidate)
+                                    proxied = '/api/proxy?url=' + quote(absolute, safe='')
+                                    return line_stripped[:start] + proxied + line_stripped[end:]
+                        return line
+
+                    # For URI lines (variants or segments)
+                    candidate = line_stripped
+                    parsed = urlparse(candidate)
+                    if parsed.scheme in ("http", "https"):
+                        if parsed.netloc in ("localhost:3001", "127.0.0.1:3001") and parsed.path.startswith("/api/"):
+                            candidate = parsed.path.replace("/api/", "", 1)
+                    elif candidate.startswith("/api/"):
+                        candidate = candidate.replace("/api/", "", 1)
+
+                    absolute = urljoin(base_url, candidate)
+                    proxied = '/api/proxy?url=' + quote(absolute, safe='')
+                    return proxied + ('\n' if line.endswith('\n') else '')
+
+                # Apply rewrite per line
+                rewritten_lines = []
+                for ln in text.splitlines(keepends=True):
+                    rewritten_lines.append(rewrite_line(ln))
+                rewritten = ''.join(rewritten_lines)
+
+                return Response(
+                    content=rewritten,
+                    media_type="application/vnd.apple.mpegurl",
+                    headers={
+                        "Cache-Control": "no-cache, no-store, must-revalidate"
+                    }
+                )
+            except Exception as rewrite_error:
+                # Fallback: return original if rewrite fails
+                return Response(content=r.content, media_type="application/vnd.apple.mpegurl")
 
-            # Kalau file segment video (.ts atau lainnya), stream langsung
-            return StreamingResponse(r.aiter_bytes(), media_type=content_type)
+        # Kalau file segment video (.ts atau lainnya), kirim dari cache bersama
+        return Response(content=r.content, media_type=content_type)
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
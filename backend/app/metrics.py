@@ -0,0 +1,280 @@
+import asyncio
+import bisect
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds in seconds, tuned for per-frame work (sub-ms to a few seconds)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+NETWORK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    """Metric family; children are created once per label set and reused on hot paths.
+
+    Updates are plain attribute/list-slot increments without locks: the pipeline runs
+    on the event loop thread, and a rare lost increment from an executor thread is an
+    acceptable price for keeping instrumentation always on.
+    """
+    kind = ""
+    child_class = _CounterChild
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    def _unlabelled(self):
+        return self._children[()]
+
+    def samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def set(self, value: float):
+        self._unlabelled().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._unlabelled().dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled().observe(value)
+
+    def samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(child.counts)):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        # Collectors produce (name, kind, help, [(labels dict, value)]) at scrape time
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Detection pipeline
+frame_decode_seconds = registry.histogram(
+    "cctv_frame_decode_seconds", "Time to read and decode one frame", ["camera"])
+preprocess_seconds = registry.histogram(
+    "cctv_preprocess_seconds", "Time to crop and letterbox a frame for the model", ["camera"])
+inference_seconds = registry.histogram(
+    "cctv_inference_seconds", "Model inference time per analysed frame", ["camera"])
+postprocess_seconds = registry.histogram(
+    "cctv_postprocess_seconds", "Time to convert model output into detections and counters", ["camera"])
+serialize_seconds = registry.histogram(
+    "cctv_serialize_seconds", "Time to serialize a detection message", ["camera"])
+ws_send_seconds = registry.histogram(
+    "cctv_ws_send_seconds", "Time to send a detection message over the WebSocket", ["camera"])
+ws_send_pending = registry.gauge(
+    "cctv_ws_send_pending", "WebSocket messages waiting to be sent, per camera", ["camera"])
+frames_total = registry.counter(
+    "cctv_frames_total", "Frames read per camera by outcome (analysed, skipped, failed)", ["camera", "outcome"])
+detections_total = registry.counter(
+    "cctv_detections_total", "Detected objects by label", ["label"])
+active_sessions = registry.gauge(
+    "cctv_detection_sessions", "Running detection pipelines")
+active_subscribers = registry.gauge(
+    "cctv_detection_subscribers", "Connected detection WebSocket clients")
+admission_total = registry.counter(
+    "cctv_admission_total", "Detection session admission decisions (admitted, queued, rejected, timed_out)",
+    ["outcome"])
+
+# Event clips
+clip_frames_dropped_total = registry.counter(
+    "cctv_clip_frames_dropped_total", "Frames not buffered because the clip encoder fell behind", ["camera"])
+clips_written_total = registry.counter(
+    "cctv_clips_written_total", "Event clips written to disk", ["camera"])
+
+# HLS proxy
+proxy_upstream_seconds = registry.histogram(
+    "cctv_proxy_upstream_seconds", "Upstream fetch time in /proxy", ["kind"], buckets=NETWORK_BUCKETS)
+proxy_requests_total = registry.counter(
+    "cctv_proxy_requests_total", "Proxy requests by kind and status", ["kind", "status"])
+proxy_cache_total = registry.counter(
+    "cctv_proxy_cache_total", "Proxy upstream cache lookups by result (hit, miss)", ["result"])
+
+# Logging
+log_records_dropped_total = registry.counter(
+    "cctv_log_records_dropped_total", "Log records dropped because the log writer queue was full")
+
+# Event loop
+event_loop_lag_seconds = registry.histogram(
+    "cctv_event_loop_lag_seconds", "How late the event loop woke a periodic timer",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+class PipelineMetrics:
+    """Children for one camera, fetched once when its pipeline starts"""
+
+    def __init__(self, camera_id: str):
+        self.camera_id = camera_id
+        self.decode = frame_decode_seconds.labels(camera_id)
+        self.preprocess = preprocess_seconds.labels(camera_id)
+        self.inference = inference_seconds.labels(camera_id)
+        self.postprocess = postprocess_seconds.labels(camera_id)
+        self.serialize = serialize_seconds.labels(camera_id)
+        self.send = ws_send_seconds.labels(camera_id)
+        self.pending = ws_send_pending.labels(camera_id)
+        self.analysed = frames_total.labels(camera_id, "analysed")
+        self.skipped = frames_total.labels(camera_id, "skipped")
+        self.failed = frames_total.labels(camera_id, "failed")
+
+    def observe(self, timings: Dict[str, float]):
+        self.analysed.inc()
+        for stage in ("decode", "preprocess", "inference", "postprocess", "serialize", "send"):
+            seconds = timings.get(stage)
+            if seconds is not None:
+                getattr(self, stage).observe(seconds)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Measure how late the loop wakes up from a fixed sleep; runs until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(loop.time() - expected, 0.0))
+
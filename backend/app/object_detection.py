@@ -1,23 +1,41 @@
-import cv2
 import numpy as np
 import asyncio
+import importlib.util
 import json
+import threading
 import time
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional
 import logging
 
+from admission import admission
+from capture import create_capture_factory
+from dashboard import summary_topic
+from heatmap import Heatmap
+from history import DetectionHistory
+from latest import latest_results
+from log_config import LOG_FRAME_SAMPLE, LogLimiter, camera_id_var, configure_logging
+from inference_backends import InferenceConfigError, create_backend
+from metrics import PipelineMetrics, active_sessions, detections_total, registry
+from profiles import PROFILE_REFRESH_INTERVAL, profile_registry
+from profiling import profiler
+from recording import ClipRecorder, parse_rules
+from roi import DEFAULT_INPUT_SIZE, InferenceRegion, compute_inference_region
+from stream_manager import StreamReconnectManager
+
 # Setup logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
+# Log sites hit once per frame: errors at most every LOG_RATE_INTERVAL per camera, debug sampled
+error_log = LogLimiter(logger)
+frame_log = LogLimiter(logger, interval=0, sample=LOG_FRAME_SAMPLE)
+
+# Only check that YOLO is installed here; ultralytics (and torch) are imported
+# when the model is actually loaded so importing this module stays cheap
+YOLO_AVAILABLE = importlib.util.find_spec("ultralytics") is not None
+if not YOLO_AVAILABLE:
+    logger.warning("YOLO not available. Using mock detection.")
 
-# Try to import YOLO, fallback to mock if not available
-try:
-    from ultralytics import YOLO
-    YOLO_AVAILABLE = True
-    logger.info("YOLO imported successfully")
-except ImportError as e:
-    YOLO_AVAILABLE = False
-    logger.warning(f"YOLO not available: {e}. Using mock detection.")
+DEFAULT_MODEL_PATH = 'yolov8n.pt'
 
 class DetectionResult:
     def __init__(self, label: str, confidence: float, bbox: List[float], 
@@ -52,7 +70,7 @@ class MockDetector:
     def __init__(self):
         self.names = {0: 'person', 1: 'car', 2: 'truck'}
     
-    def __call__(self, frame, verbose=False):
+    def __call__(self, frame, verbose=False, **kwargs):
         # Return mock detection results
         class MockResult:
             def __init__(self):
@@ -61,90 +79,354 @@ class MockDetector:
         
         return [MockResult()]
 
+class ViewerDisconnected(Exception):
+    """The pipeline's WebSocket viewer is gone; the pipeline ends instead of sending into a closed socket"""
+
+
 class CCTVObjectDetector:
-    def __init__(self, model_path: str = 'yolov8n.pt'):
-        """Initialize YOLO model for object detection"""
-        self.detection_history = []
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH):
+        """Set up the detector; the YOLO model is loaded lazily by load_model()"""
+        self.model_path = model_path
+        # Per-camera fixed-size ring buffers, kept after a pipeline stops so they stay queryable
+        self.detection_history: Dict[str, DetectionHistory] = {}
+        self.heatmaps: Dict[str, Heatmap] = {}
+        self.total_detections = 0
         self.object_counters = {}
         self.is_running = False
-        
-        if YOLO_AVAILABLE:
-            try:
-                self.model = YOLO(model_path)
-                logger.info(f"YOLO model loaded successfully: {model_path}")
-            except Exception as e:
-                logger.error(f"Failed to load YOLO model: {e}")
-                # Fallback to default model
+        self.streams: Dict[str, StreamReconnectManager] = {}
+        self.inference_regions: Dict[str, InferenceRegion] = {}
+        self.active_profiles: Dict[str, str] = {}
+        self.recorders: Dict[str, ClipRecorder] = {}
+        # Message bus for per-frame summaries (dashboards); set by the API or cluster worker
+        self.bus = None
+        # Seconds to sleep between frame reads; 0 lets offline sources run flat out
+        self.read_interval = 0.033
+        # Called as observer(camera_id, timings) for every analysed frame, with
+        # per-stage durations in seconds (decode, preprocess, inference, ...)
+        self.frame_observers: List[Callable[[str, Dict[str, float]], None]] = []
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.model_state = 'not_loaded'  # not_loaded | loading | ready | failed
+        self.model_load_time: Optional[float] = None
+        self.warmup_time: Optional[float] = None
+
+    @property
+    def model(self):
+        """Loaded model; the first access loads it synchronously if nobody did yet"""
+        if self._model is None:
+            self.load_model()
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+        self.model_state = 'ready'
+
+    @property
+    def is_ready(self) -> bool:
+        return self.model_state == 'ready'
+
+    def _load_yolo(self):
+        try:
+            model = create_backend(self.model_path)
+            logger.info(f"YOLO model loaded successfully: {self.model_path}")
+            return model
+        except InferenceConfigError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to load YOLO model: {e}")
+            if self.model_path == DEFAULT_MODEL_PATH:
+                raise
+        # Fallback to default model
+        model = create_backend(DEFAULT_MODEL_PATH)
+        logger.info("Fallback YOLO model loaded")
+        return model
+
+    def load_model(self, warm_up: bool = True):
+        """Load the model once (thread-safe) and run a warm-up inference"""
+        with self._model_lock:
+            if self._model is not None:
+                return self._model
+
+            self.model_state = 'loading'
+            started = time.perf_counter()
+            if YOLO_AVAILABLE:
                 try:
-                    self.model = YOLO('yolov8n.pt')
-                    logger.info("Fallback YOLO model loaded")
-                except Exception as e2:
-                    logger.error(f"Fallback YOLO model also failed: {e2}")
-                    self.model = MockDetector()
-        else:
-            logger.info("Using mock detector")
-            self.model = MockDetector()
-        
-    async def process_stream(self, stream_url: str, websocket=None):
-        """Process CCTV stream and detect objects"""
+                    model = self._load_yolo()
+                except Exception as e:
+                    # Only a missing ultralytics means mock detections; a broken model or setting fails loudly
+                    self.model_state = 'failed'
+                    logger.error(f"Detection model failed to load: {e}")
+                    raise
+            else:
+                logger.info("Using mock detector")
+                model = MockDetector()
+            self.model_load_time = time.perf_counter() - started
+
+            if warm_up:
+                self._warm_up(model)
+
+            self._model = model
+            self.model_state = 'ready'
+            return model
+
+    def _warm_up(self, model):
+        """Run one inference on a blank frame so the first real frame skips graph initialisation"""
+        started = time.perf_counter()
+        try:
+            model(np.zeros((480, 640, 3), dtype=np.uint8), verbose=False)
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+        self.warmup_time = time.perf_counter() - started
+        logger.info(f"Model warm-up took {self.warmup_time:.3f}s")
+
+    async def ensure_model_loaded(self):
+        """Load the model in the executor so the event loop keeps serving"""
+        if self._model is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.load_model)
+        return self._model
+
+    async def process_stream(self, stream_url: str, websocket=None, cctv_id: Optional[str] = None,
+                             camera: Optional[Dict[str, Any]] = None, ticket=None):
+        """Process CCTV stream and detect objects.
+
+        `camera` is the cctv.json device; its lines/zones define the inference region.
+        With an admission `ticket` frames are analysed at most at its granted rate.
+        """
         self.is_running = True
+        camera_id = cctv_id or stream_url
+        camera = camera or {}
+        # This runs as its own task, so the camera id tags only this pipeline's records
+        camera_id_var.set(camera_id)
         logger.info(f"Starting stream processing: {stream_url}")
-        
+
+        stream = StreamReconnectManager(stream_url, camera_id=camera_id,
+                                        capture_factory=create_capture_factory(camera))
+        self.streams[camera_id] = stream
+        pipeline_metrics = PipelineMetrics(camera_id)
+        active_sessions.inc()
+
+        async def report_state(state, info):
+            await self._publish_summary(camera_id, state)
+            if websocket:
+                pipeline_metrics.pending.inc()
+                try:
+                    await websocket.send_text(json.dumps({
+                        'type': 'stream_status',
+                        'state': state,
+                        'info': info,
+                        'timestamp': time.time()
+                    }))
+                except Exception as e:
+                    # The viewer is gone (e.g. the final "stopped" state); the frame loop ends on its own
+                    logger.debug(f"Stream status not delivered: {e!r}")
+                finally:
+                    pipeline_metrics.pending.dec()
+
+        stream.subscribe(report_state)
+        # Only cameras with event rules keep a pre-event frame buffer
+        rules = parse_rules(camera)
+        recorder = ClipRecorder(camera_id, camera, rules) if rules else None
+        if recorder is not None:
+            self.recorders[camera_id] = recorder
+        frames = stream.frames()
+
         try:
-            cap = cv2.VideoCapture(stream_url)
-            
-            if not cap.isOpened():
-                logger.error(f"Failed to open stream: {stream_url}")
-                await self._send_error(websocket, f"Failed to open stream: {stream_url}")
-                return
-            
-            logger.info(f"Stream opened successfully: {stream_url}")
-            
+            # A model that fails to load ends this pipeline (and tells the viewer) instead of faking detections
+            await self.ensure_model_loaded()
             frame_count = 0
-            while self.is_running:
-                ret, frame = cap.read()
-                if not ret:
-                    logger.warning("Failed to read frame, retrying...")
-                    await asyncio.sleep(0.1)
-                    continue
-                
+            region = None
+            profile = profile_registry.resolve(camera)
+            self.active_profiles[camera_id] = profile.name
+            next_refresh = time.monotonic() + PROFILE_REFRESH_INTERVAL
+            last_inference = 0.0
+            capacity_mode = 'full'
+            async for frame in frames:
+                if not self.is_running:
+                    break
+
                 frame_count += 1
-                
-                # Detect objects every few frames to reduce load
-                if frame_count % 3 == 0:  # Process every 3rd frame
+                now = time.monotonic()
+                # Set when the capture decodes below native resolution (FFmpegCapture)
+                source_shape = stream.source_shape
+                if recorder is not None:
+                    # Ring-buffered frames get overwritten; the recorder encodes later
+                    recorder.offer(frame, borrowed=stream.reuses_frames)
+
+                # Pick up profile edits in cctv.json without restarting
+                if now >= next_refresh:
+                    next_refresh = now + PROFILE_REFRESH_INTERVAL
+                    updated = profile_registry.resolve(camera)
+                    if updated != profile:
+                        logger.info(f"Inference profile for {camera_id}: {profile.name} -> {updated.name}")
+                        profile = updated
+                        self.active_profiles[camera_id] = profile.name
+                    if ticket is not None:
+                        admission.update_demand(ticket, profile.target_fps)
+
+                # Under load shedding the admission ticket grants less than the profile asks
+                frame_interval = profile.frame_interval
+                if ticket is not None:
+                    frame_interval = max(frame_interval, ticket.frame_interval)
+                    if ticket.mode != capacity_mode:
+                        capacity_mode = ticket.mode
+                        await self._send_capacity(websocket, ticket)
+
+                # Detect objects at the profile's target fps to reduce load
+                if now - last_inference >= frame_interval:
+                    last_inference = now
+                    timings = {'decode': stream.last_read_seconds}
                     try:
-                        # Detect objects
-                        results = self.model(frame, verbose=False)
-                        
-                        # Process detection results
-                        detections = self._process_detections(results[0], frame)
+                        # Profiling this camera? Only its frame work goes into the profile
+                        session = profiler.for_camera(camera_id)
+                        if session is not None:
+                            session.enable()
+                        try:
+                            region, detections = self._analyse_frame(camera_id, camera, frame, region,
+                                                                     profile, timings, source_shape)
+                        finally:
+                            if session is not None:
+                                session.disable()
+                        if recorder is not None:
+                            recorder.check(detections, source_shape or frame.shape)
+                        await self._publish_summary(camera_id, stream.state, detections)
                         
-                        # Update counters
-                        self._update_counters(detections)
-                        
-                        # Send results via WebSocket if available
-                        if websocket:
-                            await self._send_detection_results(websocket, detections, frame)
+                        # Send results via WebSocket if available; always cache them for REST readers
+                        pipeline_metrics.pending.inc()
+                        try:
+                            await self._send_detection_results(websocket, detections, frame, timings,
+                                                               camera_id=camera_id)
+                        finally:
+                            pipeline_metrics.pending.dec()
+
+                        pipeline_metrics.observe(timings)
+                        frame_log.log(logging.DEBUG, camera_id, "Frame %d: %d objects, inference %.1f ms",
+                                      frame_count, len(detections), timings['inference'] * 1000)
+                        if self.frame_observers:
+                            self._notify_frame(camera_id, timings)
                             
+                    except ViewerDisconnected:
+                        raise
                     except Exception as e:
-                        logger.error(f"Detection error on frame {frame_count}: {e}")
+                        pipeline_metrics.failed.inc()
+                        error_log.log(logging.ERROR, ('detect', camera_id), "Detection error on frame %d: %s",
+                                      frame_count, e)
                         # Send mock detection for testing
                         if websocket:
                             mock_detections = self._generate_mock_detections()
                             await self._send_detection_results(websocket, mock_detections, frame)
+                else:
+                    pipeline_metrics.skipped.inc()
                 
                 # Small delay to prevent overwhelming
-                await asyncio.sleep(0.033)  # ~30 FPS
+                await asyncio.sleep(self.read_interval)  # ~30 FPS
                 
+        except ViewerDisconnected as e:
+            logger.info(f"Viewer disconnected, stopping stream processing: {e}")
         except Exception as e:
             logger.error(f"Error in stream processing: {e}")
             await self._send_error(websocket, str(e))
         finally:
-            if 'cap' in locals():
-                cap.release()
-            self.is_running = False
+            active_sessions.dec()
+            stream.stop()
+            await frames.aclose()
+            if recorder is not None:
+                recorder.close()
+                if self.recorders.get(camera_id) is recorder:
+                    del self.recorders[camera_id]
+            if self.streams.get(camera_id) is stream:
+                del self.streams[camera_id]
+                self.inference_regions.pop(camera_id, None)
+                self.active_profiles.pop(camera_id, None)
+            if not self.streams:
+                self.is_running = False
+            for site in ('detect', 'send'):
+                error_log.forget((site, camera_id))
+            frame_log.forget(camera_id)
             logger.info("Stream processing stopped")
     
+    def _analyse_frame(self, camera_id: str, camera: Dict[str, Any], frame, region: Optional[InferenceRegion],
+                       profile, timings: Dict[str, float], source_shape=None):
+        """Preprocess, infer and post-process one frame; returns the (possibly rebuilt) region and detections.
+
+        `source_shape` is the native frame shape when `frame` was decoded smaller;
+        detections are then in native pixels.
+        """
+        # Crop to the lines/zones region and letterbox once to the model input
+        started = time.perf_counter()
+        model = self.model
+        # Fixed-shape ONNX/OpenVINO artefacts only run at the size they were exported at
+        imgsz = model.fit_imgsz(profile.imgsz) if hasattr(model, 'fit_imgsz') else profile.imgsz
+        source_shape = source_shape or frame.shape
+        if (region is None or region.frame_shape != frame.shape[:2] or region.input_size != imgsz
+                or region.source_shape != tuple(source_shape[:2])):
+            region = self._inference_region(camera_id, camera, frame.shape, imgsz, source_shape)
+        image = region.apply(frame)
+        timings['preprocess'] = time.perf_counter() - started
+
+        # Detect objects, only for the profile's classes and thresholds
+        started = time.perf_counter()
+        results = model(image, verbose=False, **profile.model_kwargs(model.names, imgsz))
+        timings['inference'] = time.perf_counter() - started
+        profile_registry.record(profile, timings['inference'])
+
+        # Process detection results
+        started = time.perf_counter()
+        detections = self._process_detections(results[0], frame, region)
+
+        # Update counters
+        self._update_counters(detections)
+        self.get_history(camera_id).append(detections)
+        heatmap = self.heatmaps.get(camera_id)
+        if heatmap is None:
+            heatmap = self.heatmaps[camera_id] = Heatmap()
+        heatmap.add(detections, source_shape)
+        timings['postprocess'] = time.perf_counter() - started
+        return region, detections
+
+    async def _publish_summary(self, camera_id: str, state: str, detections: Optional[List[DetectionResult]] = None):
+        """Per-camera counts and stream state for dashboards; state-only when `detections` is None"""
+        if self.bus is None:
+            return
+        summary = {'state': state, 'timestamp': time.time()}
+        if detections is not None:
+            counters = {}
+            for detection in detections:
+                counters[detection.label] = counters.get(detection.label, 0) + 1
+            summary['counters'] = counters
+            summary['total'] = len(detections)
+        elif state == 'stopped':
+            summary['counters'] = {}
+            summary['total'] = 0
+        try:
+            await self.bus.publish(summary_topic(camera_id), json.dumps(summary))
+        except Exception as e:
+            logger.error(f"Failed to publish summary for {camera_id}: {e}")
+
+    def get_history(self, camera_id: str) -> DetectionHistory:
+        history = self.detection_history.get(camera_id)
+        if history is None:
+            history = self.detection_history[camera_id] = DetectionHistory()
+        return history
+
+    def _notify_frame(self, camera_id: str, timings: Dict[str, float]):
+        for observer in list(self.frame_observers):
+            try:
+                observer(camera_id, timings)
+            except Exception as e:
+                logger.error(f"Frame observer failed: {e}")
+
+    def _inference_region(self, camera_id: str, camera: Dict[str, Any], frame_shape,
+                          input_size: int = DEFAULT_INPUT_SIZE, source_shape=None) -> InferenceRegion:
+        """Build the camera's crop/letterbox region for the current frame size"""
+        # Lines and zones are in native pixels; the region converts to the decoded size
+        bounds = compute_inference_region(camera, source_shape or frame_shape)
+        region = InferenceRegion(bounds, frame_shape, input_size, source_shape)
+        self.inference_regions[camera_id] = region
+        logger.info(f"Inference region for {camera_id}: {region.describe()}")
+        return region
+
     def _generate_mock_detections(self) -> List[DetectionResult]:
         """Generate mock detections for testing"""
         import random
@@ -162,8 +444,8 @@ class CCTVObjectDetector:
         
         return mock_objects
     
-    def _process_detections(self, result, frame) -> List[DetectionResult]:
-        """Process YOLO detection results"""
+    def _process_detections(self, result, frame, region: Optional[InferenceRegion] = None) -> List[DetectionResult]:
+        """Process YOLO detection results, mapping boxes from the model input back to the frame"""
         detections = []
         
         if result.boxes is None:
@@ -173,6 +455,8 @@ class CCTVObjectDetector:
             for box in result.boxes:
                 # Get box coordinates
                 x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                if region is not None:
+                    x1, y1, x2, y2 = region.to_frame(x1, y1, x2, y2)
                 x, y, w, h = x1, y1, x2 - x1, y2 - y1
                 
                 # Get class and confidence
@@ -193,7 +477,7 @@ class CCTVObjectDetector:
                 
                 detections.append(detection)
         except Exception as e:
-            logger.error(f"Error processing detections: {e}")
+            error_log.log(logging.ERROR, 'process', "Error processing detections: %s", e)
         
         return detections
     
@@ -207,16 +491,25 @@ class CCTVObjectDetector:
                 current_counts[label] = 0
             current_counts[label] += 1
         
+        self.total_detections += len(detections)
+
         # Update global counters
         for label, count in current_counts.items():
+            detections_total.labels(label).inc(count)
             if label not in self.object_counters:
                 self.object_counters[label] = 0
             self.object_counters[label] = count
     
-    async def _send_detection_results(self, websocket, detections: List[DetectionResult], frame):
-        """Send detection results via WebSocket"""
+    async def _send_detection_results(self, websocket, detections: List[DetectionResult], frame,
+                                      timings: Optional[Dict[str, float]] = None,
+                                      camera_id: Optional[str] = None):
+        """Send detection results via WebSocket, recording serialize/send time into `timings`.
+
+        With a `camera_id` the serialized message also becomes the camera's latest result.
+        """
         try:
             # Prepare data to send
+            started = time.perf_counter()
             data = {
                 'type': 'detection_results',
                 'timestamp': time.time(),
@@ -224,13 +517,40 @@ class CCTVObjectDetector:
                 'counters': self.object_counters,
                 'total_objects': len(detections)
             }
+            message = json.dumps(data)
+            if camera_id is not None:
+                latest_results.update(camera_id, message)
+            serialized = time.perf_counter()
             
             # Send via WebSocket
-            await websocket.send_text(json.dumps(data))
+            if websocket:
+                try:
+                    await websocket.send_text(message)
+                except Exception as e:
+                    raise ViewerDisconnected(str(e)) from e
+            if timings is not None:
+                timings['serialize'] = serialized - started
+                timings['send'] = time.perf_counter() - serialized
             
+        except ViewerDisconnected:
+            raise
         except Exception as e:
-            logger.error(f"Failed to send detection results: {e}")
+            error_log.log(logging.ERROR, ('send', camera_id), "Failed to send detection results: %s", e)
     
+    async def _send_capacity(self, websocket, ticket):
+        """Tell the viewer its camera is analysed at a reduced rate (or back at full rate)"""
+        if websocket is None:
+            return
+        try:
+            await websocket.send_text(json.dumps({
+                'type': 'capacity',
+                'state': ticket.mode,
+                'fps': round(ticket.granted_fps, 2),
+                'timestamp': time.time()
+            }))
+        except Exception as e:
+            raise ViewerDisconnected(str(e)) from e
+
     async def _send_error(self, websocket, error_message: str):
         """Send error message via WebSocket"""
         if websocket:
@@ -245,16 +565,48 @@ class CCTVObjectDetector:
     def stop(self):
         """Stop the detection process"""
         self.is_running = False
+        for stream in list(self.streams.values()):
+            stream.stop()
         logger.info("Detection stopped by user")
+
+    def stop_camera(self, camera_id: str):
+        """Stop one camera's pipeline, leaving the others running"""
+        stream = self.streams.get(camera_id)
+        if stream is not None:
+            stream.stop()
     
     def get_statistics(self) -> Dict[str, Any]:
         """Get detection statistics"""
         return {
-            'total_detections': len(self.detection_history),
+            'total_detections': self.total_detections,
             'object_counters': self.object_counters,
             'is_running': self.is_running,
-            'yolo_available': YOLO_AVAILABLE
+            'yolo_available': YOLO_AVAILABLE,
+            'model_state': self.model_state,
+            'mock_model': isinstance(self._model, MockDetector),
+            'inference_backend': self._model.describe() if hasattr(self._model, 'describe') else None,
+            'model_load_time': self.model_load_time,
+            'warmup_time': self.warmup_time,
+            'streams': {camera_id: stream.get_stats() for camera_id, stream in self.streams.items()},
+            'inference_regions': {camera_id: region.describe() for camera_id, region in self.inference_regions.items()},
+            'active_profiles': dict(self.active_profiles),
+            'history_bytes': sum(history.nbytes for history in self.detection_history.values()),
+            'heatmap_bytes': sum(heatmap.nbytes for heatmap in self.heatmaps.values()),
+            'latest_results': latest_results.get_stats(),
+            'recorders': {camera_id: recorder.get_stats() for camera_id, recorder in self.recorders.items()},
+            'profiles': profile_registry.get_stats()
         }
 
+    def collect_metrics(self):
+        """Stream health for /metrics, read from the reconnect managers at scrape time"""
+        streams = list(self.streams.items())
+        yield ('cctv_stream_read_failures_total', 'counter', 'Failed frame reads per camera stream',
+               [({'camera': camera_id}, stream.read_failures) for camera_id, stream in streams])
+        yield ('cctv_stream_reconnects_total', 'counter', 'Stream reconnects per camera',
+               [({'camera': camera_id}, stream.reconnects) for camera_id, stream in streams])
+        yield ('cctv_stream_state', 'gauge', 'Current stream state per camera (1 for the active state)',
+               [({'camera': camera_id, 'state': stream.state}, 1) for camera_id, stream in streams])
+
 # Global detector instance
 detector = CCTVObjectDetector()
+registry.add_collector(detector.collect_metrics)
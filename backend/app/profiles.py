@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CCTV_FILE = os.getenv("CCTV_FILE", os.path.join(BASE_DIR, "cctv.json"))
+
+TRAFFIC_CLASSES = ["person", "bicycle", "car", "motorcycle", "bus", "truck"]
+
+# Used when cctv.json has no `inference_profiles` / `category_profiles` sections
+DEFAULT_PROFILES = {
+    "default": {"imgsz": 640, "classes": None, "conf": 0.25, "iou": 0.45, "target_fps": 10},
+    "traffic": {"imgsz": 640, "classes": TRAFFIC_CLASSES, "conf": 0.3, "iou": 0.45, "target_fps": 10},
+    "border": {"imgsz": 960, "classes": TRAFFIC_CLASSES, "conf": 0.3, "iou": 0.45, "target_fps": 10},
+}
+DEFAULT_CATEGORY_PROFILES = {
+    "Dalam Kota": "traffic",
+    "Perbatasan Kota": "traffic",
+    "Perbatasan Provinsi": "border",
+}
+
+# How often a running pipeline re-resolves its profile (a stat() of cctv.json)
+PROFILE_REFRESH_INTERVAL = 2.0
+
+
+class InferenceProfile:
+    """How one camera is analysed: model input size, classes, thresholds and rate"""
+
+    def __init__(self, name: str, imgsz: int = 640, classes: Optional[List[Any]] = None,
+                 conf: float = 0.25, iou: float = 0.45, target_fps: float = 10):
+        self.name = name
+        # Ultralytics needs the input size to be a multiple of the model stride
+        self.imgsz = max(32, int(round(imgsz / 32.0)) * 32)
+        self.classes = list(classes) if classes else None
+        self.conf = float(conf)
+        self.iou = float(iou)
+        self.target_fps = float(target_fps)
+        self._class_ids = None
+        self._names_key = None
+
+    @classmethod
+    def from_config(cls, name: str, config: Dict[str, Any]) -> "InferenceProfile":
+        known = ("imgsz", "classes", "conf", "iou", "target_fps")
+        return cls(name, **{key: config[key] for key in known if config.get(key) is not None})
+
+    @property
+    def frame_interval(self) -> float:
+        """Minimum seconds between two analysed frames"""
+        return 1.0 / self.target_fps if self.target_fps > 0 else 0.0
+
+    def class_ids(self, names: Dict[int, str]) -> Optional[List[int]]:
+        """Class filter as model class ids; labels are resolved against the model's names"""
+        if self.classes is None:
+            return None
+        # Keyed on the names themselves: an id() can be reused by another model's dict
+        names_key = tuple(names.items())
+        if self._names_key != names_key:
+            by_name = {label: class_id for class_id, label in names.items()}
+            ids = []
+            for cls in self.classes:
+                if isinstance(cls, int):
+                    ids.append(cls)
+                elif cls in by_name:
+                    ids.append(by_name[cls])
+                else:
+                    logger.warning(f"Profile {self.name}: unknown class {cls}")
+            self._class_ids = sorted(set(ids))
+            self._names_key = names_key
+        return self._class_ids
+
+    def model_kwargs(self, names: Dict[int, str], imgsz: Optional[int] = None) -> Dict[str, Any]:
+        """Keyword arguments for the model call, so NMS only sees wanted classes.
+
+        `imgsz` overrides the profile's size when the model can't run it.
+        """
+        kwargs = {"imgsz": imgsz or self.imgsz, "conf": self.conf, "iou": self.iou}
+        class_ids = self.class_ids(names)
+        if class_ids is not None:
+            kwargs["classes"] = class_ids
+        return kwargs
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "imgsz": self.imgsz,
+            "classes": self.classes,
+            "conf": self.conf,
+            "iou": self.iou,
+            "target_fps": self.target_fps,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, InferenceProfile) and self.to_dict() == other.to_dict()
+
+
+class ProfileRegistry:
+    """Inference profiles stored in the camera registry (cctv.json).
+
+    The file is re-read only when its mtime changes, so edits (by hand or through
+    the API) reach running pipelines without a restart.
+    """
+
+    def __init__(self, cctv_file: str = CCTV_FILE):
+        self.cctv_file = cctv_file
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._profiles: Dict[str, InferenceProfile] = {}
+        self._categories: Dict[str, str] = {}
+        self._devices: Dict[str, Dict[str, Any]] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.cctv_file).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and self._profiles:
+            return
+
+        data = {}
+        if mtime is not None:
+            try:
+                with open(self.cctv_file, "r") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Failed to read profiles from {self.cctv_file}: {e}")
+                if self._profiles:
+                    return
+
+        configs = dict(DEFAULT_PROFILES)
+        configs.update(data.get("inference_profiles") or {})
+        self._profiles = {name: InferenceProfile.from_config(name, config) for name, config in configs.items()}
+        self._categories = dict(DEFAULT_CATEGORY_PROFILES)
+        self._categories.update(data.get("category_profiles") or {})
+        self._devices = {
+            device.get("id"): device.get("inference_profile")
+            for device in data.get("devices", []) if device.get("inference_profile")
+        }
+        self._mtime = mtime
+        logger.info(f"Loaded {len(self._profiles)} inference profiles")
+
+    def resolve(self, camera: Dict[str, Any]) -> InferenceProfile:
+        """Profile for a camera: its own setting, else its category's, else `default`"""
+        with self._lock:
+            self._load()
+            setting = self._devices.get(camera.get("id"), camera.get("inference_profile"))
+            if isinstance(setting, dict):
+                base = self._profiles.get(setting.get("profile"), self._profile_for_category(camera))
+                config = base.to_dict()
+                config.update(setting)
+                return InferenceProfile.from_config(f"{camera.get('id')}", config)
+            if setting in self._profiles:
+                return self._profiles[setting]
+            return self._profile_for_category(camera)
+
+    def _profile_for_category(self, camera: Dict[str, Any]) -> InferenceProfile:
+        name = self._categories.get(camera.get("category"), "default")
+        return self._profiles.get(name) or self._profiles["default"]
+
+    def list_profiles(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            return {
+                "profiles": {name: profile.to_dict() for name, profile in self._profiles.items()},
+                "category_profiles": dict(self._categories),
+            }
+
+    def _update_file(self, update):
+        """Apply `update(data)` to cctv.json and write it back atomically"""
+        with self._lock:
+            with open(self.cctv_file, "r") as f:
+                data = json.load(f)
+            update(data)
+            tmp_path = f"{self.cctv_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent="\t", ensure_ascii=False)
+            os.replace(tmp_path, self.cctv_file)
+            self._mtime = None
+
+    def save_profile(self, name: str, config: Dict[str, Any]) -> InferenceProfile:
+        profile = InferenceProfile.from_config(name, config)
+
+        def update(data):
+            data.setdefault("inference_profiles", {})[name] = {
+                key: value for key, value in profile.to_dict().items() if key != "name"
+            }
+
+        self._update_file(update)
+        return profile
+
+    def assign(self, camera_id: str, profile: Optional[str] = None, category: Optional[str] = None):
+        """Point a camera (or a whole category) at a named profile"""
+        def update(data):
+            profiles = set(DEFAULT_PROFILES) | set(data.get("inference_profiles") or {})
+            if profile is not None and profile not in profiles:
+                raise KeyError(profile)
+            if category is not None:
+                data.setdefault("category_profiles", {})[category] = profile
+                return
+            for device in data.get("devices", []):
+                if device.get("id") == camera_id:
+                    if profile is None:
+                        device.pop("inference_profile", None)
+                    else:
+                        device["inference_profile"] = profile
+                    return
+            raise KeyError(camera_id)
+
+        self._update_file(update)
+
+    def record(self, profile: InferenceProfile, seconds: float):
+        """Account inference time to a profile for /detection/stats"""
+        stats = self.stats.get(profile.name)
+        if stats is None:
+            stats = self.stats[profile.name] = {"frames": 0, "inference_seconds": 0.0, "since": time.time()}
+        stats["frames"] += 1
+        stats["inference_seconds"] += seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        result = {}
+        for name, stats in self.stats.items():
+            frames = stats["frames"]
+            elapsed = max(now - stats["since"], 1e-9)
+            result[name] = {
+                "frames": frames,
+                "inference_seconds": round(stats["inference_seconds"], 3),
+                "avg_inference_ms": round(1000 * stats["inference_seconds"] / frames, 2) if frames else None,
+                # Share of one CPU core spent on this profile's inference
+                "core_utilisation": round(stats["inference_seconds"] / elapsed, 3),
+            }
+        return result
+
+
+profile_registry = ProfileRegistry()
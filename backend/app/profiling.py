@@ -0,0 +1,252 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "cctv-profiles"))
+MAX_PROFILE_SECONDS = 120
+MAX_ARTEFACTS = 20
+TRACE_STAGES = ("decode", "preprocess", "inference", "postprocess", "serialize", "send")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class DeterministicSession:
+    """cProfile session; for one camera it is only enabled around that camera's frame work"""
+    mode = "deterministic"
+
+    def __init__(self, camera_id: Optional[str] = None):
+        self.camera_id = camera_id
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        if self.camera_id is None:
+            self.profile.enable()
+
+    def stop(self):
+        if self.camera_id is None:
+            self.profile.disable()
+
+    # Used by the pipeline when this session targets its camera
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def report(self, path: str, top: int) -> Dict[str, Any]:
+        self.profile.dump_stats(path)
+        stats = pstats.Stats(self.profile, stream=io.StringIO())
+        functions = []
+        for (filename, line, name), (cc, ncalls, tottime, cumtime, _) in stats.stats.items():
+            functions.append({
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "ncalls": ncalls,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            })
+        functions.sort(key=lambda f: f["tottime_ms"], reverse=True)
+        return {"functions": functions[:top], "format": "pstats"}
+
+
+class SamplingSession:
+    """Samples every thread's Python stack from a background thread.
+
+    Costs nothing when not running; while running the sampled threads only pay
+    for the GIL hand-offs of the sampler.
+    """
+    mode = "sampling"
+
+    def __init__(self, interval: float = 0.005):
+        self.camera_id = None
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cctv-sampler", daemon=True)
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def enable(self):
+        pass
+
+    def disable(self):
+        pass
+
+    def report(self, path: str, top: int) -> Dict[str, Any]:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        self_samples: Counter = Counter()
+        total_samples: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # first entry is the thread name
+            if frames:
+                self_samples[frames[-1]] += count
+            for name in set(frames):
+                total_samples[name] += count
+        functions = [{
+            "function": name,
+            "self_samples": self_samples[name],
+            "total_samples": count,
+            "est_self_ms": round(self_samples[name] * self.interval * 1000, 1),
+            "est_total_ms": round(count * self.interval * 1000, 1),
+        } for name, count in total_samples.items()]
+        functions.sort(key=lambda f: f["self_samples"], reverse=True)
+        return {"functions": functions[:top], "format": "collapsed", "samples": self.samples}
+
+
+class FrameTrace:
+    """Per-frame stage timestamps for one camera, in Chrome trace-event format"""
+
+    def __init__(self, camera_id: str, max_frames: int = 1000):
+        self.camera_id = camera_id
+        self.max_frames = max_frames
+        self.events: List[Dict[str, Any]] = []
+        self.frames = 0
+        self._origin = time.perf_counter()
+
+    def observe(self, camera_id: str, timings: Dict[str, float]):
+        if camera_id != self.camera_id or self.frames >= self.max_frames:
+            return
+        self.frames += 1
+        # Stages run back to back; rebuild their start times from the end of the frame
+        end = time.perf_counter()
+        start = end - sum(timings.get(stage, 0.0) for stage in TRACE_STAGES)
+        for stage in TRACE_STAGES:
+            seconds = timings.get(stage)
+            if seconds is None:
+                continue
+            self.events.append({
+                "name": stage, "ph": "X", "pid": 0, "tid": 0,
+                "ts": round((start - self._origin) * 1e6, 1), "dur": round(seconds * 1e6, 1),
+                "args": {"frame": self.frames},
+            })
+            start += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"traceEvents": self.events, "displayTimeUnit": "ms",
+                "otherData": {"camera_id": self.camera_id, "frames": self.frames}}
+
+
+class ProfilerManager:
+    """One profiling session at a time, looked up by camera on the pipeline hot path"""
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self.session = None
+        self.by_camera: Dict[str, Any] = {}
+        self.artefacts: Dict[str, Dict[str, Any]] = {}
+
+    def for_camera(self, camera_id: str):
+        """Session that should be enabled around this camera's frame work, if any"""
+        return self.by_camera.get(camera_id) if self.by_camera else None
+
+    async def run(self, seconds: float, mode: str = "sampling", camera_id: Optional[str] = None,
+                  interval: float = 0.005, top: int = 30) -> Dict[str, Any]:
+        if self.session is not None:
+            raise ProfilerBusy("A profiling session is already running")
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        if mode == "deterministic":
+            session = DeterministicSession(camera_id)
+        elif mode == "sampling":
+            session = SamplingSession(interval)
+        else:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+
+        self.session = session
+        if mode == "deterministic" and camera_id is not None:
+            self.by_camera[camera_id] = session
+        started = time.time()
+        try:
+            session.start()
+            await asyncio.sleep(seconds)
+        finally:
+            session.stop()
+            self.by_camera.clear()
+            self.session = None
+
+        artefact_id = uuid.uuid4().hex[:12]
+        os.makedirs(self.directory, exist_ok=True)
+        extension = "pstats" if mode == "deterministic" else "collapsed"
+        path = os.path.join(self.directory, f"{artefact_id}.{extension}")
+        loop = asyncio.get_running_loop()
+        report = await loop.run_in_executor(None, session.report, path, top)
+        report.update({
+            "id": artefact_id,
+            "mode": mode,
+            "camera_id": camera_id,
+            "started_at": started,
+            "seconds": seconds,
+            "artefact": f"/admin/profile/{artefact_id}/artefact",
+        })
+        self._remember(artefact_id, path, report)
+        return report
+
+    def _remember(self, artefact_id: str, path: str, report: Dict[str, Any]):
+        self.artefacts[artefact_id] = {"path": path, "report": report}
+        while len(self.artefacts) > MAX_ARTEFACTS:
+            oldest = next(iter(self.artefacts))
+            try:
+                os.remove(self.artefacts.pop(oldest)["path"])
+            except OSError:
+                pass
+
+    def artefact_path(self, artefact_id: str) -> Optional[str]:
+        entry = self.artefacts.get(artefact_id)
+        return entry["path"] if entry else None
+
+    async def trace(self, observers: List, camera_id: str, seconds: float,
+                    max_frames: int = 1000) -> Dict[str, Any]:
+        """Record stage timings of `camera_id` frames for `seconds` via the detector's frame observers"""
+        trace = FrameTrace(camera_id, max_frames)
+        observers.append(trace.observe)
+        try:
+            await asyncio.sleep(min(max(seconds, 0.1), MAX_PROFILE_SECONDS))
+        finally:
+            observers.remove(trace.observe)
+        return trace.to_dict()
+
+
+profiler = ProfilerManager()
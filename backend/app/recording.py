@@ -0,0 +1,330 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+import cv2
+import numpy as np
+
+from metrics import clip_frames_dropped_total, clips_written_total
+from roi import CameraGeometry
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIP_DIR = os.getenv("CLIP_DIR", os.path.join(BASE_DIR, "clips"))
+CLIP_PRE_SECONDS = float(os.getenv("CLIP_PRE_SECONDS", "10"))
+CLIP_POST_SECONDS = float(os.getenv("CLIP_POST_SECONDS", "10"))
+# Events during a clip extend it, up to this length
+CLIP_MAX_SECONDS = float(os.getenv("CLIP_MAX_SECONDS", "60"))
+# Frames per second kept in the buffer; the stream's own rate is usually higher
+CLIP_FPS = float(os.getenv("CLIP_FPS", "10"))
+CLIP_JPEG_QUALITY = int(os.getenv("CLIP_JPEG_QUALITY", "70"))
+# Memory budget of one camera's pre-event buffer
+CLIP_BUFFER_BYTES = int(float(os.getenv("CLIP_BUFFER_MB", "24")) * 1024 * 1024)
+CLIP_FOURCC = os.getenv("CLIP_FOURCC", "mp4v")
+CLIP_RETENTION = int(os.getenv("CLIP_RETENTION", "200"))
+# Frames waiting for the encoder thread; beyond this new frames are dropped
+MAX_PENDING_FRAMES = 8
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-writer")
+
+
+class EventRule:
+    """Triggers a clip when enough matching detections touch a counting line or sit in a zone.
+
+    Detections aren't tracked, so "crossing" a line means the box overlapping it; the
+    cooldown keeps one passing object from triggering on every frame.
+    """
+
+    def __init__(self, name: str, labels: Optional[List[str]] = None, line: Optional[str] = None,
+                 zone: Optional[int] = None, min_confidence: float = 0.0, min_count: int = 1,
+                 cooldown: float = CLIP_POST_SECONDS):
+        self.name = name
+        self.labels = set(labels) if labels else None
+        self.line = line
+        self.zone = zone
+        self.min_confidence = float(min_confidence)
+        self.min_count = max(int(min_count), 1)
+        self.cooldown = float(cooldown)
+        self.last_fired = 0.0
+
+    @classmethod
+    def from_config(cls, index: int, config: Dict[str, Any]) -> "EventRule":
+        known = ("labels", "line", "zone", "min_confidence", "min_count", "cooldown")
+        return cls(config.get("name") or f"rule{index}",
+                   **{key: config[key] for key in known if config.get(key) is not None})
+
+    def matches(self, detections: List, geometry: CameraGeometry) -> int:
+        count = 0
+        for detection in detections:
+            if self.labels is not None and detection.label not in self.labels:
+                continue
+            if detection.confidence < self.min_confidence:
+                continue
+            if self.line is not None and not geometry.touches_line(self.line, detection.bbox):
+                continue
+            if self.zone is not None and not geometry.in_zone(self.zone, detection.bbox):
+                continue
+            count += 1
+        return count
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "labels": sorted(self.labels) if self.labels else None,
+            "line": self.line,
+            "zone": self.zone,
+            "min_confidence": self.min_confidence,
+            "min_count": self.min_count,
+            "cooldown": self.cooldown,
+        }
+
+
+def parse_rules(camera: Dict[str, Any]) -> List[EventRule]:
+    """Event rules from the cctv.json device's `event_rules` list"""
+    rules = []
+    for index, config in enumerate(camera.get("event_rules") or []):
+        if isinstance(config, dict):
+            rules.append(EventRule.from_config(index, config))
+    return rules
+
+
+class _Clip:
+    def __init__(self, camera_id: str, event: Dict[str, Any], pre_frames: List[Tuple[float, bytes]]):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(event['timestamp']))}-{uuid.uuid4().hex[:6]}"
+        self.camera_id = camera_id
+        self.events = [event]
+        self.frames = list(pre_frames)
+        self.started = pre_frames[0][0] if pre_frames else event["timestamp"]
+        self.deadline = event["timestamp"] + CLIP_POST_SECONDS
+
+    def extend(self, event: Dict[str, Any]):
+        self.events.append(event)
+        self.deadline = min(max(self.deadline, event["timestamp"] + CLIP_POST_SECONDS),
+                            self.started + CLIP_MAX_SECONDS)
+
+
+class ClipRecorder:
+    """Keeps the last seconds of one camera as JPEG bytes and writes clips around events.
+
+    The pipeline only calls offer() and check(), which put work on a queue and never
+    wait: JPEG encoding, buffering and clip bookkeeping run on the recorder's own
+    thread, and muxing to disk on the shared clip-writer thread. When the encoder
+    falls behind, frames are dropped rather than queued.
+    """
+
+    def __init__(self, camera_id: str, camera: Dict[str, Any], rules: List[EventRule],
+                 directory: str = CLIP_DIR, fps: float = CLIP_FPS):
+        self.camera_id = camera_id
+        self.camera = camera
+        self.rules = rules
+        self.directory = directory
+        self.fps = fps
+        self.frame_interval = 1.0 / fps if fps > 0 else 0.0
+        self.buffer: deque = deque()
+        self.buffer_bytes = 0
+        self.frames_dropped = 0
+        self.clips_written = 0
+        self._geometry: Optional[CameraGeometry] = None
+        self._last_offer = 0.0
+        self._queue: queue.Queue = queue.Queue()
+        self._clip: Optional[_Clip] = None
+        self._dropped = clip_frames_dropped_total.labels(camera_id)
+        self._thread = threading.Thread(target=self._run, name=f"clip-{camera_id}", daemon=True)
+        self._thread.start()
+
+    def offer(self, frame: np.ndarray, borrowed: bool = False):
+        """Hand a decoded frame to the buffer, at most `fps` times per second.
+
+        A `borrowed` frame is overwritten by the capture later, so it is copied, but
+        only once the throttle and queue have accepted it.
+        """
+        now = time.time()
+        if now - self._last_offer < self.frame_interval:
+            return
+        self._last_offer = now
+        if self._queue.qsize() >= MAX_PENDING_FRAMES:
+            self.frames_dropped += 1
+            self._dropped.inc()
+            return
+        self._queue.put_nowait(("frame", now, frame.copy() if borrowed else frame))
+
+    def check(self, detections: List, frame_shape: Tuple[int, ...]) -> List[str]:
+        """Evaluate the rules against one analysed frame; returns the names that fired"""
+        if not self.rules or not detections:
+            return []
+        if self._geometry is None or self._geometry.frame_shape != tuple(frame_shape[:2]):
+            self._geometry = CameraGeometry(self.camera, frame_shape)
+        now = time.time()
+        fired = []
+        for rule in self.rules:
+            if now - rule.last_fired < rule.cooldown:
+                continue
+            count = rule.matches(detections, self._geometry)
+            if count >= rule.min_count:
+                rule.last_fired = now
+                fired.append(rule.name)
+                self.trigger(rule.name, {"count": count})
+        return fired
+
+    def trigger(self, rule: str, details: Optional[Dict[str, Any]] = None):
+        """Start (or extend) a clip around now"""
+        event = {"rule": rule, "timestamp": time.time()}
+        event.update(details or {})
+        self._queue.put_nowait(("event", event["timestamp"], event))
+
+    def close(self):
+        """Stop the encoder thread; a clip in progress is written with what it has"""
+        self._queue.put_nowait(None)
+
+    # Everything below runs on the recorder thread
+
+    def _run(self):
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, CLIP_JPEG_QUALITY]
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, timestamp, payload = item
+            try:
+                if kind == "frame":
+                    ok, encoded = cv2.imencode(".jpg", payload, encode_params)
+                    if ok:
+                        self._add_frame(timestamp, encoded.tobytes())
+                else:
+                    self._add_event(payload)
+            except Exception as e:
+                logger.error(f"Clip recorder for {self.camera_id} failed: {e}")
+        if self._clip is not None:
+            self._finish_clip()
+
+    def _add_frame(self, timestamp: float, jpeg: bytes):
+        if self._clip is not None:
+            self._clip.frames.append((timestamp, jpeg))
+            if timestamp >= self._clip.deadline:
+                self._finish_clip()
+
+        self.buffer.append((timestamp, jpeg))
+        self.buffer_bytes += len(jpeg)
+        while self.buffer and (self.buffer_bytes > CLIP_BUFFER_BYTES
+                               or self.buffer[0][0] < timestamp - CLIP_PRE_SECONDS):
+            _, old = self.buffer.popleft()
+            self.buffer_bytes -= len(old)
+
+    def _add_event(self, event: Dict[str, Any]):
+        if self._clip is not None:
+            self._clip.extend(event)
+            return
+        pre_frames = [item for item in self.buffer if item[0] >= event["timestamp"] - CLIP_PRE_SECONDS]
+        self._clip = _Clip(self.camera_id, event, pre_frames)
+        logger.info(f"Recording clip {self._clip.id} for {self.camera_id} ({event['rule']})")
+
+    def _finish_clip(self):
+        clip, self._clip = self._clip, None
+        if clip.frames:
+            _writer.submit(write_clip, clip, self.directory, self.fps)
+            self.clips_written += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rules": [rule.to_dict() for rule in self.rules],
+            "buffered_frames": len(self.buffer),
+            "buffer_bytes": self.buffer_bytes,
+            "buffer_seconds": round(self.buffer[-1][0] - self.buffer[0][0], 2) if len(self.buffer) > 1 else 0.0,
+            "recording": self._clip is not None,
+            "frames_dropped": self.frames_dropped,
+            "clips_written": self.clips_written,
+        }
+
+
+def write_clip(clip: _Clip, directory: str, fps: float):
+    """Decode the clip's JPEG frames into a video file plus a JSON sidecar (clip-writer thread)"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{clip.id}.mp4")
+    writer = None
+    try:
+        for _, jpeg in clip.frames:
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*CLIP_FOURCC), fps, (width, height))
+            writer.write(frame)
+    except Exception as e:
+        logger.error(f"Failed to write clip {clip.id}: {e}")
+        return
+    finally:
+        if writer is not None:
+            writer.release()
+
+    metadata = {
+        "id": clip.id,
+        "camera_id": clip.camera_id,
+        "start": clip.frames[0][0],
+        "end": clip.frames[-1][0],
+        "frames": len(clip.frames),
+        "fps": fps,
+        "events": clip.events,
+        "file": os.path.basename(path),
+        "bytes": os.path.getsize(path) if os.path.exists(path) else 0,
+    }
+    with open(os.path.join(directory, f"{clip.id}.json"), "w") as f:
+        json.dump(metadata, f)
+    clips_written_total.labels(clip.camera_id).inc()
+    logger.info(f"Wrote clip {clip.id}: {metadata['frames']} frames, {metadata['bytes']} bytes")
+    _enforce_retention(directory)
+
+
+def _enforce_retention(directory: str, keep: int = CLIP_RETENTION):
+    sidecars = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    for name in sidecars[:max(len(sidecars) - keep, 0)]:
+        clip_id = name[:-len(".json")]
+        for extension in (".json", ".mp4"):
+            try:
+                os.remove(os.path.join(directory, clip_id + extension))
+            except OSError:
+                pass
+
+
+def list_clips(camera_id: Optional[str] = None, limit: int = 100,
+               directory: str = CLIP_DIR) -> List[Dict[str, Any]]:
+    """Written clips, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    clips = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        metadata = get_clip(name[:-len(".json")], directory)
+        if metadata is None or (camera_id is not None and metadata.get("camera_id") != camera_id):
+            continue
+        clips.append(metadata)
+        if len(clips) >= limit:
+            break
+    return clips
+
+
+def get_clip(clip_id: str, directory: str = CLIP_DIR) -> Optional[Dict[str, Any]]:
+    if os.path.basename(clip_id) != clip_id:
+        return None
+    try:
+        with open(os.path.join(directory, f"{clip_id}.json")) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def clip_path(clip_id: str, directory: str = CLIP_DIR) -> Optional[str]:
+    metadata = get_clip(clip_id, directory)
+    if metadata is None:
+        return None
+    path = os.path.join(directory, metadata["file"])
+    return path if os.path.exists(path) else None
@@ -0,0 +1,255 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Margin added around the lines/zones bounding box, as a fraction of its size
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0.15"))
+ROI_MIN_MARGIN = 32  # pixels
+# Set ROI_CROP=0 to always run inference on the full frame
+ROI_CROP = os.getenv("ROI_CROP", "1") != "0"
+# Cropping a region this close to the full frame isn't worth it
+ROI_MAX_COVERAGE = 0.9
+
+DEFAULT_INPUT_SIZE = 640
+LETTERBOX_COLOR = 114  # same grey Ultralytics pads with
+STRIDE = 32  # YOLO input sides must be multiples of the largest stride
+
+
+def parse_lines(line_coordinate) -> List[Dict[str, Any]]:
+    """Counting lines from the cctv.json `line_coordinate` field (a JSON string or list)"""
+    if not line_coordinate:
+        return []
+    if isinstance(line_coordinate, str):
+        try:
+            line_coordinate = json.loads(line_coordinate)
+        except json.JSONDecodeError:
+            return []
+    return [line for line in line_coordinate if isinstance(line, dict)]
+
+
+def parse_inference_region(camera: Dict[str, Any]):
+    """The camera's `inference_region` override: None, "full" or (x1, y1, x2, y2).
+
+    A malformed override is logged and ignored, so the camera falls back to the
+    region derived from its lines and zones instead of failing every frame.
+    """
+    override = camera.get("inference_region")
+    if not override or override == "full":
+        return override or None
+    try:
+        x1, y1, x2, y2 = (int(round(float(v))) for v in override)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring inference_region {override!r} of camera {camera.get('id')}: "
+                       f"expected [x1, y1, x2, y2] or \"full\"")
+        return None
+    if x2 <= x1 or y2 <= y1:
+        logger.warning(f"Ignoring empty inference_region {override!r} of camera {camera.get('id')}")
+        return None
+    return x1, y1, x2, y2
+
+
+def region_points(camera: Dict[str, Any], zones: Optional[Sequence] = None) -> List[Tuple[float, float]]:
+    """All points of the camera's counting lines and zone polygons.
+
+    Zones come from the cctv.json device (`zones`), the same polygons event rules
+    and CameraGeometry use. The `camera_zones` table (CameraZoneModel) is a separate
+    store the pipeline doesn't read; callers that want its polygons in the region
+    pass them as `zones`.
+    """
+    points = []
+    for line in parse_lines(camera.get("line_coordinate")):
+        try:
+            points.append((float(line["startX"]), float(line["startY"])))
+            points.append((float(line["endX"]), float(line["endY"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    # Zones use the CameraZoneModel.points layout: [{"x": .., "y": ..}, ...]
+    for zone in list(zones or []) + list(camera.get("zones") or []):
+        for point in zone:
+            try:
+                points.append((float(point["x"]), float(point["y"])))
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    reference = camera.get("line_reference_size")
+    if reference and points:
+        # Lines drawn on a differently sized canvas: keep them relative to it until scaled
+        ref_w, ref_h = float(reference[0]), float(reference[1])
+        points = [(x / ref_w, y / ref_h) for x, y in points]
+    return points
+
+
+def compute_inference_region(camera: Dict[str, Any], frame_shape: Tuple[int, ...],
+                             zones: Optional[Sequence] = None,
+                             margin: float = ROI_MARGIN) -> Optional[Tuple[int, int, int, int]]:
+    """Region (x1, y1, x2, y2) worth running inference on, or None for the full frame.
+
+    A manual `inference_region` on the camera ([x1, y1, x2, y2] in frame pixels, or
+    "full") wins over the region derived from its lines and zones.
+    """
+    height, width = frame_shape[:2]
+
+    override = parse_inference_region(camera)
+    if override == "full":
+        return None
+    if override:
+        x1, y1, x2, y2 = override
+    else:
+        if not ROI_CROP:
+            return None
+        points = region_points(camera, zones)
+        if not points:
+            return None
+        xs, ys = np.array(points).T
+        if camera.get("line_reference_size"):
+            xs, ys = xs * width, ys * height
+        x1, y1, x2, y2 = xs.min(), ys.min(), xs.max(), ys.max()
+        pad_x = max((x2 - x1) * margin, ROI_MIN_MARGIN)
+        pad_y = max((y2 - y1) * margin, ROI_MIN_MARGIN)
+        x1, y1 = int(x1 - pad_x), int(y1 - pad_y)
+        x2, y2 = int(np.ceil(x2 + pad_x)), int(np.ceil(y2 + pad_y))
+
+    x1, y1 = max(x1, 0), max(y1, 0)
+    x2, y2 = min(x2, width), min(y2, height)
+    if x2 - x1 < 16 or y2 - y1 < 16:
+        return None
+    if not override and (x2 - x1) * (y2 - y1) >= ROI_MAX_COVERAGE * width * height:
+        return None
+    return x1, y1, x2, y2
+
+
+class InferenceRegion:
+    """Crops a frame region and letterboxes it once to the model input size.
+
+    The padded canvas is allocated once per camera; only the resized crop is written
+    into it per frame. It is padded to the stride-aligned rectangle around the crop,
+    not to a square, so wide crops don't feed the model grey rows. Without a crop the
+    frame is passed through and the model letterboxes it as before.
+    Boxes predicted on the model input are mapped back with to_frame().
+
+    When the capture decodes at reduced resolution, `source_shape` is the camera's
+    native frame shape: `region` is given and boxes are returned in native pixels,
+    so lines, zones and viewers keep their coordinates.
+    """
+
+    def __init__(self, region: Optional[Tuple[int, int, int, int]], frame_shape: Tuple[int, ...],
+                 input_size: int = DEFAULT_INPUT_SIZE, source_shape: Optional[Tuple[int, ...]] = None):
+        height, width = frame_shape[:2]
+        self.frame_shape = tuple(frame_shape[:2])
+        self.source_shape = tuple((source_shape or frame_shape)[:2])
+        self.output_scale = (self.source_shape[1] / float(width), self.source_shape[0] / float(height))
+        if region is not None and self.output_scale != (1.0, 1.0):
+            scale_x, scale_y = self.output_scale
+            region = (int(region[0] / scale_x), int(region[1] / scale_y),
+                      min(int(np.ceil(region[2] / scale_x)), width), min(int(np.ceil(region[3] / scale_y)), height))
+        self.region = region or (0, 0, width, height)
+        self.input_size = input_size
+
+        if not self.is_cropped:
+            # Full frame: hand it to the model untouched, boxes come back in frame pixels
+            self.scale, self.pad_x, self.pad_y = 1.0, 0, 0
+            self.resized_size = (width, height)
+            self._canvas = None
+            return
+
+        x1, y1, x2, y2 = self.region
+        crop_w, crop_h = x2 - x1, y2 - y1
+        self.scale = min(input_size / crop_w, input_size / crop_h)
+        self.resized_size = (max(int(round(crop_w * self.scale)), 1), max(int(round(crop_h * self.scale)), 1))
+        canvas_w = -(-self.resized_size[0] // STRIDE) * STRIDE
+        canvas_h = -(-self.resized_size[1] // STRIDE) * STRIDE
+        self.pad_x = (canvas_w - self.resized_size[0]) // 2
+        self.pad_y = (canvas_h - self.resized_size[1]) // 2
+        self._canvas = np.full((canvas_h, canvas_w, 3), LETTERBOX_COLOR, dtype=np.uint8)
+
+    @property
+    def is_cropped(self) -> bool:
+        return self.region != (0, 0, self.frame_shape[1], self.frame_shape[0])
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        if self._canvas is None:
+            return frame
+        x1, y1, x2, y2 = self.region
+        new_w, new_h = self.resized_size
+        # INTER_LINEAR like Ultralytics; INTER_AREA is several times slower on non-integer scales
+        resized = cv2.resize(frame[y1:y2, x1:x2], (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        self._canvas[self.pad_y:self.pad_y + new_h, self.pad_x:self.pad_x + new_w] = resized
+        return self._canvas
+
+    def to_frame(self, x1: float, y1: float, x2: float, y2: float) -> Tuple[float, float, float, float]:
+        """Map an xyxy box on the letterboxed input back to full-frame (native) pixels"""
+        ox, oy = self.region[0], self.region[1]
+        max_x, max_y = self.region[2], self.region[3]
+        x1 = min(max((x1 - self.pad_x) / self.scale + ox, ox), max_x)
+        y1 = min(max((y1 - self.pad_y) / self.scale + oy, oy), max_y)
+        x2 = min(max((x2 - self.pad_x) / self.scale + ox, ox), max_x)
+        y2 = min(max((y2 - self.pad_y) / self.scale + oy, oy), max_y)
+        scale_x, scale_y = self.output_scale
+        if scale_x != 1.0 or scale_y != 1.0:
+            x1, x2, y1, y2 = x1 * scale_x, x2 * scale_x, y1 * scale_y, y2 * scale_y
+        return x1, y1, x2, y2
+
+    def describe(self) -> Dict[str, Any]:
+        x1, y1, x2, y2 = self.region
+        height, width = self.frame_shape
+        return {
+            "region": [x1, y1, x2, y2],
+            "cropped": self.is_cropped,
+            "input_size": self.input_size,
+            "input_shape": list(self._canvas.shape[:2]) if self._canvas is not None else None,
+            "decoded_shape": list(self.frame_shape),
+            "source_shape": list(self.source_shape),
+            "pixel_fraction": round((x2 - x1) * (y2 - y1) / float(width * height), 3),
+        }
+
+
+class CameraGeometry:
+    """The camera's lines and zones in frame pixels, rebuilt when the frame size changes"""
+
+    def __init__(self, camera: Dict[str, Any], frame_shape: Tuple[int, ...]):
+        height, width = frame_shape[:2]
+        self.frame_shape = tuple(frame_shape[:2])
+        scale_x, scale_y = 1.0, 1.0
+        reference = camera.get("line_reference_size")
+        if reference:
+            scale_x, scale_y = width / float(reference[0]), height / float(reference[1])
+
+        self.lines: Dict[str, Tuple[Tuple[int, int], Tuple[int, int]]] = {}
+        for index, line in enumerate(parse_lines(camera.get("line_coordinate"))):
+            try:
+                start = (int(float(line["startX"]) * scale_x), int(float(line["startY"]) * scale_y))
+                end = (int(float(line["endX"]) * scale_x), int(float(line["endY"]) * scale_y))
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.lines[str(line.get("line_name") or index)] = (start, end)
+
+        # Zones use the CameraZoneModel.points layout: [{"x": .., "y": ..}, ...]
+        self.zones: List[np.ndarray] = []
+        for zone in camera.get("zones") or []:
+            try:
+                points = [(float(p["x"]) * scale_x, float(p["y"]) * scale_y) for p in zone]
+            except (KeyError, TypeError, ValueError):
+                points = []
+            self.zones.append(np.array(points, dtype=np.float32).reshape(-1, 1, 2))
+
+    def touches_line(self, name: str, bbox: List[float]) -> bool:
+        line = self.lines.get(name)
+        if line is None:
+            return False
+        x, y, w, h = bbox
+        inside, _, _ = cv2.clipLine((int(x), int(y), max(int(w), 1), max(int(h), 1)), line[0], line[1])
+        return inside
+
+    def in_zone(self, index: int, bbox: List[float]) -> bool:
+        """Bottom centre of the box (where the object stands) inside the zone polygon"""
+        if index >= len(self.zones) or len(self.zones[index]) < 3:
+            return False
+        x, y, w, h = bbox
+        return cv2.pointPolygonTest(self.zones[index], (x + w / 2.0, y + h), False) >= 0
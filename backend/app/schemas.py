@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 
 # Pydantic Models untuk data analitik CCTV
 # Model ini digunakan untuk memvalidasi data yang masuk dari detektor objek
@@ -33,4 +33,18 @@ class CameraZoneCreate(BaseModel):
 # Ia mewarisi CameraZoneCreate dan menambahkan id serta status aktif
 class CameraZone(CameraZoneCreate):
     id: int
-    is_active: bool
\ No newline at end of file
+    is_active: bool
+
+# Pydantic Models untuk profil inference per kamera / kategori
+# imgsz dibulatkan ke kelipatan 32, classes berisi label COCO atau class id
+# Nilai di luar batas ditolak (422) agar tidak tersimpan ke cctv.json
+class InferenceProfileConfig(BaseModel):
+    imgsz: int = Field(640, gt=0)
+    classes: Optional[List[Union[int, str]]] = None
+    conf: float = Field(0.25, ge=0, le=1)
+    iou: float = Field(0.45, ge=0, le=1)
+    target_fps: float = Field(10, gt=0)
+
+# Model ini digunakan untuk memilih profil untuk kamera atau seluruh kategori
+class InferenceProfileAssignment(BaseModel):
+    profile: Optional[str] = None
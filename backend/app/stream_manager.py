@@ -0,0 +1,251 @@
+import asyncio
+import concurrent.futures
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class StreamState:
+    """Connection states reported by StreamReconnectManager"""
+    CONNECTING = 'connecting'
+    LIVE = 'live'
+    STALLED = 'stalled'
+    BACKOFF = 'backoff'
+    STOPPED = 'stopped'
+
+
+def _set_once(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+class StreamReconnectManager:
+    """Keep one camera stream open, reconnecting with jittered exponential backoff.
+
+    The capture is opened and read on the stream's own reader thread, so a hung
+    HLS read never blocks the event loop and cameras never queue behind each
+    other in a shared pool. A stream is considered stalled when a read that is
+    running returns no frame within ``stall_timeout`` seconds, or after
+    ``max_read_failures`` consecutive failed reads; the capture is then released
+    and reopened after a backoff delay on a fresh thread (the hung one exits once
+    its read returns).
+    While waiting in backoff the manager only sleeps, so flapping cameras cost
+    nothing but a timer each.
+    """
+
+    def __init__(self, stream_url: str, camera_id: Optional[str] = None,
+                 stall_timeout: float = 10.0, max_read_failures: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 capture_factory: Callable[[str], Any] = cv2.VideoCapture):
+        self.stream_url = stream_url
+        self.camera_id = camera_id or stream_url
+        self.stall_timeout = stall_timeout
+        self.max_read_failures = max_read_failures
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.capture_factory = capture_factory
+
+        self.state = StreamState.CONNECTING
+        self.is_running = False
+        self._cap = None
+        self._reader: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: List[Callable[[str, Dict[str, Any]], Any]] = []
+
+        # Stats
+        self.attempt = 0
+        self.reconnects = 0
+        self.frames_read = 0
+        self.read_failures = 0
+        self.last_frame_at: Optional[float] = None
+        self.last_read_seconds = 0.0  # decode time of the latest frame
+        self.state_since = time.time()
+        self.last_error: Optional[str] = None
+
+    def subscribe(self, callback: Callable[[str, Dict[str, Any]], Any]):
+        """Register a callback(state, info) for state transitions; may be a coroutine function"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    async def _set_state(self, state: str, **info):
+        if state == self.state:
+            return
+        previous = self.state
+        self.state = state
+        self.state_since = time.time()
+        logger.info(f"Stream {self.camera_id}: {previous} -> {state}")
+
+        info.update({'camera_id': self.camera_id, 'previous': previous})
+        for callback in list(self._subscribers):
+            try:
+                result = callback(state, info)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Stream state subscriber failed: {e}")
+
+    def _backoff_delay(self) -> float:
+        """Equal-jitter exponential backoff: half the ceiling fixed, half random.
+
+        Unlike full jitter (uniform(0, ceiling)) a flapping camera never retries
+        almost immediately, while reconnects of many cameras still spread out.
+        """
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** max(self.attempt - 1, 0)))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def _new_reader(self):
+        """Replace the reader thread; a read still hung on the old one finishes there"""
+        if self._reader is not None:
+            self._reader.shutdown(wait=False)
+        self._reader = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"capture-{self.camera_id}")
+
+    def _read(self, cap, started):
+        """Runs on the reader thread; `started` tells the loop when the read began"""
+        try:
+            self._loop.call_soon_threadsafe(_set_once, started, time.perf_counter())
+        except RuntimeError:
+            pass  # loop already closed (shutdown); nobody waits for this read
+        read_started = time.perf_counter()
+        ret, frame = cap.read()
+        return ret, frame, time.perf_counter() - read_started
+
+    def _open(self):
+        cap = self.capture_factory(self.stream_url)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cap
+
+    def _release(self, pending=None):
+        """Release the capture; if a read is still in flight, release once it returns"""
+        cap, self._cap = self._cap, None
+        if cap is None:
+            return
+
+        def release(_=None):
+            try:
+                cap.release()
+            except Exception as e:
+                logger.error(f"Failed to release stream {self.camera_id}: {e}")
+
+        if pending is not None and not pending.done():
+            pending.add_done_callback(release)
+        else:
+            release()
+
+    async def _connect(self, loop) -> bool:
+        """Open the capture, sleeping in backoff after failed attempts"""
+        while self.is_running:
+            if self.attempt > 0:
+                delay = self._backoff_delay()
+                await self._set_state(StreamState.BACKOFF, delay=round(delay, 2),
+                                      attempt=self.attempt, error=self.last_error)
+                await asyncio.sleep(delay)
+                if not self.is_running:
+                    return False
+
+            await self._set_state(StreamState.CONNECTING, attempt=self.attempt)
+            self.attempt += 1
+            try:
+                self._cap = await loop.run_in_executor(self._reader, self._open)
+                if self._cap is not None:
+                    return True
+                self.last_error = f"Failed to open stream: {self.stream_url}"
+            except Exception as e:
+                self.last_error = str(e)
+            logger.warning(f"Stream {self.camera_id}: open attempt {self.attempt} failed: {self.last_error}")
+        return False
+
+    async def frames(self):
+        """Yield frames until stop() is called, transparently reconnecting"""
+        self.is_running = True
+        loop = self._loop = asyncio.get_running_loop()
+        self._new_reader()
+        pending = None
+        try:
+            while self.is_running:
+                if self._cap is None and not await self._connect(loop):
+                    break
+
+                failures = 0
+                while self.is_running:
+                    started = loop.create_future()
+                    pending = loop.run_in_executor(self._reader, self._read, self._cap, started)
+                    try:
+                        # The stall timer only runs once the read is actually running
+                        await asyncio.wait({started, pending}, return_when=asyncio.FIRST_COMPLETED)
+                        ret, frame, self.last_read_seconds = await asyncio.wait_for(
+                            asyncio.shield(pending), self.stall_timeout)
+                    except asyncio.TimeoutError:
+                        self.last_error = f"No frame for {self.stall_timeout}s"
+                        break
+
+                    if not ret:
+                        failures += 1
+                        self.read_failures += 1
+                        if failures >= self.max_read_failures:
+                            self.last_error = f"{failures} consecutive read failures"
+                            break
+                        await asyncio.sleep(0.05 * failures)
+                        continue
+
+                    self.attempt = 0
+                    failures = 0
+                    self.frames_read += 1
+                    self.last_frame_at = time.time()
+                    if self.state != StreamState.LIVE:
+                        await self._set_state(StreamState.LIVE)
+                    yield frame
+
+                if not self.is_running:
+                    break
+
+                # Stalled or failing: drop the dead capture and reconnect on a fresh thread
+                await self._set_state(StreamState.STALLED, error=self.last_error)
+                self.reconnects += 1
+                self.attempt = max(self.attempt, 1)
+                self._release(pending)
+                if pending is not None and not pending.done():
+                    self._new_reader()
+        finally:
+            self._release(pending)
+            if self._reader is not None:
+                self._reader.shutdown(wait=False)
+                self._reader = None
+            self.is_running = False
+            await self._set_state(StreamState.STOPPED)
+
+    def stop(self):
+        self.is_running = False
+
+    @property
+    def source_shape(self):
+        """Native frame shape when the capture delivers frames scaled down, else None"""
+        return getattr(self._cap, 'source_shape', None)
+
+    @property
+    def reuses_frames(self) -> bool:
+        """Whether yielded frames are views the capture overwrites later (FFmpegCapture's ring)"""
+        return hasattr(self._cap, 'source_shape')
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'camera_id': self.camera_id,
+            'state': self.state,
+            'state_since': self.state_since,
+            'attempt': self.attempt,
+            'reconnects': self.reconnects,
+            'frames_read': self.frames_read,
+            'read_failures': self.read_failures,
+            'last_frame_at': self.last_frame_at,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Compare inference backends (torch / onnx / openvino, fp32 / int8) on a fixed local clip.
+
+Reports fps and agreement with the torch fp32 detections (IoU-matched recall and
+precision, mean IoU of matches). Export the artefacts first with export_model.py.
+
+    python benchmarks/bench_backends.py --clip traffic.mp4 --frames 200 --output backends.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from inference_backends import BACKENDS
+
+
+def read_clip(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"No frames read from {path}")
+    return frames
+
+
+def boxes_of(result):
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 4)), np.zeros(0, dtype=int)
+    return result.boxes.xyxy.cpu().numpy(), result.boxes.cls.cpu().numpy().astype(int)
+
+
+def iou_matrix(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def agreement(reference, candidate, threshold=0.5):
+    """Greedy same-class IoU matching of candidate detections against the reference"""
+    matched, ious, ref_total, cand_total = 0, [], 0, 0
+    for (ref_boxes, ref_cls), (boxes, cls) in zip(reference, candidate):
+        ref_total += len(ref_boxes)
+        cand_total += len(boxes)
+        iou = iou_matrix(ref_boxes, boxes)
+        iou[ref_cls[:, None] != cls[None, :]] = 0
+        while iou.size and iou.max() >= threshold:
+            i, j = np.unravel_index(iou.argmax(), iou.shape)
+            ious.append(iou[i, j])
+            matched += 1
+            iou[i, :] = 0
+            iou[:, j] = 0
+    return {
+        "recall": matched / ref_total if ref_total else 1.0,
+        "precision": matched / cand_total if cand_total else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else None,
+        "detections": cand_total,
+    }
+
+
+def run_backend(backend, frames, imgsz, warmup):
+    imgsz = backend.fit_imgsz(imgsz)
+    for frame in frames[:warmup]:
+        backend(frame, imgsz=imgsz, verbose=False)
+    latencies, outputs = [], []
+    for frame in frames:
+        started = time.perf_counter()
+        results = backend(frame, imgsz=imgsz, verbose=False)
+        latencies.append(time.perf_counter() - started)
+        outputs.append(boxes_of(results[0]))
+    latencies.sort()
+    return outputs, {
+        "fps": len(latencies) / sum(latencies),
+        "latency_ms_p50": 1000 * statistics.median(latencies),
+        "latency_ms_p95": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clip", required=True, help="Local video file")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--precision", nargs="+", default=["fp32", "int8"])
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    frames = read_clip(args.clip, args.frames)
+    results = {"clip": args.clip, "frames": len(frames), "imgsz": args.imgsz, "threads": cv2.getNumThreads(),
+               "runs": {}}
+
+    reference = None
+    for name in args.backends:
+        backend_cls = BACKENDS[name]
+        for precision in (["fp32"] if name == "torch" else args.precision):
+            key = f"{name}-{precision}"
+            if not backend_cls.is_available():
+                results["runs"][key] = {"skipped": f"{backend_cls.requires} not installed"}
+                continue
+            try:
+                backend = backend_cls(args.weights, precision).load()
+            except Exception as e:
+                results["runs"][key] = {"skipped": str(e)}
+                continue
+            outputs, timing = run_backend(backend, frames, args.imgsz, args.warmup)
+            if reference is None:
+                reference = outputs
+                timing["reference"] = True
+            timing.update(agreement(reference, outputs))
+            results["runs"][key] = timing
+            print(f"{key:16s} {timing['fps']:7.2f} fps  recall={timing['recall']:.3f}  "
+                  f"precision={timing['precision']:.3f}")
+
+    base = results["runs"].get("torch-fp32", {}).get("fps")
+    if base:
+        for run in results["runs"].values():
+            if "fps" in run:
+                run["speedup_vs_torch"] = run["fps"] / base
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
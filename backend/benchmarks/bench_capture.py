@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Compare capture backends (cv2.VideoCapture vs FFmpegCapture) decoding a local clip.
+
+OpenCV decodes every frame at full resolution into a new array; FFmpegCapture lets
+ffmpeg drop to --fps and scale to --width, reading into a preallocated ring. Reports
+decode CPU (this process plus the ffmpeg child) per delivered frame and per second of
+video, and bytes / new arrays allocated per read (tracemalloc, separate pass).
+
+    python benchmarks/bench_capture.py --clip traffic.mp4 --width 960 --fps 10 --output capture.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from capture import FFmpegCapture, ffmpeg_available
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def clip_info(path):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+    return fps, frames, size
+
+
+def run_timed(open_capture, limit):
+    """Read up to `limit` frames; CPU includes ffmpeg once it has exited (waited for in release)"""
+    cpu_started, started = cpu_seconds(), time.perf_counter()
+    cap = open_capture()
+    delivered, shape = 0, None
+    while delivered < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        delivered += 1
+        shape = frame.shape
+    cap.release()
+    wall = time.perf_counter() - started
+    return delivered, shape, wall, cpu_seconds() - cpu_started
+
+
+def run_allocations(open_capture, limit):
+    cap = open_capture()
+    tracemalloc.start()
+    allocated, new_arrays, reads = 0, 0, 0
+    while reads < limit:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        allocated += tracemalloc.get_traced_memory()[1] - before
+        new_arrays += frame.base is None  # an array owning its buffer was allocated for this read
+        reads += 1
+        del frame
+    tracemalloc.stop()
+    cap.release()
+    reads = max(reads, 1)
+    return {"bytes_allocated_per_read": allocated / reads, "new_arrays_per_read": new_arrays / reads}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clip", required=True, help="Local video file")
+    parser.add_argument("--width", type=int, default=960, help="FFmpegCapture output width")
+    parser.add_argument("--fps", type=float, default=10, help="FFmpegCapture output fps")
+    parser.add_argument("--seconds", type=float, default=60, help="Seconds of video to decode")
+    parser.add_argument("--alloc-reads", type=int, default=50)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    source_fps, source_frames, size = clip_info(args.clip)
+    seconds = min(args.seconds, source_frames / source_fps) if source_frames > 0 else args.seconds
+    backends = {"opencv": (lambda: cv2.VideoCapture(args.clip), int(seconds * source_fps))}
+    if ffmpeg_available():
+        backends[f"ffmpeg-{args.width}w-{args.fps:g}fps"] = (
+            lambda: FFmpegCapture(args.clip, width=args.width, fps=args.fps), int(seconds * args.fps))
+
+    results = {"clip": args.clip, "source_size": size, "source_fps": source_fps, "seconds": seconds,
+               "runs": {}}
+    if not ffmpeg_available():
+        results["runs"]["ffmpeg"] = {"skipped": "ffmpeg not found (FFMPEG_BIN)"}
+
+    for name, (open_capture, limit) in backends.items():
+        delivered, shape, wall, cpu = run_timed(open_capture, limit)
+        run = {
+            "frames": delivered,
+            "frame_shape": list(shape) if shape else None,
+            "wall_seconds": wall,
+            "cpu_seconds": cpu,
+            "cpu_ms_per_frame": 1000 * cpu / max(delivered, 1),
+            "cpu_seconds_per_video_second": cpu / seconds if seconds else None,
+        }
+        run.update(run_allocations(open_capture, args.alloc_reads))
+        results["runs"][name] = run
+        print(f"{name:24s} {run['cpu_ms_per_frame']:7.2f} ms cpu/frame  "
+              f"{run['cpu_seconds_per_video_second']:.3f} cpu s/video s  "
+              f"{run['bytes_allocated_per_read'] / 1024:9.1f} KiB alloc/read")
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
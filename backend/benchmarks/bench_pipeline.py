@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of CCTVObjectDetector.process_stream on a synthetic clip.
+
+Drives the real pipeline (reconnect manager, ROI, profile, post-processing,
+JSON serialisation, WebSocket send to an in-memory socket) with the built-in
+MockDetector and/or the real YOLO model. Runs offline on CPU. Reports per-stage
+latency percentiles and overall fps, saved as JSON for comparing runs:
+
+    python benchmarks/bench_pipeline.py --model mock real --output run.json
+    python benchmarks/bench_pipeline.py --output new.json --compare run.json
+
+    # Logging overhead: synchronous stderr writes vs the queued writer thread
+    python benchmarks/bench_pipeline.py --model mock --log-per-frame 5 --log sync 2>log.txt
+    python benchmarks/bench_pipeline.py --model mock --log-per-frame 5 --log queue 2>log.txt
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "app"))
+sys.path.insert(0, BENCH_DIR)
+
+from object_detection import YOLO_AVAILABLE, CCTVObjectDetector, MockDetector
+from stream_manager import StreamState
+from synthetic import generate_clip
+
+STAGES = ("decode", "preprocess", "inference", "postprocess", "serialize", "send")
+bench_logger = logging.getLogger("bench_pipeline")
+PERCENTILES = (50, 90, 99)
+
+
+class MemoryWebSocket:
+    """Stands in for the browser WebSocket; keeps only message counts and sizes"""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    async def send_text(self, text):
+        self.messages += 1
+        self.bytes += len(text)
+
+
+def summarize(values):
+    if not values:
+        return None
+    ms = np.asarray(values) * 1000
+    summary = {f"p{p}": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    summary.update({"mean": round(float(ms.mean()), 3), "max": round(float(ms.max()), 3), "count": len(ms)})
+    return summary
+
+
+def use_sync_logging():
+    """Write records straight to stderr from the logging thread, as logging.basicConfig does"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    root.addHandler(handler)
+
+
+async def run_pipeline(clip, model_name, model_path, camera, max_frames, log_per_frame=0):
+    detector = CCTVObjectDetector(model_path)
+    if model_name == "mock":
+        detector.model = MockDetector()
+    else:
+        await detector.ensure_model_loaded()
+        if isinstance(detector.model, MockDetector):
+            return {"skipped": "YOLO model could not be loaded"}
+    detector.read_interval = 0
+
+    samples = {stage: [] for stage in STAGES}
+    analysed = []
+
+    def observe(camera_id, timings):
+        analysed.append(time.perf_counter())
+        for stage, seconds in timings.items():
+            samples.setdefault(stage, []).append(seconds)
+        # Stand-in for per-message INFO log sites on the request path
+        if log_per_frame:
+            log_started = time.perf_counter()
+            for _ in range(log_per_frame):
+                bench_logger.info("Detection results sent for %s: %s", camera_id, timings)
+            samples.setdefault("log", []).append(time.perf_counter() - log_started)
+        if max_frames and len(analysed) >= max_frames:
+            detector.stop()
+
+    detector.frame_observers.append(observe)
+    websocket = MemoryWebSocket()
+    camera_id = camera["id"]
+
+    started = time.perf_counter()
+    task = asyncio.create_task(detector.process_stream(clip, websocket, cctv_id=camera_id, camera=camera))
+    # The reconnect manager treats end-of-file as a stall; that ends the run
+    while not task.done():
+        stream = detector.streams.get(camera_id)
+        if stream is not None and stream.state in (StreamState.STALLED, StreamState.BACKOFF):
+            detector.stop()
+        await asyncio.sleep(0.01)
+    await task
+
+    if not analysed:
+        return {"error": "no frames analysed"}
+    elapsed = analysed[-1] - started
+    return {
+        "frames_analysed": len(analysed),
+        "elapsed_s": round(elapsed, 3),
+        "fps": round(len(analysed) / elapsed, 2),
+        "messages_sent": websocket.messages,
+        "bytes_sent": websocket.bytes,
+        "stages_ms": {stage: summarize(values) for stage, values in samples.items() if values},
+        "inference_backend": detector.get_statistics().get("inference_backend"),
+    }
+
+
+def compare(current, baseline_path, tolerance, min_delta_ms=0.05):
+    """Print p50 deltas against a previous run; returns True when something regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressed = False
+    for model_name, run in current["runs"].items():
+        base = baseline.get("runs", {}).get(model_name)
+        if not base or "stages_ms" not in base or "stages_ms" not in run:
+            continue
+        print(f"\n{model_name}: fps {base['fps']} -> {run['fps']}")
+        for stage, summary in run["stages_ms"].items():
+            before = (base["stages_ms"].get(stage) or {}).get("p50")
+            if not before or not summary:
+                continue
+            ratio = summary["p50"] / before
+            flag = ""
+            # Sub-0.05ms stages are timer noise, only flag real slowdowns
+            if ratio > 1 + tolerance and summary["p50"] - before > min_delta_ms:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"  {stage:12s} p50 {before:9.3f} -> {summary['p50']:9.3f} ms ({ratio - 1:+.1%}){flag}")
+        if run["fps"] < base["fps"] * (1 - tolerance):
+            print(f"  fps dropped more than {tolerance:.0%}  REGRESSION")
+            regressed = True
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", nargs="+", choices=["mock", "real"], default=["mock", "real"])
+    parser.add_argument("--model-path", default="yolov8n.pt")
+    parser.add_argument("--frames", type=int, default=300, help="Length of the synthetic clip")
+    parser.add_argument("--max-frames", type=int, default=0, help="Stop after this many analysed frames")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--clip", help="Use this video instead of generating one")
+    parser.add_argument("--lines", action="store_true", help="Give the camera counting lines so ROI cropping is used")
+    parser.add_argument("--log", choices=["queue", "sync"], default="queue",
+                        help="Log through the queued writer thread, or synchronously to stderr")
+    parser.add_argument("--log-per-frame", type=int, default=0,
+                        help="INFO records logged per analysed frame, to measure logging overhead")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    clip = args.clip or generate_clip(
+        os.path.join(tempfile.gettempdir(), "cctv-bench",
+                     f"synthetic_{args.width}x{args.height}_{args.frames}_{args.seed}.avi"),
+        args.frames, args.width, args.height, seed=args.seed)
+
+    camera = {"id": "bench", "category": "bench",
+              # Analyse every frame: no target fps pacing in the benchmark
+              "inference_profile": {"profile": "default", "target_fps": 0, "imgsz": args.imgsz}}
+    if args.lines:
+        w, h = args.width, args.height
+        camera["line_coordinate"] = json.dumps([
+            {"startX": w * 0.2, "startY": h * 0.6, "endX": w * 0.7, "endY": h * 0.55, "line_name": "north"},
+            {"startX": w * 0.3, "startY": h * 0.4, "endX": w * 0.6, "endY": h * 0.38, "line_name": "south"},
+        ])
+
+    if args.log == "sync":
+        use_sync_logging()
+
+    results = {
+        "clip": clip,
+        "created_at": time.time(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "yolo_available": YOLO_AVAILABLE,
+        },
+        "config": vars(args),
+        "runs": {},
+    }
+    for model_name in args.model:
+        results["runs"][model_name] = asyncio.run(
+            run_pipeline(clip, model_name, args.model_path, camera, args.max_frames, args.log_per_frame))
+
+    print(json.dumps(results["runs"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark startup cost: import time of the backend modules and time-to-first-detection.
+
+Each measurement runs in a fresh interpreter so module caches don't hide the cost.
+
+    python benchmarks/bench_startup.py --runs 3 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+
+IMPORT_DETECTOR = """
+import sys, time
+sys.path.insert(0, {app_dir!r})
+t = time.perf_counter()
+import object_detection
+print(time.perf_counter() - t)
+"""
+
+IMPORT_APP = """
+import sys, time
+sys.path.insert(0, {backend_dir!r})
+t = time.perf_counter()
+from app.main import app
+print(time.perf_counter() - t)
+"""
+
+FIRST_DETECTION = """
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+import numpy as np
+from object_detection import CCTVObjectDetector
+detector = CCTVObjectDetector({model_path!r})
+t = time.perf_counter()
+detector.load_model(warm_up={warm_up!r})
+loaded = time.perf_counter()
+frame = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+detector.model(frame, verbose=False)
+done = time.perf_counter()
+detector.model(frame, verbose=False)
+print(json.dumps({{
+    "load": detector.model_load_time,
+    "warmup": detector.warmup_time,
+    "first_inference": done - loaded,
+    "second_inference": time.perf_counter() - done,
+    "time_to_first_detection": done - t,
+    "mock_model": type(detector.model).__name__ == "MockDetector",
+}}))
+"""
+
+
+def run_snippet(code: str) -> str:
+    env = dict(os.environ, DETECTOR_PRELOAD="0")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=BACKEND_DIR, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "failed")
+    return result.stdout.strip().splitlines()[-1]
+
+
+def summarize(values):
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values),
+        "runs": len(values),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+
+    detector_imports = [float(run_snippet(IMPORT_DETECTOR.format(app_dir=APP_DIR))) for _ in range(args.runs)]
+    results["import_object_detection"] = summarize(detector_imports)
+
+    try:
+        app_imports = [float(run_snippet(IMPORT_APP.format(backend_dir=BACKEND_DIR))) for _ in range(args.runs)]
+        results["import_app_main"] = summarize(app_imports)
+    except RuntimeError as e:
+        results["import_app_main"] = {"error": str(e)}
+
+    for warm_up in (True, False):
+        runs = [json.loads(run_snippet(FIRST_DETECTION.format(app_dir=APP_DIR, model_path=args.model,
+                                                              warm_up=warm_up)))
+                for _ in range(args.runs)]
+        key = "first_detection_warm" if warm_up else "first_detection_cold"
+        results[key] = {
+            metric: summarize([r[metric] for r in runs if r[metric] is not None])
+            for metric in ("load", "first_inference", "second_inference", "time_to_first_detection")
+        }
+        results[key]["mock_model"] = runs[0]["mock_model"]
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Load test /proxy and /ws/detection against a local fake HLS origin.
+
+Starts (as subprocesses) a fake live HLS origin and, unless --backend-url is
+given, a backend pointed at a generated cctv.json whose devices stream from that
+origin. Then simulates N browser viewers polling playlists and fetching segments
+through /proxy and M WebSocket detection subscribers, while sampling backend
+RSS/CPU. Everything runs locally without network.
+
+    python benchmarks/loadtest.py --viewers 50 --subscribers 4 --cameras 4 --duration 60 --output load.json
+
+Segments are real MPEG-TS when ffmpeg is installed (so the detector can decode
+them); otherwise they are TS-packet-shaped filler that only exercises the proxy.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote, unquote
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+SEGMENT_DURATION = 2.0
+PLAYLIST_WINDOW = 5
+TS_PACKET = 188
+
+
+# --- Fake HLS origin ---------------------------------------------------------
+
+def prepare_segments(directory, segment_kb=400, count=10, width=1280, height=720):
+    """Create `count` .ts segments in `directory`, encoded with ffmpeg when available"""
+    os.makedirs(directory, exist_ok=True)
+    existing = sorted(f for f in os.listdir(directory) if f.endswith(".ts"))
+    if len(existing) >= count:
+        return existing[:count]
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        from synthetic import generate_clip
+
+        fps = 25
+        clip = generate_clip(os.path.join(directory, "source.avi"), int(count * SEGMENT_DURATION * fps),
+                             width, height, fps)
+        subprocess.run([
+            ffmpeg, "-loglevel", "error", "-y", "-i", clip, "-c:v", "libx264", "-preset", "veryfast",
+            "-g", str(int(fps * SEGMENT_DURATION)), "-sc_threshold", "0", "-f", "segment",
+            "-segment_time", str(SEGMENT_DURATION), "-segment_format", "mpegts",
+            os.path.join(directory, "seg_%03d.ts"),
+        ], check=True)
+    else:
+        packets = segment_kb * 1024 // TS_PACKET
+        for index in range(count):
+            payload = bytearray(os.urandom(packets * TS_PACKET))
+            payload[::TS_PACKET] = b"\x47" * packets
+            with open(os.path.join(directory, f"seg_{index:03d}.ts"), "wb") as f:
+                f.write(payload)
+    return sorted(f for f in os.listdir(directory) if f.endswith(".ts"))[:count]
+
+
+def create_origin_app(directory):
+    """Live-advancing playlist per camera that cycles through the prepared segments"""
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import Response
+
+    segments = prepare_segments(directory)
+    payloads = []
+    for name in segments:
+        with open(os.path.join(directory, name), "rb") as f:
+            payloads.append(f.read())
+    started = time.time()
+    app = FastAPI()
+
+    @app.get("/live/{camera}/playlist.m3u8")
+    def playlist(camera: str):
+        newest = int((time.time() - started) / SEGMENT_DURATION) + PLAYLIST_WINDOW
+        first = max(newest - PLAYLIST_WINDOW, 0)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(SEGMENT_DURATION)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        for sequence in range(first, newest):
+            if sequence and sequence % len(payloads) == 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f"#EXTINF:{SEGMENT_DURATION:.3f},")
+            lines.append(f"segment_{sequence}.ts")
+        return Response("\n".join(lines) + "\n", media_type="application/vnd.apple.mpegurl")
+
+    @app.get("/live/{camera}/segment_{sequence}.ts")
+    def segment(camera: str, sequence: int):
+        if sequence < 0:
+            raise HTTPException(status_code=404)
+        return Response(payloads[sequence % len(payloads)], media_type="video/mp2t")
+
+    return app
+
+
+def serve_origin(port, directory):
+    import uvicorn
+
+    uvicorn.run(create_origin_app(directory), host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- Process helpers ---------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_http(client, url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            r = await client.get(url)
+            if r.status_code < 500:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def write_devices(path, origin_url, cameras):
+    devices = [{
+        "id": f"load-{index}",
+        "type": f"Camera {index}",
+        "category": "Dalam Kota",
+        "line_coordinate": "",
+        "coordinate": "",
+        "location": f"LOAD_{index}",
+        "link": f"{origin_url}/live/cam{index}/playlist.m3u8",
+        "line_category": "Garis2",
+    } for index in range(cameras)]
+    with open(path, "w") as f:
+        json.dump({"devices": devices}, f)
+    return devices
+
+
+class ResourceSampler:
+    """RSS and CPU of a process from /proc (psutil is not required)"""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._page = os.sysconf("SC_PAGE_SIZE")
+
+    def _read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self._ticks
+        with open(f"/proc/{self.pid}/statm") as f:
+            rss = int(f.read().split()[1]) * self._page
+        return cpu_seconds, rss
+
+    async def run(self, started):
+        try:
+            last_cpu, _ = self._read()
+        except OSError:
+            return
+        last_time = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                cpu, rss = self._read()
+            except OSError:
+                return
+            now = time.monotonic()
+            self.samples.append({
+                "t": round(now - started, 2),
+                "rss_mb": round(rss / 2 ** 20, 1),
+                "cpu_percent": round(100 * (cpu - last_cpu) / (now - last_time), 1),
+            })
+            last_cpu, last_time = cpu, now
+
+
+# --- Simulated clients -------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = 0
+        self.messages = {}
+
+    def ok(self, kind, seconds, size=0):
+        self.latencies.setdefault(kind, []).append(seconds)
+        self.bytes += size
+
+    def error(self, kind, reason):
+        key = f"{kind}:{reason}"
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def backend_path(proxied_line):
+    """Rewritten playlist lines point at the frontend's /api prefix; call the backend directly"""
+    return proxied_line[len("/api"):] if proxied_line.startswith("/api/") else proxied_line
+
+
+async def viewer(client, backend_url, playlist_url, recorder, stop_at):
+    """Poll the proxied playlist like hls.js and fetch each new segment once"""
+    seen = set()
+    url = f"{backend_url}/proxy?url={quote(playlist_url, safe='')}"
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            r = await client.get(url)
+            if r.status_code != 200:
+                recorder.error("playlist", r.status_code)
+                await asyncio.sleep(SEGMENT_DURATION)
+                continue
+            recorder.ok("playlist", time.perf_counter() - started, len(r.content))
+            segments = [line.strip() for line in r.text.splitlines() if line.startswith("/api/proxy")]
+        except Exception as e:
+            recorder.error("playlist", type(e).__name__)
+            await asyncio.sleep(SEGMENT_DURATION)
+            continue
+
+        for line in segments:
+            if line in seen or time.monotonic() >= stop_at:
+                continue
+            seen.add(line)
+            started = time.perf_counter()
+            try:
+                r = await client.get(backend_url + backend_path(line))
+                if r.status_code == 200:
+                    recorder.ok("segment", time.perf_counter() - started, len(r.content))
+                else:
+                    recorder.error("segment", r.status_code)
+            except Exception as e:
+                recorder.error("segment", type(e).__name__)
+        await asyncio.sleep(SEGMENT_DURATION / 2)
+
+
+async def subscriber(ws_url, recorder, stop_at):
+    """Hold a detection WebSocket open and measure message rate and delivery lag"""
+    import websockets
+
+    try:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            while time.monotonic() < stop_at:
+                try:
+                    text = await asyncio.wait_for(ws.recv(), timeout=max(stop_at - time.monotonic(), 0.1))
+                except asyncio.TimeoutError:
+                    break
+                received = time.time()
+                message = json.loads(text)
+                kind = message.get("type", "unknown")
+                recorder.messages[kind] = recorder.messages.get(kind, 0) + 1
+                if kind == "detection_results" and message.get("timestamp"):
+                    recorder.ok("detection_lag", max(received - message["timestamp"], 0.0), len(text))
+                elif kind == "error":
+                    recorder.error("websocket", message.get("message", "error")[:60])
+    except Exception as e:
+        recorder.error("websocket", type(e).__name__)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(p):
+        return round(1000 * values[min(int(p / 100 * len(values)), len(values) - 1)], 2)
+
+    return {"p50": pick(50), "p90": pick(90), "p99": pick(99), "max": round(1000 * values[-1], 2),
+            "count": len(values)}
+
+
+async def run_load(args, backend_url, devices, backend_pid):
+    import httpx
+
+    recorder = Recorder()
+    started = time.monotonic()
+    stop_at = started + args.duration
+    sampler = ResourceSampler(backend_pid) if backend_pid else None
+    sampler_task = asyncio.create_task(sampler.run(started)) if sampler else None
+
+    limits = httpx.Limits(max_connections=args.viewers * 2, max_keepalive_connections=args.viewers)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        tasks = []
+        for index in range(args.viewers):
+            device = devices[index % len(devices)]
+            tasks.append(asyncio.create_task(viewer(client, backend_url, device["link"], recorder, stop_at)))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / args.viewers)
+        ws_base = backend_url.replace("http", "ws", 1)
+        for index in range(args.subscribers):
+            device = devices[index % len(devices)]
+            tasks.append(asyncio.create_task(subscriber(f"{ws_base}/ws/detection/{device['id']}", recorder, stop_at)))
+        await asyncio.gather(*tasks)
+
+    elapsed = time.monotonic() - started
+    if sampler_task:
+        sampler_task.cancel()
+
+    requests = {kind: len(values) for kind, values in recorder.latencies.items()}
+    failures = {}
+    for key, count in recorder.errors.items():
+        kind = key.split(":", 1)[0]
+        failures[kind] = failures.get(kind, 0) + count
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "throughput": {
+            "requests_per_s": round(sum(requests.get(k, 0) for k in ("playlist", "segment")) / elapsed, 2),
+            "mb_per_s": round(recorder.bytes / elapsed / 2 ** 20, 2),
+            "detection_messages_per_s": round(recorder.messages.get("detection_results", 0) / elapsed, 2),
+        },
+        "latency_ms": {kind: percentiles(values) for kind, values in recorder.latencies.items()},
+        "error_rate": {
+            kind: round(failures.get(kind, 0) / max(requests.get(kind, 0) + failures.get(kind, 0), 1), 4)
+            for kind in ("playlist", "segment", "websocket")
+        },
+        "errors": recorder.errors,
+        "websocket_messages": recorder.messages,
+        "backend_resources": sampler.samples if sampler else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--viewers", type=int, default=20, help="Simulated HLS viewers through /proxy")
+    parser.add_argument("--subscribers", type=int, default=2, help="Detection WebSocket subscribers")
+    parser.add_argument("--cameras", type=int, default=4, help="Fake cameras on the origin")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--ramp", type=float, default=0, help="Seconds over which viewers join")
+    parser.add_argument("--backend-url", help="Use a running backend instead of starting one")
+    parser.add_argument("--backend-pid", type=int, help="PID to sample when using --backend-url")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "cctv-loadtest"))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--serve-origin", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    segments_dir = os.path.join(args.workdir, "segments")
+    if args.serve_origin:
+        serve_origin(args.serve_origin, segments_dir)
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    prepare_segments(segments_dir)
+    processes = []
+    try:
+        origin_port = free_port()
+        origin_url = f"http://127.0.0.1:{origin_port}"
+        processes.append(subprocess.Popen([sys.executable, __file__, "--serve-origin", str(origin_port),
+                                           "--workdir", args.workdir]))
+
+        devices_file = os.path.join(args.workdir, "cctv.json")
+        devices = write_devices(devices_file, origin_url, args.cameras)
+
+        backend_pid = args.backend_pid
+        backend_url = args.backend_url
+        if not backend_url:
+            backend_port = free_port()
+            backend_url = f"http://127.0.0.1:{backend_port}"
+            env = dict(os.environ, CCTV_FILE=devices_file)
+            backend = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                                        "--port", str(backend_port), "--log-level", "warning"],
+                                       cwd=BACKEND_DIR, env=env)
+            processes.append(backend)
+            backend_pid = backend.pid
+
+        async def wait_ready():
+            import httpx
+            async with httpx.AsyncClient() as client:
+                await wait_for_http(client, f"{origin_url}/live/cam0/playlist.m3u8")
+                await wait_for_http(client, f"{backend_url}/health")
+
+        asyncio.run(wait_ready())
+        results = asyncio.run(run_load(args, backend_url, devices, backend_pid))
+        results["config"] = {key: value for key, value in vars(args).items() if key != "serve_origin"}
+        results["real_segments"] = shutil.which("ffmpeg") is not None
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic CCTV clips: coloured rectangles moving over a static road-like background.
+
+The same arguments always produce the same pixels, so runs on different machines
+analyse identical input. Uses MJPG/AVI, which every OpenCV build can write.
+
+    python benchmarks/synthetic.py clip.avi --frames 300 --width 1280 --height 720
+"""
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+
+def synthetic_frames(frames=300, width=1280, height=720, objects=8, seed=0):
+    """Yield BGR frames with `objects` rectangles bouncing around"""
+    rng = np.random.default_rng(seed)
+
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    background[height // 3:, :] = (60, 60, 60)
+    for x in range(0, width, 120):
+        cv2.line(background, (x, height // 2), (x + 60, height // 2), (220, 220, 220), 4)
+
+    sizes = rng.integers([40, 30], [180, 120], size=(objects, 2))
+    positions = rng.uniform([0, height // 3], [width - 180, height - 120], size=(objects, 2))
+    velocities = rng.uniform(-12, 12, size=(objects, 2))
+    colors = rng.integers(0, 255, size=(objects, 3))
+
+    frame = np.empty_like(background)
+    for _ in range(frames):
+        np.copyto(frame, background)
+        positions += velocities
+        for axis, limit in ((0, width), (1, height)):
+            low = positions[:, axis] < 0
+            high = positions[:, axis] + sizes[:, axis] > limit
+            velocities[low | high, axis] *= -1
+            positions[:, axis] = np.clip(positions[:, axis], 0, limit - sizes[:, axis])
+        for (x, y), (w, h), color in zip(positions.astype(int), sizes, colors):
+            cv2.rectangle(frame, (x, y), (x + w, y + h), tuple(int(c) for c in color), -1)
+        yield frame
+
+
+def generate_clip(path, frames=300, width=1280, height=720, fps=25, objects=8, seed=0, overwrite=False):
+    """Write the clip to `path` (skipped when it already exists) and return the path"""
+    if os.path.exists(path) and not overwrite:
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write video to {path}")
+    for frame in synthetic_frames(frames, width, height, objects, seed):
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--objects", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate_clip(args.path, args.frames, args.width, args.height, args.fps, args.objects,
+                        args.seed, overwrite=True))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Script untuk export model YOLO ke ONNX / OpenVINO (FP32 dan INT8) untuk inference CPU
+
+    python export_model.py --formats onnx openvino --precision fp32 int8
+
+Artefak disimpan di MODEL_CACHE_DIR (default: backend/models) dan tidak di-export
+ulang kalau sudah ada, kecuali pakai --force. Pilih backend saat runtime dengan
+INFERENCE_BACKEND=onnx|openvino dan INFERENCE_PRECISION=fp32|int8.
+
+Artefak ber-input tetap (--imgsz) lebih cepat, tapi profil dengan imgsz lain dijalankan
+di ukuran artefak. Pakai --dynamic (plus --force bila artefak tetap sudah ada) agar tiap
+profil (mis. "border" 960) memakai imgsz-nya sendiri.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+# Add app directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from inference_backends import MODEL_CACHE_DIR, artifact_path
+
+
+def _move(src, dst):
+    if os.path.exists(dst):
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        else:
+            os.remove(dst)
+    shutil.move(str(src), dst)
+    return dst
+
+
+def _calibration_frames(clip_path, imgsz, limit=64):
+    """Letterboxed NCHW float frames from a local clip for static INT8 calibration"""
+    import cv2
+    import numpy as np
+
+    cap = cv2.VideoCapture(clip_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or limit
+    step = max(total // limit, 1)
+    index = 0
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        index += 1
+        if index % step:
+            continue
+        h, w = frame.shape[:2]
+        scale = min(imgsz / h, imgsz / w)
+        resized = cv2.resize(frame, (int(round(w * scale)), int(round(h * scale))))
+        canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+        top = (imgsz - resized.shape[0]) // 2
+        left = (imgsz - resized.shape[1]) // 2
+        canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+        blob = canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        frames.append(np.ascontiguousarray(blob))
+    cap.release()
+    return frames
+
+
+def export_onnx(weights, precision, imgsz, cache_dir, calib_clip=None, dynamic=False):
+    target = artifact_path(weights, "onnx", precision, cache_dir)
+    if precision == "fp32":
+        from ultralytics import YOLO
+        exported = YOLO(weights).export(format="onnx", imgsz=imgsz, simplify=True, dynamic=dynamic)
+        return _move(exported, target)
+
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_dynamic, quantize_static
+
+    fp32_path = artifact_path(weights, "onnx", "fp32", cache_dir)
+    if not os.path.exists(fp32_path):
+        export_onnx(weights, "fp32", imgsz, cache_dir, dynamic=dynamic)
+
+    if not calib_clip:
+        print("No --calib clip given, using dynamic INT8 quantisation")
+        quantize_dynamic(fp32_path, target, weight_type=QuantType.QUInt8)
+        return target
+
+    import onnxruntime as ort
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class ClipReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(_calibration_frames(calib_clip, imgsz))
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            return None if frame is None else {input_name: frame}
+
+    quantize_static(fp32_path, target, ClipReader(),
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return target
+
+
+def export_openvino(weights, precision, imgsz, cache_dir, data=None, dynamic=False):
+    from ultralytics import YOLO
+
+    target = artifact_path(weights, "openvino", precision, cache_dir)
+    options = {"format": "openvino", "imgsz": imgsz, "dynamic": dynamic}
+    if precision == "int8":
+        # NNCF post-training quantisation, calibrated on the given dataset yaml
+        options.update({"int8": True, "data": data or "coco8.yaml"})
+    exported = YOLO(weights).export(**options)
+    return _move(exported, target)
+
+
+def export_model(weights, formats, precisions, imgsz=640, cache_dir=MODEL_CACHE_DIR,
+                 force=False, calib_clip=None, data=None, dynamic=False):
+    """Export every format/precision combination into the cache, skipping cached ones"""
+    os.makedirs(cache_dir, exist_ok=True)
+    exported = []
+    for fmt in formats:
+        for precision in precisions:
+            target = artifact_path(weights, fmt, precision, cache_dir)
+            if os.path.exists(target) and not force:
+                print(f"Cached: {target}")
+                exported.append(target)
+                continue
+            print(f"Exporting {weights} -> {fmt} {precision}...")
+            if fmt == "onnx":
+                path = export_onnx(weights, precision, imgsz, cache_dir, calib_clip, dynamic)
+            else:
+                path = export_openvino(weights, precision, imgsz, cache_dir, data, dynamic)
+            print(f"Exported to {path}")
+            exported.append(path)
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export YOLO ke ONNX/OpenVINO untuk inference CPU")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--formats", nargs="+", choices=["onnx", "openvino"], default=["onnx", "openvino"])
+    parser.add_argument("--precision", nargs="+", choices=["fp32", "int8"], default=["fp32", "int8"])
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--cache-dir", default=MODEL_CACHE_DIR)
+    parser.add_argument("--calib", help="Local video clip for static ONNX INT8 calibration")
+    parser.add_argument("--data", help="Dataset yaml for OpenVINO INT8 calibration (default coco8.yaml)")
+    parser.add_argument("--dynamic", action="store_true",
+                        help="Dynamic input shape, so every profile runs at its own imgsz")
+    parser.add_argument("--force", action="store_true", help="Re-export even if cached")
+    args = parser.parse_args()
+
+    try:
+        export_model(args.weights, args.formats, args.precision, args.imgsz, args.cache_dir,
+                     args.force, args.calib, args.data, args.dynamic)
+    except Exception as e:
+        print(f"Error exporting model: {e}")
+        sys.exit(1)
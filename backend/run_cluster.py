@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Jalankan deteksi untuk banyak kamera di beberapa proses worker (atau host) sekaligus
+
+    # Satu mesin: broker + coordinator + 4 worker lokal
+    python run_cluster.py --workers 4 --bus unix:///tmp/cctv-bus.sock
+
+    # API membaca hasil dari bus, bukan menjalankan pipeline sendiri
+    DETECTION_MODE=cluster BUS_URL=unix:///tmp/cctv-bus.sock uvicorn app.main:app
+
+    # Multi-host: coordinator + broker TCP di satu host, worker di host lain
+    python run_cluster.py coordinator --bus tcp://0.0.0.0:7700
+    python run_cluster.py worker --bus tcp://coordinator-host:7700
+
+Kamera dibagi ke worker dengan consistent hashing dari camera id; saat worker bergabung
+atau hilang (heartbeat berhenti) hanya kamera milik worker itu yang dipindah. Dengan
+--bus redis://... broker tidak diperlukan (butuh package redis).
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from bus import BusBroker, create_bus
+from cluster import Coordinator, DetectionWorker
+from heatmap import snapshot_loop
+from log_config import configure_logging
+
+configure_logging()
+logger = logging.getLogger("run_cluster")
+
+
+def _needs_broker(url):
+    return url.startswith(("unix://", "tcp://"))
+
+
+async def run_coordinator(args, local_workers=0):
+    from profiles import CCTV_FILE
+
+    broker = None
+    if _needs_broker(args.bus):
+        broker = BusBroker(args.bus)
+        await broker.start()
+    bus = create_bus(args.bus)
+    await bus.start()
+
+    processes = []
+    for index in range(local_workers):
+        command = [sys.executable, os.path.abspath(__file__), "worker", "--bus", args.bus,
+                   "--id", f"{args.worker_prefix}{index}"]
+        processes.append(subprocess.Popen(command))
+
+    coordinator = Coordinator(bus, args.cctv_file or CCTV_FILE, args.category)
+    try:
+        await coordinator.run()
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        await bus.close()
+        if broker is not None:
+            await broker.close()
+
+
+async def run_worker(args):
+    from object_detection import detector
+
+    bus = create_bus(args.bus)
+    await bus.start()
+    detector.bus = bus
+    await detector.ensure_model_loaded()
+    worker = DetectionWorker(bus, detector, args.id)
+    # Workers own the heatmaps in cluster mode; the API serves their snapshots
+    snapshots = asyncio.create_task(snapshot_loop(detector.heatmaps))
+    try:
+        await worker.run()
+    finally:
+        snapshots.cancel()
+        await bus.close()
+
+
+def _run(coroutine):
+    """Run until SIGINT/SIGTERM, then cancel so workers leave the ring cleanly"""
+    async def main():
+        task = asyncio.create_task(coroutine)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale-out deteksi CCTV dengan consistent hashing")
+    parser.add_argument("role", nargs="?", choices=["all", "coordinator", "worker"], default="all")
+    parser.add_argument("--bus", default=os.getenv("BUS_URL", "unix:///tmp/cctv-bus.sock"))
+    parser.add_argument("--workers", type=int, default=2, help="Local worker processes (role all)")
+    parser.add_argument("--worker-prefix", default="local-")
+    parser.add_argument("--id", help="Worker id (default hostname-pid)")
+    parser.add_argument("--cctv-file", help="cctv.json to read cameras from")
+    parser.add_argument("--category", nargs="+", help="Only analyse cameras of these categories")
+    args = parser.parse_args()
+
+    if args.bus.startswith("memory://"):
+        raise SystemExit("memory:// only works inside one process; use unix://, tcp:// or redis://")
+    if args.role == "worker":
+        _run(run_worker(args))
+    else:
+        _run(run_coordinator(args, args.workers if args.role == "all" else 0))
+
+
+if __name__ == "__main__":
+    main()
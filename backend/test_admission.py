@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test admission control sesi deteksi (admission.py dan /ws/detection)
+
+    python test_admission.py   (atau: python -m pytest test_admission.py)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from admission import AdmissionController, CapacityError
+
+
+def controller(**limits):
+    options = {"max_pipelines": 2, "fps_budget": 100.0, "memory_mb": 0, "queue_size": 4,
+               "queue_timeout": 5.0, "min_fps": 2.0}
+    options.update(limits)
+    return AdmissionController(**options)
+
+
+def test_queued_session_starts_when_a_pipeline_is_released():
+    async def scenario():
+        admission = controller()
+        first = await admission.admit("cam0")
+        await admission.admit("cam1")
+        positions = []
+
+        async def on_queued(position):
+            positions.append(position)
+
+        waiting = asyncio.create_task(admission.admit("cam2", on_queued=on_queued))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        assert positions == [1]
+
+        admission.release(first)
+        ticket = await asyncio.wait_for(waiting, 1.0)
+        assert ticket.camera_id == "cam2"
+        assert sorted(t.camera_id for t in admission.tickets) == ["cam1", "cam2"]
+        assert admission.counts == {"admitted": 3, "queued": 1, "rejected": 0, "timed_out": 0}
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_the_queue_is_full():
+    async def scenario():
+        admission = controller(max_pipelines=1, queue_size=1)
+        await admission.admit("cam0")
+        queued = asyncio.create_task(admission.admit("cam1"))
+        await asyncio.sleep(0.01)
+        try:
+            await admission.admit("cam2")
+            raise AssertionError("cam2 should have been rejected")
+        except CapacityError as e:
+            assert e.reason == "queue"  # cam1 is already waiting ahead of it
+            assert e.retry_after > 0
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert admission.counts["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_and_cancelled_waiters_leave_the_queue():
+    async def scenario():
+        admission = controller(max_pipelines=1, queue_timeout=0.05)
+        first = await admission.admit("cam0")
+        try:
+            await admission.admit("cam1")
+            raise AssertionError("cam1 should have timed out")
+        except CapacityError:
+            pass
+        assert admission.counts["timed_out"] == 1
+
+        # A viewer that leaves while queued must not be started later
+        admission.queue_timeout = 5.0
+        waiting = asyncio.create_task(admission.admit("cam2"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert admission.get_stats()["usage"]["queued"] == 0
+
+        admission.release(first)
+        assert admission.tickets == []
+
+    asyncio.run(scenario())
+
+
+def test_higher_priority_is_admitted_first():
+    async def scenario():
+        admission = controller(max_pipelines=1)
+        first = await admission.admit("cam0")
+        low = asyncio.create_task(admission.admit("low", priority=0))
+        await asyncio.sleep(0.01)
+        high = asyncio.create_task(admission.admit("high", priority=5))
+        await asyncio.sleep(0.01)
+
+        admission.release(first)
+        ticket = await asyncio.wait_for(high, 1.0)
+        assert ticket.camera_id == "high"
+        assert not low.done()
+
+        admission.release(ticket)
+        assert (await asyncio.wait_for(low, 1.0)).camera_id == "low"
+
+    asyncio.run(scenario())
+
+
+def test_budget_is_shed_from_the_lowest_priority():
+    async def scenario():
+        admission = controller(max_pipelines=8, fps_budget=20.0, min_fps=4.0)
+        low = [await admission.admit(f"low{i}", priority=0, demand_fps=10.0) for i in range(2)]
+        assert all(ticket.mode == "full" for ticket in low)
+
+        high = await admission.admit("high", priority=1, demand_fps=10.0)
+        assert high.mode == "full"
+        assert [round(ticket.granted_fps, 2) for ticket in low] == [5.0, 5.0]
+        assert all(ticket.mode == "degraded" for ticket in low)
+
+        # A third low-priority camera would get 10/3 fps, under min_fps
+        admission.queue_size = 0
+        try:
+            await admission.admit("more", priority=0, demand_fps=10.0)
+            raise AssertionError("budget should be exhausted")
+        except CapacityError:
+            pass
+
+        admission.release(high)
+        assert all(ticket.mode == "full" for ticket in low)
+
+    asyncio.run(scenario())
+
+
+def test_ticket_released_when_detection_viewer_disconnects():
+    """Regression: the pipeline and its ticket used to outlive the viewer's WebSocket.
+
+    Runs a real uvicorn server: unlike uvicorn, Starlette's TestClient cancels the
+    handler when the client closes, which would hide the leak.
+    """
+    import socket
+    import threading
+
+    import uvicorn
+    import websockets
+
+    import main
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        # An unreachable stream keeps the pipeline reconnecting and never sending, holding its ticket
+        json.dump({"devices": [{"id": "cam0", "name": "cam0", "link": "/nonexistent/cam0.mp4"}]}, f)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    cctv_file, max_pipelines = main.CCTV_FILE, main.admission.max_pipelines
+    main.CCTV_FILE = f.name
+    main.admission.max_pipelines = 1
+    server = uvicorn.Server(uvicorn.Config(main.app, port=port, lifespan="off", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    async def viewer():
+        async with websockets.connect(f"ws://127.0.0.1:{port}/ws/detection/cam0") as ws:
+            assert json.loads(await ws.recv())["type"] == "ping"
+            assert json.loads(await ws.recv())["type"] == "cctv_info"
+            assert await wait_for(lambda: len(main.admission.tickets) == 1)
+
+    async def wait_for(condition, timeout=10.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return True
+            await asyncio.sleep(0.05)
+        return False
+
+    async def scenario():
+        assert await wait_for(lambda: server.started)
+        for _ in range(2):
+            await viewer()
+            # Only one pipeline fits, so the second viewer is admitted only if the first let go
+            assert await wait_for(lambda: not main.admission.tickets), "ticket not released on disconnect"
+        assert main.admission.counts["rejected"] == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.should_exit = True
+        thread.join(10)
+        main.CCTV_FILE = cctv_file
+        main.admission.max_pipelines = max_pipelines
+        os.remove(f.name)
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
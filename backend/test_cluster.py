@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Test pembagian kamera ke worker (cluster.py) dan bus in-process (bus.py)
+
+    python test_cluster.py   (atau: python -m pytest test_cluster.py)
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+import cluster
+from bus import InProcessBus, RedisBus
+from cluster import Coordinator, DetectionWorker, HashRing
+
+CAMERAS = [f"cam{i}" for i in range(1000)]
+
+
+def owners(ring):
+    return {camera: ring.node_for(camera) for camera in CAMERAS}
+
+
+def test_cameras_spread_over_workers():
+    ring = HashRing(["a", "b", "c", "d"])
+    counts = {}
+    for owner in owners(ring).values():
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == {"a", "b", "c", "d"}
+    # 128 points per worker keep every share within ~35% of the mean
+    assert all(150 <= count <= 350 for count in counts.values()), counts
+    assert HashRing().node_for("cam0") is None
+
+
+def test_only_the_leaving_workers_cameras_move():
+    ring = HashRing(["a", "b", "c", "d"])
+    before = owners(ring)
+    ring.remove("c")
+    after = owners(ring)
+
+    moved = [camera for camera in CAMERAS if before[camera] != after[camera]]
+    assert moved and all(before[camera] == "c" for camera in moved)
+    assert "c" not in after.values()
+    assert len(moved) == sum(owner == "c" for owner in before.values())
+
+
+def test_a_joining_worker_only_takes_cameras():
+    ring = HashRing(["a", "b", "c"])
+    before = owners(ring)
+    ring.add("d")
+    after = owners(ring)
+
+    moved = [camera for camera in CAMERAS if before[camera] != after[camera]]
+    assert all(after[camera] == "d" for camera in moved)
+    # Roughly a quarter of the cameras, not a reshuffle
+    assert 150 <= len(moved) <= 350
+    ring.add("d")
+    assert owners(ring) == after
+
+
+def test_nodes_for_starts_at_the_owner():
+    ring = HashRing(["a", "b", "c"])
+    for camera in CAMERAS[:50]:
+        nodes = ring.nodes_for(camera)
+        assert nodes[0] == ring.node_for(camera)
+        assert sorted(nodes) == ["a", "b", "c"]
+
+
+def coordinator(workers, cameras=20):
+    coordinator = Coordinator(InProcessBus(), os.devnull)
+    coordinator.cameras = {f"cam{i}": {"link": "x"} for i in range(cameras)}
+    for worker, capacity in workers.items():
+        coordinator.ring.add(worker)
+        coordinator.workers[worker] = {"capacity": capacity}
+    return coordinator
+
+
+def test_full_workers_overflow_to_the_next_one_on_the_ring():
+    uncapped = coordinator({"a": None, "b": None, "c": None}).compute_assignments()
+    capped = coordinator({"a": 5, "b": 5, "c": None})
+    assignments = capped.compute_assignments()
+
+    assert len(assignments["a"]) <= 5 and len(assignments["b"]) <= 5
+    assert sum(len(cameras) for cameras in assignments.values()) == 20
+    assert capped.unassigned == []
+    # Cameras whose owner still has room stay where they were
+    for worker in ("a", "b"):
+        if len(uncapped[worker]) <= 5:
+            assert assignments[worker] == uncapped[worker]
+
+
+def test_cameras_without_room_are_left_unassigned():
+    capped = coordinator({"a": 3, "b": 4})
+    assignments = capped.compute_assignments()
+    assert len(assignments["a"]) == 3 and len(assignments["b"]) == 4
+    assert len(capped.unassigned) == 13
+    assert capped.describe()["unassigned"] == capped.unassigned
+
+
+class FakeDetector:
+    """process_stream runs until stop_camera; `stuck` pipelines ignore it"""
+
+    def __init__(self):
+        self.events = {}
+        self.closed = []
+
+    async def process_stream(self, link, sink, cctv_id=None, camera=None):
+        stop = self.events[cctv_id] = asyncio.Event()
+        try:
+            if camera.get("stuck"):
+                await asyncio.sleep(60)
+            await stop.wait()
+        finally:
+            self.closed.append(cctv_id)
+
+    def stop_camera(self, camera_id):
+        if camera_id in self.events:
+            self.events[camera_id].set()
+
+
+def test_worker_hands_back_cameras_past_its_capacity():
+    async def scenario():
+        bus = InProcessBus()
+        heartbeats = bus.subscribe(cluster.HEARTBEAT_TOPIC)
+        worker = DetectionWorker(bus, FakeDetector(), "w", max_cameras=2)
+
+        await worker.apply({f"cam{i}": {"link": "x"} for i in range(3)})
+        assert sorted(worker.pipelines) == ["cam0", "cam1"]
+        _, data = await asyncio.wait_for(heartbeats.get(), 1.0)
+        heartbeat = json.loads(data)
+        assert heartbeat["capacity"] == 2
+        assert heartbeat["overflow"] == ["cam2"]
+
+        await worker.apply({})
+        assert worker.pipelines == {} and worker.overflow == []
+
+    asyncio.run(scenario())
+
+
+def test_stop_waits_for_the_pipeline_to_close():
+    async def scenario():
+        detector = FakeDetector()
+        worker = DetectionWorker(InProcessBus(), detector, "w")
+        stop_timeout, cluster.STOP_TIMEOUT = cluster.STOP_TIMEOUT, 0.1
+        try:
+            await worker.apply({"cam0": {"link": "x"}, "cam1": {"link": "x", "stuck": True}})
+            await asyncio.sleep(0)
+            await worker.apply({})
+        finally:
+            cluster.STOP_TIMEOUT = stop_timeout
+        # Both closed before apply returned: cam0 stopped, the stuck cam1 was cancelled
+        assert sorted(detector.closed) == ["cam0", "cam1"]
+
+    asyncio.run(scenario())
+
+
+def test_redis_messages_reach_each_subscriber_once():
+    class LocalRedisBus(RedisBus):
+        """RedisBus routing without a server"""
+
+        def __init__(self):
+            InProcessBus.__init__(self)
+
+        def _remote_subscribe(self, pattern):
+            pass
+
+    async def scenario():
+        bus = LocalRedisBus()
+        both = bus.subscribe("detections.*", "detections.cam1")
+        exact = bus.subscribe("detections.cam1")
+        pattern = bus.subscribe("detections.*")
+        # Redis sends a publish to detections.cam1 twice: as pmessage and as message
+        bus._deliver_via("detections.*", "detections.cam1", "a")
+        bus._deliver_via("detections.cam1", "detections.cam1", "a")
+        bus._deliver_via("detections.*", "detections.cam2", "b")
+        return [subscription.queue.qsize() for subscription in (both, exact, pattern)]
+
+    assert asyncio.run(scenario()) == [2, 1, 2]
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test penghitung objek yang melintasi garis (counting.py)
+
+    python test_counting.py   (atau: python -m pytest test_counting.py)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from counting import LineCrossingCounter, segments_cross
+from object_detection import DetectionResult
+
+FRAME = (480, 640, 3)
+# Horizontal line "gate" at y=200 from x=100 to x=500
+CAMERA = {"line_coordinate": [{"line_name": "gate", "startX": 100, "startY": 200, "endX": 500, "endY": 200}]}
+
+
+def at(label, x, bottom, w=40.0, h=60.0):
+    """Detection whose bottom centre (the tracked point) is at (x, bottom)"""
+    return DetectionResult(label, 0.9, [x - w / 2.0, bottom - h, w, h], 0, 0.0)
+
+
+def run(counter, frames):
+    crossings = []
+    for detections in frames:
+        crossings.extend(counter.update(detections, FRAME))
+    return crossings
+
+
+def test_segments_cross():
+    line = ((0.0, 0.0), (10.0, 0.0))
+    assert segments_cross((5, -1), (5, 1), *line)
+    assert not segments_cross((5, 1), (5, 2), *line)
+    # Passing beside the segment's end isn't a crossing
+    assert not segments_cross((11, -1), (11, 1), *line)
+    # Landing exactly on the line counts once: on the line is the positive side
+    assert segments_cross((5, -1), (5, 0), *line)
+    assert not segments_cross((5, 0), (5, 1), *line)
+
+
+def test_object_walking_over_the_line_counts_once():
+    counter = LineCrossingCounter(CAMERA)
+    frames = [[at("car", 300, y)] for y in (150, 170, 190, 210, 230)]
+    assert run(counter, frames) == [("gate", "car")]
+
+    # Going back over the same line doesn't count the same object again
+    assert run(counter, [[at("car", 300, y)] for y in (210, 190, 170)]) == []
+
+
+def test_each_object_is_counted():
+    counter = LineCrossingCounter(CAMERA)
+    frames = [[at("car", 200, y), at("person", 400, 260 - (y - 150)), at("car", 450, 100)]
+              for y in (150, 180, 210, 240)]
+    crossings = run(counter, frames)
+    assert sorted(crossings) == [("gate", "car"), ("gate", "person")]
+
+
+def test_labels_and_jumps_do_not_match_tracks():
+    counter = LineCrossingCounter(CAMERA, max_distance=50)
+    # Same place, different label on the other side: not the same object
+    assert run(counter, [[at("car", 300, 190)], [at("truck", 300, 210)]]) == []
+
+    counter = LineCrossingCounter(CAMERA, max_distance=50)
+    # Too far to be the same object between two analysed frames
+    assert run(counter, [[at("car", 300, 150)], [at("car", 300, 260)]]) == []
+
+
+def test_tracks_survive_a_few_missed_frames():
+    counter = LineCrossingCounter(CAMERA, max_missed=2)
+    assert run(counter, [[at("car", 300, 190)], [], [], [at("car", 300, 210)]]) == [("gate", "car")]
+
+    counter = LineCrossingCounter(CAMERA, max_missed=2)
+    assert run(counter, [[at("car", 300, 190)], [], [], [], [at("car", 300, 210)]]) == []
+
+
+def test_lines_follow_the_reference_size():
+    camera = dict(CAMERA, line_reference_size=[1280, 960])
+    counter = LineCrossingCounter(camera)
+    # At 640x480 the gate is at y=100 from x=50 to x=250
+    assert run(counter, [[at("car", 150, y)] for y in (90, 110)]) == [("gate", "car")]
+    assert run(counter, [[at("car", 400, y)] for y in (90, 110)]) == []
+
+
+def test_camera_without_lines_counts_nothing():
+    counter = LineCrossingCounter({})
+    assert run(counter, [[at("car", 300, y)] for y in (150, 250)]) == []
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
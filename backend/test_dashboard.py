@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test filter langganan dashboard (dashboard.py)
+
+    python test_dashboard.py   (atau: python -m pytest test_dashboard.py)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from bus import InProcessBus
+from dashboard import Dashboard, DashboardHub
+
+DEVICES = [
+    {"id": "cam0", "category": "Dalam Kota", "line_category": "Jalan Utama"},
+    {"id": "cam1", "category": "Dalam Kota", "line_category": "Jalan Lingkar"},
+    {"id": "cam2", "category": "Perbatasan Kota", "line_category": "Jalan Lingkar"},
+    {"id": "cam3", "category": "Perbatasan Provinsi", "line_category": "Tol"},
+]
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def send_text(self, text):
+        self.messages.append(json.loads(text))
+
+
+def run(scenario):
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"devices": DEVICES}, f)
+    try:
+        hub = DashboardHub(InProcessBus(), f.name)
+        hub._load_meta()
+        asyncio.run(scenario(hub))
+    finally:
+        os.remove(f.name)
+
+
+def summary(total):
+    return {"state": "live", "counters": {"car": total}, "total": total, "timestamp": 1.0}
+
+
+async def tick(hub):
+    hub.flush()
+    await asyncio.sleep(0)
+
+
+def test_camera_subscription_only_gets_its_cameras_groups():
+    async def scenario(hub):
+        for camera_id in ("cam0", "cam1", "cam2", "cam3"):
+            hub.apply(camera_id, summary(1))
+        websocket = FakeWebSocket()
+        hub.add(Dashboard(websocket, cameras=["cam0"]))
+
+        await tick(hub)
+        snapshot = websocket.messages[-1]
+        assert snapshot["type"] == "dashboard_snapshot"
+        assert set(snapshot["cameras"]) == {"cam0"}
+        assert set(snapshot["categories"]) == {"Dalam Kota"}
+        assert set(snapshot["line_categories"]) == {"Jalan Utama"}
+
+        # Changes elsewhere in the city don't wake it
+        hub.apply("cam2", summary(5))
+        hub.apply("cam3", summary(5))
+        await tick(hub)
+        assert len(websocket.messages) == 1
+
+        hub.apply("cam1", summary(3))  # same category as cam0
+        await tick(hub)
+        update = websocket.messages[-1]
+        assert update["type"] == "dashboard_update"
+        assert update["cameras"] == {}
+        assert update["categories"]["Dalam Kota"]["total"] == 4
+        assert update["line_categories"] == {}
+
+    run(scenario)
+
+
+def test_category_subscription_gets_only_that_category():
+    async def scenario(hub):
+        websocket = FakeWebSocket()
+        hub.add(Dashboard(websocket, categories=["Dalam Kota"]))
+        await tick(hub)
+
+        for camera_id in ("cam0", "cam1", "cam2", "cam3"):
+            hub.apply(camera_id, summary(2))
+        await tick(hub)
+        update = websocket.messages[-1]
+        assert set(update["cameras"]) == {"cam0", "cam1"}
+        assert update["categories"] == {"Dalam Kota": {"counters": {"car": 4}, "total": 4, "cameras": 2, "live": 2}}
+        # line_category groups are only sent when subscribed by name
+        assert update["line_categories"] == {}
+
+        count = len(websocket.messages)
+        hub.apply("cam3", summary(7))
+        await tick(hub)
+        assert len(websocket.messages) == count
+
+    run(scenario)
+
+
+def test_unfiltered_dashboard_gets_everything():
+    async def scenario(hub):
+        websocket = FakeWebSocket()
+        hub.add(Dashboard(websocket))
+        for camera_id in ("cam0", "cam3"):
+            hub.apply(camera_id, summary(1))
+        await tick(hub)
+        snapshot = websocket.messages[-1]
+        assert set(snapshot["cameras"]) == {"cam0", "cam3"}
+        assert set(snapshot["categories"]) == {"Dalam Kota", "Perbatasan Provinsi"}
+        assert set(snapshot["line_categories"]) == {"Jalan Utama", "Tol"}
+
+    run(scenario)
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
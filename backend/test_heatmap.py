@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test akumulasi heatmap per kamera (heatmap.py)
+
+    python test_heatmap.py   (atau: python -m pytest test_heatmap.py)
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+import heatmap as heatmap_module
+from heatmap import Heatmap, load_latest, snapshot_heatmaps
+from object_detection import DetectionResult
+
+FRAME = (360, 640, 3)
+
+
+def box(label, x, y, w=20.0, h=20.0):
+    return DetectionResult(label, 0.5, [x, y, w, h], 0, 0.0)
+
+
+def test_box_centres_land_in_their_cells():
+    heatmap = Heatmap(grid=(64, 36), max_classes=4, half_life=0)
+    # Centre (330, 190) on a 640x360 frame -> cell (33, 19) of 64x36
+    heatmap.add([box("car", 320, 180), box("car", 320, 180), box("person", 0, 0)], FRAME)
+
+    total = heatmap.snapshot()
+    assert total[19, 33] == 2
+    assert total[1, 1] == 1
+    assert total.sum() == 3
+    assert heatmap.snapshot("car")[19, 33] == 2
+    assert heatmap.snapshot("car").sum() == 2
+    assert heatmap.snapshot("person").sum() == 1
+    assert heatmap.snapshot("truck").sum() == 0
+    assert heatmap.frames == 1 and heatmap.detections == 3
+
+
+def test_centres_outside_the_frame_are_clipped_to_the_edge():
+    heatmap = Heatmap(grid=(8, 4), max_classes=1, half_life=0)
+    heatmap.add([box("car", 700, 400)], FRAME)
+    assert heatmap.snapshot()[3, 7] == 1
+
+
+def test_classes_past_max_classes_only_count_in_the_total():
+    heatmap = Heatmap(grid=(8, 4), max_classes=1, half_life=0)
+    heatmap.add([box("car", 10, 10), box("bus", 10, 10)], FRAME)
+
+    assert heatmap.layers == {"car": 1}
+    assert heatmap.snapshot().sum() == 2
+    assert heatmap.snapshot("bus").sum() == 0
+
+
+def test_empty_frames_are_counted_without_touching_the_grid():
+    heatmap = Heatmap(grid=(8, 4), max_classes=1, half_life=0)
+    heatmap.add([], FRAME)
+    assert heatmap.frames == 1
+    assert heatmap.snapshot().sum() == 0
+
+
+def test_half_life_decays_older_detections():
+    clock = [1000.0]
+    original = heatmap_module.time.monotonic
+    heatmap_module.time.monotonic = lambda: clock[0]
+    try:
+        heatmap = Heatmap(grid=(8, 4), max_classes=1, half_life=10.0)
+        heatmap.add([box("car", 10, 10)], FRAME)
+        clock[0] += 10.0
+        assert np.isclose(heatmap.snapshot().sum(), 0.5)
+        heatmap.add([box("car", 10, 10)], FRAME)
+        clock[0] += 10.0
+        assert np.isclose(heatmap.snapshot().sum(), 0.75)
+    finally:
+        heatmap_module.time.monotonic = original
+
+
+def test_snapshot_round_trip():
+    heatmap = Heatmap(grid=(8, 4), max_classes=2, half_life=0)
+    heatmap.add([box("car", 10, 10), box("person", 600, 300)], FRAME)
+
+    with tempfile.TemporaryDirectory() as directory:
+        assert len(snapshot_heatmaps({"cam/1": heatmap}, directory)) == 1
+        loaded = load_latest("cam/1", directory)
+        assert load_latest("missing", directory) is None
+
+    assert loaded.layers == heatmap.layers
+    assert np.array_equal(loaded.snapshot(), heatmap.snapshot())
+    assert np.array_equal(loaded.snapshot("person"), heatmap.snapshot("person"))
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test ring buffer riwayat deteksi (history.py)
+
+    python test_history.py   (atau: python -m pytest test_history.py)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from history import HISTORY_DTYPE, DetectionHistory
+from object_detection import DetectionResult
+
+
+def frame(*labels, x=0.0):
+    class_ids = {"person": 0, "car": 2, "truck": 7}
+    return [DetectionResult(label, 0.5, [x, 0.0, 10.0, 10.0], class_ids[label], 0.0) for label in labels]
+
+
+def test_overwrites_oldest_rows_at_capacity():
+    history = DetectionHistory(capacity=5)
+    for second in range(4):
+        history.append(frame("car", "person"), timestamp=float(second))
+
+    assert len(history) == 5
+    assert history.total == 8
+    assert history.nbytes == 5 * HISTORY_DTYPE.itemsize
+    # 8 rows went in, so the 3 oldest (second 0 and half of second 1) are gone
+    timestamps = [row["timestamp"] for row in history.between(0, 10)]
+    assert timestamps == [1.0, 2.0, 2.0, 3.0, 3.0]
+    assert history.describe()["oldest"] == 1.0
+
+
+def test_batch_larger_than_capacity_keeps_its_newest_rows():
+    history = DetectionHistory(capacity=3)
+    history.append(frame("car", "car", "person", "truck"), timestamp=1.0)
+
+    assert len(history) == 3
+    assert [row["label"] for row in history.between(0, 2)] == ["car", "person", "truck"]
+
+
+def test_empty_frames_count_but_store_nothing():
+    history = DetectionHistory(capacity=4)
+    history.append([], timestamp=1.0)
+    history.append(frame("car"), timestamp=2.0)
+
+    assert len(history) == 1
+    assert history.between(0, 5)[0]["timestamp"] == 2.0
+    assert history.counts_by_class() == {"car": 1}
+
+
+def test_window_queries():
+    history = DetectionHistory(capacity=100)
+    history.append(frame("car"), timestamp=10.0)
+    history.append(frame("car", "car", "person"), timestamp=20.0)
+    history.append(frame("person", "person"), timestamp=30.0)
+
+    assert history.counts_by_class() == {"person": 3, "car": 3}
+    assert history.counts_by_class(start=15, end=25) == {"person": 1, "car": 2}
+    assert history.counts_by_class(start=40) == {}
+
+    occupancy = history.max_occupancy()
+    assert occupancy["total"] == 3
+    assert occupancy["at"] == 20.0
+    assert occupancy["by_class"] == {"person": 2, "car": 2}
+    assert history.max_occupancy(start=40) == {"total": 0, "at": None, "by_class": {}}
+
+
+def test_between_is_oldest_first_after_wrapping():
+    history = DetectionHistory(capacity=4)
+    for second in range(6):
+        history.append(frame("car", x=float(second)), timestamp=float(second))
+
+    rows = history.between(0, 10)
+    assert [row["timestamp"] for row in rows] == [2.0, 3.0, 4.0, 5.0]
+    assert rows[0]["bbox"] == [2.0, 0.0, 10.0, 10.0]
+    assert [row["timestamp"] for row in history.between(0, 10, limit=2)] == [4.0, 5.0]
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test parser playlist HLS dan fetch upstream bersama (hls.py)
+
+    python test_hls.py   (atau: python -m pytest test_hls.py)
+"""
+
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from hls import HLSFetcher, Playlist
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+low/chunklist.m3u8
+#EXT-X-STREAM-INF:PROGRAM-ID=1,BANDWIDTH=2400000,RESOLUTION=1280x720
+high/chunklist.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:4
+#EXT-X-MEDIA-SEQUENCE:120
+
+#EXTINF:4.000,
+seg120.ts
+#EXTINF:4.000,
+/live/cam0/seg121.ts
+#EXTINF:3.5,
+https://cdn.example.com/cam0/seg122.ts
+"""
+
+
+def test_master_playlist_lists_variants():
+    playlist = Playlist(MASTER, "http://cctv.example.com/live/cam0/master.m3u8")
+    assert playlist.variants == [
+        (800000, "http://cctv.example.com/live/cam0/low/chunklist.m3u8"),
+        (2400000, "http://cctv.example.com/live/cam0/high/chunklist.m3u8"),
+    ]
+    assert playlist.segments == []
+
+
+def test_media_playlist_numbers_and_resolves_segments():
+    playlist = Playlist(MEDIA, "http://cctv.example.com/live/cam0/chunklist.m3u8")
+    assert playlist.target_duration == 4.0
+    assert playlist.segments == [
+        (120, "http://cctv.example.com/live/cam0/seg120.ts"),
+        (121, "http://cctv.example.com/live/cam0/seg121.ts"),
+        (122, "https://cdn.example.com/cam0/seg122.ts"),
+    ]
+    assert not playlist.ended and not playlist.encrypted and not playlist.fragmented
+    assert playlist.variants == []
+
+
+def test_media_playlist_flags():
+    text = MEDIA.replace("#EXT-X-MEDIA-SEQUENCE:120", "#EXT-X-MEDIA-SEQUENCE:7\n"
+                         '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"\n#EXT-X-MAP:URI="init.mp4"') + "#EXT-X-ENDLIST\n"
+    playlist = Playlist(text, "http://cctv.example.com/chunklist.m3u8")
+    assert playlist.encrypted and playlist.fragmented and playlist.ended
+    assert [sequence for sequence, _ in playlist.segments] == [7, 8, 9]
+
+    clear = Playlist(MEDIA.replace("#EXT-X-VERSION:3", "#EXT-X-KEY:METHOD=NONE"), "http://x/a.m3u8")
+    assert not clear.encrypted
+
+
+def test_uris_without_extinf_are_not_segments():
+    playlist = Playlist("#EXTM3U\n#EXT-X-TARGETDURATION:2\nstray.ts\n#EXTINF:2,\nseg0.ts\n", "http://x/a.m3u8")
+    assert playlist.segments == [(0, "http://x/seg0.ts")]
+
+
+def fetcher_with(handler, **options) -> HLSFetcher:
+    fetcher = HLSFetcher(**options)
+    fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return fetcher
+
+
+def test_concurrent_readers_share_one_upstream_fetch():
+    requests = []
+
+    async def handler(request):
+        requests.append(str(request.url))
+        await asyncio.sleep(0.05)
+        if request.url.path.endswith("master.m3u8"):
+            return httpx.Response(200, text=MASTER)
+        return httpx.Response(200, text=MEDIA)
+
+    async def scenario():
+        fetcher = fetcher_with(handler, playlist_ttl=1.0)
+        try:
+            playlists = await asyncio.gather(*(fetcher.media_playlist("http://cctv/live/master.m3u8")
+                                               for _ in range(20)))
+            assert {playlist.url for playlist in playlists} == {"http://cctv/live/high/chunklist.m3u8"}
+            # One master fetch and one variant fetch for all 20 readers, then cache hits
+            assert requests == ["http://cctv/live/master.m3u8", "http://cctv/live/high/chunklist.m3u8"]
+            await fetcher.fetch("http://cctv/live/master.m3u8")
+            assert len(requests) == 2
+            assert fetcher.get_stats()["shared_fetches"] == 38
+        finally:
+            await fetcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_a_reader_leaving_does_not_cancel_the_shared_fetch():
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=b"x" * 10)
+
+    async def scenario():
+        fetcher = fetcher_with(handler)
+        try:
+            leaving = asyncio.create_task(fetcher.fetch("http://cctv/seg1.ts"))
+            staying = asyncio.create_task(fetcher.fetch("http://cctv/seg1.ts"))
+            await asyncio.sleep(0.01)
+            leaving.cancel()
+            assert (await staying).content == b"x" * 10
+            assert fetcher.upstream == 1
+        finally:
+            await fetcher.close()
+
+    asyncio.run(scenario())
+
+
+def test_cache_is_bounded_and_errors_are_not_cached():
+    async def handler(request):
+        if request.url.path == "/missing.ts":
+            return httpx.Response(404)
+        return httpx.Response(200, content=b"s" * 400 * 1024)
+
+    async def scenario():
+        fetcher = fetcher_with(handler, cache_mb=1.0)
+        try:
+            for index in range(4):
+                await fetcher.fetch(f"http://cctv/seg{index}.ts")
+            stats = fetcher.get_stats()
+            assert stats["cached"] == 2 and stats["cached_bytes"] <= 1024 * 1024
+            # The oldest segments were evicted, the newest are served from the cache
+            await fetcher.fetch("http://cctv/seg3.ts")
+            assert fetcher.upstream == 4
+            await fetcher.fetch("http://cctv/seg0.ts")
+            assert fetcher.upstream == 5
+
+            assert (await fetcher.fetch("http://cctv/missing.ts")).status == 404
+            await fetcher.fetch("http://cctv/missing.ts")
+            assert fetcher.upstream == 7
+        finally:
+            await fetcher.close()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test cache hasil terbaru dan long-poll per kamera (latest.py)
+
+    python test_latest.py   (atau: python -m pytest test_latest.py)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+
+from latest import LatestResults
+
+
+def test_update_numbers_results_per_camera():
+    latest = LatestResults()
+    assert latest.get("cam0") is None
+    latest.update("cam0", '{"total_objects": 1}')
+    latest.update("cam0", '{"total_objects": 2}')
+    latest.update("cam1", '{"total_objects": 5}')
+
+    entry = latest.get("cam0")
+    assert entry.seq == 2
+    body = json.loads(entry.body("cam0"))
+    assert body["cctv_id"] == "cam0" and body["seq"] == 2
+    assert body["result"] == {"total_objects": 2}
+    assert latest.get("cam1").seq == 1
+    assert latest.etag(entry) == f'"{latest.epoch}-2"'
+    assert latest.get_stats()["updates"] == 3
+
+
+def test_newer_entry_is_returned_without_waiting():
+    async def scenario():
+        latest = LatestResults()
+        latest.update("cam0", "{}")
+        started = time.monotonic()
+        entry = await latest.wait_newer("cam0", since=0, timeout=5.0)
+        assert entry.seq == 1
+        assert time.monotonic() - started < 0.1
+        # A `since` from before a restart (ahead of us) is answered right away too
+        assert (await latest.wait_newer("cam0", since=42, timeout=5.0)).seq == 1
+
+    asyncio.run(scenario())
+
+
+def test_pollers_wake_on_the_next_update():
+    async def scenario():
+        latest = LatestResults()
+        latest.update("cam0", '{"n": 1}')
+        pollers = [asyncio.create_task(latest.wait_newer("cam0", since=1, timeout=5.0)) for _ in range(50)]
+        other = asyncio.create_task(latest.wait_newer("cam1", since=0, timeout=5.0))
+        await asyncio.sleep(0.01)
+        assert not any(poller.done() for poller in pollers)
+        assert latest.get_stats()["cameras_polled"] == 2
+
+        latest.update("cam0", '{"n": 2}')
+        entries = await asyncio.wait_for(asyncio.gather(*pollers), 1.0)
+        assert {entry.seq for entry in entries} == {2}
+        # All pollers share one Event, and updates to cam0 don't wake cam1's
+        assert not other.done()
+        other.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_poll_times_out_without_an_update():
+    async def scenario():
+        latest = LatestResults()
+        latest.update("cam0", "{}")
+        started = time.monotonic()
+        assert await latest.wait_newer("cam0", since=1, timeout=0.05) is None
+        assert 0.04 <= time.monotonic() - started < 1.0
+        assert await latest.wait_newer("missing", since=0, timeout=0) is None
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"  ✅ {name}")
+    print("\n✅ All tests passed!")
@@ -43,8 +43,12 @@ try:
         "GET /cctv",
         "GET /cctv/{cctv_id}",
         "GET /health",
+        "GET /health/ready",
+        "GET /metrics",
         "GET /debug/websocket",
-        "GET /proxy"
+        "GET /proxy",
+        "GET /detection/profiles",
+        "PUT /detection/profiles/{name}"
     ]
     
     expected_websocket = [